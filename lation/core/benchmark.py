@@ -0,0 +1,48 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def summarize_latencies(latencies:list, elapsed_seconds:float) -> dict:
+    sorted_latencies = sorted(latencies)
+
+    def percentile(p):
+        if not sorted_latencies:
+            return None
+        index = min(len(sorted_latencies) - 1, int(len(sorted_latencies) * p))
+        return sorted_latencies[index]
+
+    return {
+        'count': len(sorted_latencies),
+        'elapsed_seconds': elapsed_seconds,
+        'throughput_per_second': len(sorted_latencies) / elapsed_seconds if elapsed_seconds > 0 else None,
+        'mean_latency_ms': statistics.mean(sorted_latencies) * 1000 if sorted_latencies else None,
+        'p50_latency_ms': percentile(0.5) * 1000 if sorted_latencies else None,
+        'p95_latency_ms': percentile(0.95) * 1000 if sorted_latencies else None,
+        'p99_latency_ms': percentile(0.99) * 1000 if sorted_latencies else None,
+    }
+
+def measure(func, count:int, concurrency:int=1) -> dict:
+    """
+    Call `func(i)` for `count` times with `concurrency` threads, and summarize per call latencies
+    """
+    def timed_call(i):
+        start_time = time.perf_counter()
+        func(i)
+        return time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(timed_call, range(count)))
+    else:
+        latencies = [timed_call(i) for i in range(count)]
+    return summarize_latencies(latencies, time.perf_counter() - start_time)
+
+def format_summary(name:str, summary:dict) -> str:
+    return (f'{name}: {summary["count"]} calls in {summary["elapsed_seconds"]:.3f}s, '
+            f'{summary["throughput_per_second"]:.1f}/s, '
+            f'mean {summary["mean_latency_ms"]:.2f}ms, '
+            f'p50 {summary["p50_latency_ms"]:.2f}ms, '
+            f'p95 {summary["p95_latency_ms"]:.2f}ms, '
+            f'p99 {summary["p99_latency_ms"]:.2f}ms')
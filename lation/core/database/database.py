@@ -1,45 +1,122 @@
 import ast
 import csv
 import functools
+import json
 import os
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from threading import Lock
 
-from sqlalchemy import create_engine, inspect
+from sqlalchemy import create_engine, event, inspect
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.schema import CreateSchema, DropSchema, MetaData
 from sqlalchemy.types import JSON, Boolean
 
-from lation.core.env import get_env
+from lation.core.database.exporter import table_exporter_map
+from lation.core.env import get_bool_env, get_env, get_int_env
 from lation.core.logger import create_logger
+from lation.core.metrics import add_trace_seconds
 from lation.core.module import modules
+from lation.core.utils import chunk_list
 from lation.modules.base.file_system import FileSystem
 
 
 APP = get_env('APP')
 DEBUG_SQL = get_env('DEBUG_SQL')
+BULK_INSTALL_CHUNK_SIZE = 500
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_CHECKPOINT_FILENAME = 'export_checkpoint.json'
+
+DB_POOL_SIZE = get_int_env('DB_POOL_SIZE', 5)
+DB_MAX_OVERFLOW = get_int_env('DB_MAX_OVERFLOW', 10)
+DB_POOL_PRE_PING = get_bool_env('DB_POOL_PRE_PING', True)
+DB_POOL_RECYCLE = get_int_env('DB_POOL_RECYCLE', 1800)
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('cursor_execute_start_times', []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get('cursor_execute_start_times')
+    if start_times:
+        add_trace_seconds('db', time.perf_counter() - start_times.pop())
+
+def handle_cursor_error(exception_context):
+    conn = exception_context.connection
+    start_times = conn.info.get('cursor_execute_start_times') if conn is not None else None
+    if start_times:
+        add_trace_seconds('db', time.perf_counter() - start_times.pop())
 
 class Database():
 
+    # engines are shared by every Database instance of the process, keyed by url and pool options
+    engine_map = {}
+    engine_map_lock = Lock()
+
+    # reflected metadata of existing tables, keyed by url
+    existing_metadata_map = {}
+    existing_metadata_map_lock = Lock()
+
     @staticmethod
     def get_metadata():
         return MetaData(schema=APP)
 
+    @classmethod
+    def get_engine_options(cls, pool_size=None, max_overflow=None, pool_pre_ping=None, pool_recycle=None) -> dict:
+        return {
+            'pool_size': DB_POOL_SIZE if pool_size is None else pool_size,
+            'max_overflow': DB_MAX_OVERFLOW if max_overflow is None else max_overflow,
+            'pool_pre_ping': DB_POOL_PRE_PING if pool_pre_ping is None else pool_pre_ping,
+            'pool_recycle': DB_POOL_RECYCLE if pool_recycle is None else pool_recycle,
+            'echo': bool(DEBUG_SQL),
+        }
+
+    @classmethod
+    def build_engine(cls, url, **engine_options):
+        engine = create_engine(url, logging_name='lation.engine', **engine_options)
+        # time spent in queries is attributed to the trace of the running job, if any
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(engine, 'handle_error', handle_cursor_error)
+        return engine
+
+    @classmethod
+    def get_engine(cls, url, pool_size=None, max_overflow=None, pool_pre_ping=None, pool_recycle=None):
+        engine_options = cls.get_engine_options(pool_size=pool_size, max_overflow=max_overflow,
+                                                pool_pre_ping=pool_pre_ping, pool_recycle=pool_recycle)
+        engine_key = (str(url), tuple(sorted(engine_options.items())))
+        with cls.engine_map_lock:
+            engine = cls.engine_map.get(engine_key)
+            if not engine:
+                engine = cls.build_engine(url, **engine_options)
+                cls.engine_map[engine_key] = engine
+            return engine
+
+    @classmethod
+    def dispose_engines(cls):
+        with cls.engine_map_lock:
+            for engine in cls.engine_map.values():
+                engine.dispose()
+            cls.engine_map = {}
+
     def __init__(self, url=None,
                        dialect=None, driver=None, username=None, password=None, host=None, port=None, database=None,
-                       model_agnostic=False):
+                       model_agnostic=False,
+                       pool_size=None, max_overflow=None, pool_pre_ping=None, pool_recycle=None):
         from lation.core.orm import Base
         from lation.modules.base.models.lation_data import LationData
 
         if not url:
             url = f'{dialect}+{driver}://{username}:{password}@{host}:{port}/{database}'
         echo = bool(DEBUG_SQL)
-        self.engine = create_engine(url, pool_size=1, echo=echo, logging_name='lation.engine')
-        SessionFactory = sessionmaker(bind=self.engine, autoflush=False, autocommit=False)
-        self.Session = scoped_session(SessionFactory)
+        self.engine = Database.get_engine(url,
+                                          pool_size=pool_size,
+                                          max_overflow=max_overflow,
+                                          pool_pre_ping=pool_pre_ping,
+                                          pool_recycle=pool_recycle)
+        self.SessionFactory = sessionmaker(bind=self.engine, autoflush=False, autocommit=False)
+        self.Session = scoped_session(self.SessionFactory)
         self.model_agnostic = model_agnostic
-        existing_metadata = Database.get_metadata()
-        existing_metadata.reflect(bind=self.engine, schema=APP)
-        self.existing_metadata = existing_metadata
         self.metadata = Base.metadata
         self.fs = FileSystem()
         if not echo:
@@ -48,6 +125,25 @@ class Database():
         self.Base = Base
         self.LationData = LationData
         self.lation_id_map = {}
+        self.lation_id_map_lock = Lock()
+
+    # reflect lazily since only schema-altering commands need it
+    @property
+    def existing_metadata(self):
+        cls = self.__class__
+        metadata_key = str(self.engine.url)
+        with cls.existing_metadata_map_lock:
+            existing_metadata = cls.existing_metadata_map.get(metadata_key)
+            if existing_metadata is None:
+                existing_metadata = Database.get_metadata()
+                existing_metadata.reflect(bind=self.engine, schema=APP)
+                cls.existing_metadata_map[metadata_key] = existing_metadata
+            return existing_metadata
+
+    def invalidate_existing_metadata(self):
+        cls = self.__class__
+        with cls.existing_metadata_map_lock:
+            cls.existing_metadata_map.pop(str(self.engine.url), None)
 
     def get_session(self):
         try:
@@ -56,6 +152,10 @@ class Database():
         finally:
             session.close()
 
+    # session not bound to the current thread, for callers that hop across threads (e.g. coroutines)
+    def create_session(self):
+        return self.SessionFactory()
+
     @functools.lru_cache()
     def find_tablename_by_file_path(self, file_path):
         filename = os.path.basename(file_path)
@@ -82,20 +182,83 @@ class Database():
     def is_boolean_attribute(self, attribute):
         return isinstance(attribute.columns[0].type, Boolean)
 
-    def export(self, dir_path):
+    # engine with one connection per worker, for jobs running on several threads,
+    # it is private to the caller and kept out of `engine_map`, so the caller disposes it without affecting other users of the url
+    def get_pooled_engine(self, pool_size):
+        return Database.build_engine(self.engine.url, **Database.get_engine_options(pool_size=pool_size, max_overflow=0))
+
+    def export_table(self, engine, table, dir_path, format='csv', chunk_size=EXPORT_CHUNK_SIZE):
+        TableExporter = table_exporter_map[format]
+        file_path = os.path.join(dir_path, f'{table.name}.{TableExporter.extension}')
+        partial_file_path = f'{file_path}.partial'
+        row_count = 0
+        start_time = time.time()
+        self.logger.info(f'EXPORT TABLE `{table.name}`...')
+        with engine.connect() as connection:
+            # server-side cursor, see <https://docs.sqlalchemy.org/en/13/core/connections.html#sqlalchemy.engine.Connection.execution_options.params.stream_results>
+            rows = connection.execution_options(stream_results=True)\
+                .execute(table.select().order_by(*table.primary_key.columns))
+            with TableExporter(table, partial_file_path) as exporter:
+                while True:
+                    chunk = rows.fetchmany(chunk_size)
+                    if not chunk:
+                        break
+                    exporter.write_rows(chunk)
+                    row_count += len(chunk)
+        os.replace(partial_file_path, file_path)
+        self.logger.info(f'EXPORT TABLE `{table.name}` DONE WITH {row_count} ROWS IN {time.time() - start_time}s')
+        return row_count
+
+    def read_export_checkpoint(self, checkpoint_file_path):
+        if not os.path.exists(checkpoint_file_path):
+            return {}
+        with open(checkpoint_file_path, encoding='utf-8') as checkpoint_file:
+            return json.load(checkpoint_file)
+
+    def write_export_checkpoint(self, checkpoint_file_path, checkpoint):
+        partial_checkpoint_file_path = f'{checkpoint_file_path}.partial'
+        with open(partial_checkpoint_file_path, 'w', encoding='utf-8') as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file, indent=2)
+        os.replace(partial_checkpoint_file_path, checkpoint_file_path)
+
+    def export(self, dir_path, format='csv', workers=1, chunk_size=EXPORT_CHUNK_SIZE, resume=False):
+        if format not in table_exporter_map:
+            raise Exception(f'Export format `{format}` is not supported')
         self.fs.create_directory(self.fs.deserialize_name(dir_path))
+        checkpoint_file_path = os.path.join(dir_path, EXPORT_CHECKPOINT_FILENAME)
+        checkpoint = self.read_export_checkpoint(checkpoint_file_path) if resume else {}
+        checkpoint_lock = Lock()
+
+        tables = []
         for table in self.metadata.sorted_tables:
-            self.logger.info(f'EXPORT TABLE `{table.name}`...')
-            file_path = os.path.join(dir_path, f'{table.name}.csv')
-            with open(file_path, 'w', newline='', encoding='utf-8') as csv_file:
-                column_names = [column.name for column in table.columns]
-                writer = csv.DictWriter(csv_file, fieldnames=column_names)
-                writer.writeheader()
-                rows = self.engine.execute(table.select())
-                for row in rows:
-                    row_dict = dict(row)
-                    writer.writerow(row_dict)
-            self.logger.info(f'EXPORT TABLE `{table.name}` DONE')
+            table_checkpoint = checkpoint.get(table.name)
+            if table_checkpoint and table_checkpoint['format'] == format:
+                self.logger.info(f'EXPORT TABLE `{table.name}` SKIPPED BY CHECKPOINT')
+                continue
+            tables.append(table)
+
+        def export_and_checkpoint(engine, table):
+            row_count = self.export_table(engine, table, dir_path, format=format, chunk_size=chunk_size)
+            with checkpoint_lock:
+                checkpoint[table.name] = {
+                    'format': format,
+                    'row_count': row_count,
+                    'finish_time': datetime.utcnow().isoformat(),
+                }
+                self.write_export_checkpoint(checkpoint_file_path, checkpoint)
+
+        if workers > 1:
+            engine = self.get_pooled_engine(workers)
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = [executor.submit(export_and_checkpoint, engine, table) for table in tables]
+                    for future in futures:
+                        future.result()
+            finally:
+                engine.dispose()
+        else:
+            for table in tables:
+                export_and_checkpoint(self.engine, table)
 
     def drop_schema(self, schema_name):
         self.engine.execute(DropSchema(schema_name))
@@ -107,6 +270,7 @@ class Database():
 
     def drop_tables(self):
         self.existing_metadata.drop_all(self.engine)
+        self.invalidate_existing_metadata()
         self.logger.info('DELETE ALL TABLES')
 
     # drop tables one by one
@@ -116,152 +280,331 @@ class Database():
 
     def create_tables(self):
         self.metadata.create_all(self.engine)
+        self.invalidate_existing_metadata()
         self.logger.info(f'ALL TABLES CREATED')
 
     def dispose(self):
         self.engine.dispose()
 
-    def install_data(self, module_name):
+    def resolve_csv_data(self, module_name, csv_file_path, csv_data, json_type_attribute_names, boolean_type_attribute_names):
+        attribute_data = {}
+
+        # resolve lation_id
+        lation_id = csv_data.get('lation_id')
+        if not lation_id:
+            raise Exception(f'Attribute `lation_id` is required for csv file `{csv_file_path}`')
+        lation_id_parts = lation_id.split('.')
+        if len(lation_id_parts) < 2 or lation_id_parts[0] != module_name:
+            lation_id = f'{module_name}.{lation_id}'
+            attribute_data['lation_id'] = lation_id
+            del csv_data['lation_id']
+
+        for attribute_name in csv_data.keys():
+            csv_value = csv_data[attribute_name]
+            attribute_name_parts = attribute_name.split('/')
+            if csv_value == '':
+                continue
+
+            # resolve primitive data type
+            if len(attribute_name_parts) == 1:
+                if attribute_name in json_type_attribute_names:
+                    attribute_data[attribute_name] = ast.literal_eval(csv_value)
+                elif attribute_name in boolean_type_attribute_names:
+                    attribute_data[attribute_name] = (csv_value.lower() == 'true')
+                else:
+                    attribute_data[attribute_name] = csv_value
+
+            # resolve foreign key
+            elif len(attribute_name_parts) == 2 and attribute_name_parts[1] == 'fk':
+                foreign_lation_id_parts = csv_value.split('.')
+                if len(foreign_lation_id_parts) < 2:
+                    foreign_lation_id = f'{module_name}.{csv_value}'
+                elif len(foreign_lation_id_parts) == 2:
+                    foreign_lation_id = csv_value
+                elif len(foreign_lation_id_parts) > 2:
+                    raise NotImplementedError
+                # foreign_instance = session.query(model_class).filter(model_class.lation_id == foreign_lation_id).one_or_none()
+                foreign_instance_id = self.lation_id_map.get(foreign_lation_id)
+                if not foreign_instance_id:
+                    raise Exception(f'Foreign lation_id `{foreign_lation_id}` not found')
+                attribute_data[attribute_name_parts[0]] = foreign_instance_id
+
+            else:
+                raise NotImplementedError
+
+        return lation_id, attribute_data
+
+    def read_csv_file(self, module_name, csv_file_path, model_class):
         from lation.core.orm import SingleTableInheritanceMixin
 
+        is_single_table_inherited = SingleTableInheritanceMixin in model_class.mro()
+        inspector = inspect(model_class)
+        json_type_attribute_names = [attr.key for attr in inspector.mapper.column_attrs if self.is_json_attribute(attr)]
+        boolean_type_attribute_names = [attr.key for attr in inspector.mapper.column_attrs if self.is_boolean_attribute(attr)]
+
+        with open(csv_file_path, newline='', encoding='utf-8') as csv_file:
+            reader = csv.DictReader(csv_file)
+            for csv_data in reader:
+                lation_id, attribute_data = self.resolve_csv_data(module_name, csv_file_path, csv_data,
+                                                                  json_type_attribute_names, boolean_type_attribute_names)
+
+                # correct model_class for single table inheritence
+                if is_single_table_inherited:
+                    polymorphic_identity = attribute_data.get(inspector.polymorphic_on.key)
+                    row_model_class = inspector.polymorphic_map.get(polymorphic_identity).class_manager.class_
+                else:
+                    row_model_class = model_class
+
+                yield row_model_class, lation_id, attribute_data
+
+    def upsert_table_data(self, session, module_name, csv_file_path, model_class):
+        current_table_lation_id_map = {}
+        current_table_lation_id_unflushed_instance_map = {}
+        inserted_count, updated_count = 0, 0
+
+        for row_model_class, lation_id, attribute_data in self.read_csv_file(module_name, csv_file_path, model_class):
+            instance = session.query(row_model_class).filter(row_model_class.lation_id == lation_id).one_or_none()
+            if instance:
+                for attribute_name in attribute_data:
+                    setattr(instance, attribute_name, attribute_data[attribute_name])
+                current_table_lation_id_map[lation_id] = instance.id
+                updated_count += 1
+            else:
+                instance = row_model_class(**attribute_data)
+                session.add(instance)
+                current_table_lation_id_unflushed_instance_map[lation_id] = instance
+                inserted_count += 1
+
+        # flush to get instance ids
+        session.flush()
+
+        # refresh id
+        for lation_id in current_table_lation_id_unflushed_instance_map:
+            instance = current_table_lation_id_unflushed_instance_map[lation_id]
+            current_table_lation_id_map[lation_id] = instance.id
+
+        return current_table_lation_id_map, inserted_count, updated_count
+
+    # prefetch existing ids in one query, then insert and update in batches
+    def bulk_upsert_table_data(self, session, module_name, csv_file_path, model_class):
+        rows = list(self.read_csv_file(module_name, csv_file_path, model_class))
+        if len(rows) == 0:
+            return {}, 0, 0
+
+        base_model_class = inspect(model_class).mapper.base_mapper.class_
+        lation_ids = [lation_id for _, lation_id, _ in rows]
+        current_table_lation_id_map = {}
+        for lation_id_chunk in chunk_list(lation_ids, BULK_INSTALL_CHUNK_SIZE):
+            existing_rows = session.query(base_model_class.lation_id, base_model_class.id)\
+                .filter(base_model_class.lation_id.in_(lation_id_chunk))\
+                .all()
+            current_table_lation_id_map.update({lation_id: id for lation_id, id in existing_rows})
+
+        insert_mappings_map, update_mappings_map = {}, {}
+        for row_model_class, lation_id, attribute_data in rows:
+            existing_id = current_table_lation_id_map.get(lation_id)
+            if existing_id:
+                update_mappings_map.setdefault(row_model_class, []).append({**attribute_data, 'id': existing_id})
+            else:
+                insert_mappings_map.setdefault(row_model_class, []).append(attribute_data)
+
+        for row_model_class, mappings in update_mappings_map.items():
+            session.bulk_update_mappings(row_model_class, mappings)
+
+        for row_model_class, mappings in insert_mappings_map.items():
+            mapper = inspect(row_model_class)
+            if session.bind.dialect.name == 'postgresql' and len(mapper.tables) == 1:
+                # `INSERT ... VALUES (...), (...) RETURNING` requires identical keys across rows of one statement
+                table = mapper.local_table
+                key_group_map = {}
+                for mapping in mappings:
+                    key_group_map.setdefault(tuple(sorted(mapping.keys())), []).append(mapping)
+                for grouped_mappings in key_group_map.values():
+                    for mapping_chunk in chunk_list(grouped_mappings, BULK_INSTALL_CHUNK_SIZE):
+                        result = session.execute(table.insert().values(mapping_chunk).returning(table.c.lation_id, table.c.id))
+                        current_table_lation_id_map.update({lation_id: id for lation_id, id in result})
+            else:
+                session.bulk_insert_mappings(row_model_class, mappings, return_defaults=True)
+                current_table_lation_id_map.update({mapping['lation_id']: mapping['id'] for mapping in mappings})
+
+        inserted_count = sum(len(mappings) for mappings in insert_mappings_map.values())
+        updated_count = sum(len(mappings) for mappings in update_mappings_map.values())
+        return current_table_lation_id_map, inserted_count, updated_count
+
+    def install_table_data(self, session, module_name, partial_csv_file_path, bulk=False):
+        table_start_time = time.time()
+        csv_file_path = os.path.join('lation', 'modules', module_name, partial_csv_file_path)
+        tablename = self.find_tablename_by_file_path(csv_file_path)
+        model_class = self.find_model_class_by_tablename(tablename)
+        if not model_class:
+            raise Exception(f'Table `{tablename}` does not exist')
+        inspector = inspect(model_class)
+        self.logger.info(f'[{module_name}] INTO TABLE `{tablename}` FROM PATH `{csv_file_path}`')
+
+        if bulk:
+            current_table_lation_id_map, inserted_count, updated_count = self.bulk_upsert_table_data(session, module_name, csv_file_path, model_class)
+        else:
+            current_table_lation_id_map, inserted_count, updated_count = self.upsert_table_data(session, module_name, csv_file_path, model_class)
+
+        with self.lation_id_map_lock:
+            self.lation_id_map.update(current_table_lation_id_map)
+
+        # rebalance lation data
+        LationData = self.LationData
+        lation_data = session.query(LationData).filter(LationData.model == tablename).all()
+        deleted_ids = []
+        for ld in lation_data:
+            if not self.lation_id_map.get(ld.model_lation_id):
+                deleted_ids.append(ld.model_id)
+        if len(deleted_ids) > 0:
+            self.logger.info(f'[{module_name}] DELETE IDs {deleted_ids} FROM TABLE `{tablename}`...')
+            instances = session.query(model_class).filter(model_class.id.in_(deleted_ids)).all()
+            for instance in instances:
+                session.delete(instance)
+
+        session.query(LationData).filter(LationData.model == tablename).delete()
+        lation_data_mappings = [{
+            'model': tablename,
+            'model_lation_id': current_table_lation_id,
+            'model_id': current_table_lation_id_map[current_table_lation_id],
+        } for current_table_lation_id in current_table_lation_id_map]
+        if bulk:
+            session.bulk_insert_mappings(LationData, lation_data_mappings)
+        else:
+            for lation_data_mapping in lation_data_mappings:
+                session.add(LationData(**lation_data_mapping))
+
+        # fix postgres sequence, see <https://stackoverflow.com/a/37972960/2443984>
+        if session.bind.dialect.name == 'postgresql':
+            for table in inspector.tables:
+                session.execute(f'SELECT setval(pg_get_serial_sequence(\'{table.fullname}\', \'id\'), coalesce(max(id)+1, 1), false) FROM {table.fullname};')
+
+        session.flush()
+        self.logger.info(f'[{module_name}] FLUSHED')
+        self.logger.info(f'[{module_name}] TABLE `{tablename}` INSERTED {inserted_count}, UPDATED {updated_count}, DELETED {len(deleted_ids)} ROWS IN {time.time() - table_start_time}s')
+
+    # parent modules come before their children, and shared parents appear only once
+    def get_module_install_order(self, module_name, module_names=None):
+        if module_names is None:
+            module_names = []
         for parent_module in modules[module_name].parent_modules:
-            self.install_data(parent_module.name)
+            self.get_module_install_order(parent_module.name, module_names)
+        if module_name not in module_names:
+            module_names.append(module_name)
+        return module_names
+
+    def get_ancestor_module_names(self, module_name):
+        ancestor_module_names = set()
+        for parent_module in modules[module_name].parent_modules:
+            ancestor_module_names.add(parent_module.name)
+            ancestor_module_names.update(self.get_ancestor_module_names(parent_module.name))
+        return ancestor_module_names
+
+    def get_referred_tablenames(self, tablename):
+        model_class = self.find_model_class_by_tablename(tablename)
+        referred_tablenames = set()
+        for table in inspect(model_class).tables:
+            for foreign_key in table.foreign_keys:
+                referred_tablenames.add(foreign_key.column.table.name)
+        referred_tablenames.discard(tablename)
+        return referred_tablenames
+
+    def plan_data_installation(self, module_name):
+        """
+        Returns (module_name, partial_csv_file_path, tablename, dependency_indexes) tuples.
+        A table depends on the tables it refers to in the same or ancestor modules,
+        and on earlier installations of the same table.
+        """
+        plan = []
+        for current_module_name in self.get_module_install_order(module_name):
+            visible_module_names = self.get_ancestor_module_names(current_module_name) | {current_module_name}
+            partial_csv_file_paths = modules[current_module_name].config.data
+            for partial_csv_file_path in partial_csv_file_paths:
+                csv_file_path = os.path.join('lation', 'modules', current_module_name, partial_csv_file_path)
+                tablename = self.find_tablename_by_file_path(csv_file_path)
+                if not self.find_model_class_by_tablename(tablename):
+                    raise Exception(f'Table `{tablename}` does not exist')
+                referred_tablenames = self.get_referred_tablenames(tablename)
+                dependency_indexes = set()
+                for i, (planned_module_name, _, planned_tablename, _) in enumerate(plan):
+                    if planned_tablename == tablename:
+                        dependency_indexes.add(i)
+                    elif planned_tablename in referred_tablenames and planned_module_name in visible_module_names:
+                        dependency_indexes.add(i)
+                plan.append((current_module_name, partial_csv_file_path, tablename, dependency_indexes))
+        return plan
+
+    def install_module_data(self, module_name, bulk=False):
         start_time = time.time()
         partial_csv_file_paths = modules[module_name].config.data
         if len(partial_csv_file_paths) == 0:
             self.logger.info(f'[{module_name}] NO DATA, SKIPPED')
             return
-        self.logger.info(f'[{module_name}] INSTALL DATA...')
+        self.logger.info(f'[{module_name}] INSTALL DATA{" IN BULK MODE" if bulk else ""}...')
         session = self.get_session()
 
         for partial_csv_file_path in partial_csv_file_paths:
-            current_table_lation_id_map = {}
-            current_table_lation_id_unflushed_instance_map = {}
-
-            csv_file_path = os.path.join('lation', 'modules', module_name, partial_csv_file_path)
-            tablename = self.find_tablename_by_file_path(csv_file_path)
-            model_class = self.find_model_class_by_tablename(tablename)
-            if not model_class:
-                raise Exception(f'Table `{tablename}` does not exist')
-            is_single_table_inherited = SingleTableInheritanceMixin in model_class.mro()
-            inspector = inspect(model_class)
-            json_type_attribute_names = [attr.key for attr in inspector.mapper.column_attrs if self.is_json_attribute(attr)]
-            boolean_type_attribute_names = [attr.key for attr in inspector.mapper.column_attrs if self.is_boolean_attribute(attr)]
-            self.logger.info(f'[{module_name}] INTO TABLE `{tablename}` FROM PATH `{csv_file_path}`')
-
-            with open(csv_file_path, newline='', encoding='utf-8') as csv_file:
-                reader = csv.DictReader(csv_file)
-                for csv_data in reader:
-                    attribute_data = {}
-
-                    # resolve lation_id
-                    lation_id = csv_data.get('lation_id')
-                    if not lation_id:
-                        raise Exception(f'Attribute `lation_id` is required for csv file `{csv_file_path}`')
-                    lation_id_parts = lation_id.split('.')
-                    if len(lation_id_parts) < 2 or lation_id_parts[0] != module_name:
-                        lation_id = f'{module_name}.{lation_id}'
-                        attribute_data['lation_id'] = lation_id
-                        del csv_data['lation_id']
-
-                    for attribute_name in csv_data.keys():
-                        csv_value = csv_data[attribute_name]
-                        attribute_name_parts = attribute_name.split('/')
-                        if csv_value == '':
-                            continue
-
-                        # resolve primitive data type
-                        if len(attribute_name_parts) == 1:
-                            if attribute_name in json_type_attribute_names:
-                                attribute_data[attribute_name] = ast.literal_eval(csv_value)
-                            elif attribute_name in boolean_type_attribute_names:
-                                attribute_data[attribute_name] = (csv_value.lower() == 'true')
-                            else:
-                                attribute_data[attribute_name] = csv_value
-
-                        # resolve foreign key
-                        elif len(attribute_name_parts) == 2 and attribute_name_parts[1] == 'fk':
-                            foreign_lation_id_parts = csv_value.split('.')
-                            if len(foreign_lation_id_parts) < 2:
-                                foreign_lation_id = f'{module_name}.{csv_value}'
-                            elif len(foreign_lation_id_parts) == 2:
-                                foreign_lation_id = csv_value
-                            elif len(foreign_lation_id_parts) > 2:
-                                raise NotImplementedError
-                            # foreign_instance = session.query(model_class).filter(model_class.lation_id == foreign_lation_id).one_or_none()
-                            foreign_instance_id = self.lation_id_map[foreign_lation_id]
-                            if not foreign_instance_id:
-                                raise Exception(f'Foreign lation_id `{foreign_lation_id}` not found')
-                            attribute_data[attribute_name_parts[0]] = foreign_instance_id
-
-                        else:
-                            raise NotImplementedError
-
-                    # correct model_class for single table inheritence
-                    if is_single_table_inherited:
-                        polymorphic_identity = attribute_data.get(inspector.polymorphic_on.key)
-                        model_class = inspector.polymorphic_map.get(polymorphic_identity).class_manager.class_
-
-                    # upsert instance
-                    instance = session.query(model_class).filter(model_class.lation_id == lation_id).one_or_none()
-                    if instance:
-                        for attribute_name in attribute_data:
-                            setattr(instance, attribute_name, attribute_data[attribute_name])
-                        current_table_lation_id_map[lation_id] = instance.id
-                        # self.lation_id_map[lation_id] = instance.id
-                    else:
-                        instance = model_class(**attribute_data)
-                        session.add(instance)
-                        current_table_lation_id_unflushed_instance_map[lation_id] = instance
-
-            # flush to get instance ids
-            session.flush()
-
-            # refresh id
-            for lation_id in current_table_lation_id_unflushed_instance_map:
-                instance = current_table_lation_id_unflushed_instance_map[lation_id]
-                # self.lation_id_map[lation_id] = instance.id
-                current_table_lation_id_map[lation_id] = instance.id
-
-            self.lation_id_map.update(current_table_lation_id_map)
-
-            # rebalance lation data
-            LationData = self.LationData
-            lation_data = session.query(LationData).filter(LationData.model == tablename).all()
-            deleted_ids = []
-            for ld in lation_data:
-                if not self.lation_id_map.get(ld.model_lation_id):
-                    deleted_ids.append(ld.model_id)
-            if len(deleted_ids) > 0:
-                self.logger.info(f'[{module_name}] DELETE IDs {deleted_ids} FROM TABLE `{tablename}`...')
-                instances = session.query(model_class).filter(model_class.id.in_(deleted_ids)).all()
-                for instance in instances:
-                    session.delete(instance)
-
-            session.query(LationData).filter(LationData.model == tablename).delete()
-            for current_table_lation_id in current_table_lation_id_map:
-                lation_data = LationData(model=tablename,
-                                         model_lation_id=current_table_lation_id,
-                                         model_id=current_table_lation_id_map[current_table_lation_id])
-                session.add(lation_data)
-
-            # fix postgres sequence, see <https://stackoverflow.com/a/37972960/2443984>
-            if session.bind.dialect.name == 'postgresql':
-                for table in inspector.tables:
-                    session.execute(f'SELECT setval(pg_get_serial_sequence(\'{table.fullname}\', \'id\'), coalesce(max(id)+1, 1), false) FROM {table.fullname};')
-
-            session.flush()
-            self.logger.info(f'[{module_name}] FLUSHED')
+            self.install_table_data(session, module_name, partial_csv_file_path, bulk=bulk)
 
         self.logger.info(f'[{module_name}] COMMIT...')
         session.commit()
         self.logger.info(f'[{module_name}] COMMITTED')
         self.logger.info(f'[{module_name}] INSTALL DATA DONE IN {time.time() - start_time}s')
 
-    def reset(self):
+    # each table is committed on its own connection so that dependent tables on other connections can see its rows
+    def install_data_concurrently(self, module_name, bulk=False, workers=2):
+        start_time = time.time()
+        plan = self.plan_data_installation(module_name)
+        sorted_tablenames = [table.name for table in self.metadata.sorted_tables]
+        self.logger.info(f'[{module_name}] INSTALL DATA OF {len(plan)} TABLES WITH {workers} WORKERS{" IN BULK MODE" if bulk else ""}...')
+        engine = self.get_pooled_engine(workers)
+        SessionFactory = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+        def install_step(step_module_name, partial_csv_file_path):
+            session = SessionFactory()
+            try:
+                self.install_table_data(session, step_module_name, partial_csv_file_path, bulk=bulk)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.close()
+
+        pending_indexes = [i for i, _ in enumerate(plan)]
+        done_indexes = set()
+        running_future_map = {}
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                while pending_indexes or running_future_map:
+                    ready_indexes = [i for i in pending_indexes if plan[i][3].issubset(done_indexes)]
+                    ready_indexes.sort(key=lambda i: sorted_tablenames.index(plan[i][2]))
+                    for i in ready_indexes:
+                        step_module_name, partial_csv_file_path, _, _ = plan[i]
+                        running_future_map[executor.submit(install_step, step_module_name, partial_csv_file_path)] = i
+                        pending_indexes.remove(i)
+                    if not running_future_map:
+                        raise Exception(f'Cyclic data dependency detected among {[plan[i][2] for i in pending_indexes]}')
+                    done_futures, _ = wait(running_future_map.keys(), return_when=FIRST_COMPLETED)
+                    for future in done_futures:
+                        i = running_future_map.pop(future)
+                        future.result()
+                        done_indexes.add(i)
+        finally:
+            engine.dispose()
+        self.logger.info(f'[{module_name}] INSTALL DATA DONE IN {time.time() - start_time}s')
+
+    def install_data(self, module_name, bulk=False, workers=1):
+        if workers > 1:
+            self.install_data_concurrently(module_name, bulk=bulk, workers=workers)
+            return
+        for install_module_name in self.get_module_install_order(module_name):
+            self.install_module_data(install_module_name, bulk=bulk)
+
+    def reset(self, bulk=False, workers=1):
         if self.engine.dialect.has_schema(self.engine, schema=APP):
             self.drop_tables()
             self.drop_schema(APP)
         self.create_schema(APP)
         self.create_tables()
-        self.install_data(APP)
+        self.install_data(APP, bulk=bulk, workers=workers)
@@ -0,0 +1,113 @@
+import csv
+import gzip
+import json
+
+from sqlalchemy.types import JSON, Boolean, DateTime, Float, Integer, Numeric
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class TableExporter():
+    extension = None
+
+    def __init__(self, table, file_path):
+        self.table = table
+        self.file_path = file_path
+        self.column_names = [column.name for column in table.columns]
+
+    def open(self):
+        raise NotImplementedError
+
+    def write_rows(self, rows):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CsvTableExporter(TableExporter):
+    extension = 'csv'
+
+    def open_file(self):
+        return open(self.file_path, 'w', newline='', encoding='utf-8')
+
+    def open(self):
+        self.file = self.open_file()
+        self.writer = csv.DictWriter(self.file, fieldnames=self.column_names)
+        self.writer.writeheader()
+
+    def write_rows(self, rows):
+        self.writer.writerows(dict(row) for row in rows)
+
+    def close(self):
+        self.file.close()
+
+
+class GzipCsvTableExporter(CsvTableExporter):
+    extension = 'csv.gz'
+
+    def open_file(self):
+        return gzip.open(self.file_path, 'wt', newline='', encoding='utf-8')
+
+
+class ParquetTableExporter(TableExporter):
+    extension = 'parquet'
+
+    @staticmethod
+    def to_arrow_type(column):
+        if isinstance(column.type, Boolean):
+            return pyarrow.bool_()
+        elif isinstance(column.type, Integer):
+            return pyarrow.int64()
+        elif isinstance(column.type, (Float, Numeric)):
+            return pyarrow.float64()
+        elif isinstance(column.type, DateTime):
+            return pyarrow.timestamp('us')
+        else:
+            return pyarrow.string()
+
+    @staticmethod
+    def to_arrow_value(column, value):
+        if value is None:
+            return None
+        if isinstance(column.type, JSON):
+            return json.dumps(value)
+        elif isinstance(column.type, (Float, Numeric)):
+            return float(value)
+        elif isinstance(column.type, (Boolean, Integer, DateTime)):
+            return value
+        return str(value)
+
+    def open(self):
+        if not pyarrow:
+            raise Exception('Package `pyarrow` is required to export tables in parquet format')
+        self.schema = pyarrow.schema([(column.name, ParquetTableExporter.to_arrow_type(column)) for column in self.table.columns])
+        self.writer = pyarrow.parquet.ParquetWriter(self.file_path, self.schema)
+
+    def write_rows(self, rows):
+        arrays = [
+            pyarrow.array([ParquetTableExporter.to_arrow_value(column, row[column.name]) for row in rows], type=field.type)
+            for column, field in zip(self.table.columns, self.schema)
+        ]
+        self.writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+table_exporter_map = {
+    'csv': CsvTableExporter,
+    'csv.gz': GzipCsvTableExporter,
+    'parquet': ParquetTableExporter,
+}
@@ -0,0 +1,43 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from lation.core.database.database import DB_MAX_OVERFLOW, DB_POOL_SIZE
+
+
+class SessionExecutor():
+    """
+    Runs blocking session calls on a thread pool so that coroutines never wait on a database round trip.
+    The pool is as large as the connection pool, so threads don't queue for connections.
+    A session is not thread-safe, so calls on the same executor must be awaited one after another.
+    """
+
+    thread_pool = ThreadPoolExecutor(max_workers=DB_POOL_SIZE + DB_MAX_OVERFLOW, thread_name_prefix='lation-session')
+
+    def __init__(self, session):
+        self.session = session
+
+    async def run_sync(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(SessionExecutor.thread_pool, functools.partial(func, self.session, *args, **kwargs))
+
+    async def execute(self, *args, **kwargs):
+        return await self.run_sync(lambda session: session.execute(*args, **kwargs))
+
+    async def get(self, model_class, primary_key_value):
+        return await self.run_sync(lambda session: session.query(model_class).get(primary_key_value))
+
+    async def flush(self):
+        return await self.run_sync(lambda session: session.flush())
+
+    async def commit(self):
+        return await self.run_sync(lambda session: session.commit())
+
+    async def rollback(self):
+        return await self.run_sync(lambda session: session.rollback())
+
+    async def close(self):
+        return await self.run_sync(lambda session: session.close())
+
+    def add(self, instance):
+        self.session.add(instance)
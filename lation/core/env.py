@@ -4,6 +4,18 @@ import os
 def get_env(name:str) -> str:
     return os.environ.get(name)
 
+def get_bool_env(name:str, default:bool) -> bool:
+    value = get_env(name)
+    if value is None:
+        return default
+    return value.lower() in ['1', 'true', 'yes']
+
+def get_int_env(name:str, default:int) -> int:
+    value = get_env(name)
+    if value is None:
+        return default
+    return int(value)
+
 
 IMAGE_TAG = get_env('IMAGE_TAG')
 DEV = get_env('DEV')
@@ -0,0 +1,296 @@
+import bisect
+import contextvars
+import http.server
+import math
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class Metric():
+    type = None
+
+    def __init__(self, name: str, description: str = '', label_names: Iterable[str] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+
+    def get_label_values(self, labels: dict) -> tuple:
+        if set(labels.keys()) != set(self.label_names):
+            raise Exception(f'Metric `{self.name}` expects labels {self.label_names}, got {tuple(labels.keys())}')
+        return tuple(str(labels[label_name]) for label_name in self.label_names)
+
+    def get_samples(self) -> Dict[tuple, object]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.value_map = {}
+
+    def inc(self, amount: float = 1, **labels):
+        label_values = self.get_label_values(labels)
+        with self.lock:
+            self.value_map[label_values] = self.value_map.get(label_values, 0) + amount
+
+    def get_samples(self) -> Dict[tuple, float]:
+        with self.lock:
+            return dict(self.value_map)
+
+
+class HistogramSample():
+
+    def __init__(self, bucket_count: int):
+        self.bucket_counts = [0] * bucket_count
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def copy(self):
+        sample = HistogramSample(len(self.bucket_counts))
+        sample.bucket_counts = list(self.bucket_counts)
+        sample.count, sample.sum, sample.min, sample.max = self.count, self.sum, self.min, self.max
+        return sample
+
+
+class Histogram(Metric):
+    """
+    Fixed-bucket histogram, `bucket_counts[i]` counts the observations in `(buckets[i - 1], buckets[i]]`
+    """
+    type = 'histogram'
+
+    # seconds
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, math.inf)
+
+    def __init__(self, *args, buckets: Iterable[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        buckets = sorted(buckets)
+        if buckets[-1] != math.inf:
+            buckets.append(math.inf)
+        self.buckets = tuple(buckets)
+        self.sample_map = {}
+
+    def observe(self, value: float, **labels):
+        label_values = self.get_label_values(labels)
+        with self.lock:
+            sample = self.sample_map.get(label_values)
+            if not sample:
+                sample = HistogramSample(len(self.buckets))
+                self.sample_map[label_values] = sample
+            sample.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+            sample.count += 1
+            sample.sum += value
+            sample.min = min(sample.min, value)
+            sample.max = max(sample.max, value)
+
+    def get_samples(self) -> Dict[tuple, HistogramSample]:
+        with self.lock:
+            return {label_values: sample.copy() for label_values, sample in self.sample_map.items()}
+
+    # estimated by linear interpolation inside the bucket, like prometheus' `histogram_quantile`
+    def get_quantile(self, sample: HistogramSample, quantile: float) -> float:
+        if sample.count == 0:
+            return math.nan
+        rank = quantile * sample.count
+        cumulative_count = 0
+        for i, bucket_count in enumerate(sample.bucket_counts):
+            if cumulative_count + bucket_count >= rank and bucket_count > 0:
+                upper_bound = min(self.buckets[i], sample.max)
+                lower_bound = max(self.buckets[i - 1] if i > 0 else 0, sample.min)
+                if upper_bound <= lower_bound:
+                    return upper_bound
+                return lower_bound + (upper_bound - lower_bound) * (rank - cumulative_count) / bucket_count
+            cumulative_count += bucket_count
+        return sample.max
+
+
+class MetricRegistry():
+
+    metric_map = {}
+    metric_map_lock = threading.Lock()
+
+    @classmethod
+    def get_or_create(cls, metric_class, name: str, *args, **kwargs) -> Metric:
+        with cls.metric_map_lock:
+            metric = cls.metric_map.get(name)
+            if not metric:
+                metric = metric_class(name, *args, **kwargs)
+                cls.metric_map[name] = metric
+            elif not isinstance(metric, metric_class):
+                raise Exception(f'Metric `{name}` is already registered as {metric.type}')
+            return metric
+
+    @classmethod
+    def counter(cls, name: str, *args, **kwargs) -> Counter:
+        return cls.get_or_create(Counter, name, *args, **kwargs)
+
+    @classmethod
+    def histogram(cls, name: str, *args, **kwargs) -> Histogram:
+        return cls.get_or_create(Histogram, name, *args, **kwargs)
+
+    @classmethod
+    def get(cls, name: str) -> Metric:
+        return cls.metric_map.get(name)
+
+    @classmethod
+    def get_all(cls) -> List[Metric]:
+        with cls.metric_map_lock:
+            return list(cls.metric_map.values())
+
+
+class Trace():
+    """
+    Accumulates the seconds spent in each kind of IO, e.g. `db` or `http`, by the code running in the current context
+    """
+
+    def __init__(self):
+        self.seconds_map = {}
+
+    def add(self, kind: str, seconds: float):
+        self.seconds_map[kind] = self.seconds_map.get(kind, 0) + seconds
+
+    def get(self, kind: str) -> float:
+        return self.seconds_map.get(kind, 0)
+
+
+current_trace = contextvars.ContextVar('current_trace', default=None)
+
+@contextmanager
+def trace():
+    trace = Trace()
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+
+def add_trace_seconds(kind: str, seconds: float):
+    trace = current_trace.get()
+    if trace:
+        trace.add(kind, seconds)
+
+@contextmanager
+def trace_seconds(kind: str):
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_trace_seconds(kind, time.perf_counter() - start_time)
+
+
+def format_labels(label_names: tuple, label_values: tuple, extra_labels: Optional[dict] = None) -> str:
+    labels = list(zip(label_names, label_values)) + list((extra_labels or {}).items())
+    if not labels:
+        return ''
+    escaped_labels = [(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in labels]
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped_labels) + '}'
+
+def format_number(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+# https://prometheus.io/docs/instrumenting/exposition_formats/#text-based-format
+def render_prometheus_text(metrics: Iterable[Metric]) -> str:
+    lines = []
+    for metric in metrics:
+        lines.append(f'# HELP {metric.name} {metric.description}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for label_values, sample in sorted(metric.get_samples().items()):
+            if isinstance(metric, Histogram):
+                cumulative_count = 0
+                for bucket, bucket_count in zip(metric.buckets, sample.bucket_counts):
+                    cumulative_count += bucket_count
+                    labels = format_labels(metric.label_names, label_values, {'le': format_number(bucket)})
+                    lines.append(f'{metric.name}_bucket{labels} {cumulative_count}')
+                labels = format_labels(metric.label_names, label_values)
+                lines.append(f'{metric.name}_sum{labels} {format_number(sample.sum)}')
+                lines.append(f'{metric.name}_count{labels} {sample.count}')
+            else:
+                lines.append(f'{metric.name}{format_labels(metric.label_names, label_values)} {format_number(sample)}')
+    return '\n'.join(lines) + '\n'
+
+sample_line_pattern = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)')
+label_pattern = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+def parse_prometheus_text(text: str) -> List[tuple]:
+    """
+    Parses samples of the text format into `(name, labels, value)` tuples, comments are skipped
+    """
+    samples = []
+    for line in text.splitlines():
+        match = sample_line_pattern.match(line)
+        if line.startswith('#') or not match:
+            continue
+        name, label_text, value = match.groups()
+        labels = {key: value.replace('\\"', '"').replace('\\n', '\n').replace('\\\\', '\\')
+                  for key, value in label_pattern.findall(label_text or '')}
+        samples.append((name, labels, float(value)))
+    return samples
+
+def parse_prometheus_histograms(samples: List[tuple], name: str, label_names: Iterable[str]) -> Dict[tuple, Tuple[Histogram, HistogramSample]]:
+    """
+    Rebuilds the samples of histogram `name` keyed by the values of `label_names`, other labels are merged.
+    Min and max are unknown to the text format, so quantiles falling in the `+Inf` bucket are infinite.
+    """
+    label_names = tuple(label_names)
+    bucket_count_maps = {}
+    sum_map = {}
+    for sample_name, labels, value in samples:
+        label_values = tuple(labels.get(label_name, '') for label_name in label_names)
+        if sample_name == f'{name}_bucket':
+            bucket_count_map = bucket_count_maps.setdefault(label_values, {})
+            bucket = float(labels['le'])
+            bucket_count_map[bucket] = bucket_count_map.get(bucket, 0) + value
+        elif sample_name == f'{name}_sum':
+            sum_map[label_values] = sum_map.get(label_values, 0) + value
+    histogram_map = {}
+    for label_values, bucket_count_map in bucket_count_maps.items():
+        histogram = Histogram(name, label_names=label_names, buckets=bucket_count_map.keys())
+        sample = HistogramSample(len(histogram.buckets))
+        previous_cumulative_count = 0
+        for i, bucket in enumerate(histogram.buckets):
+            cumulative_count = int(bucket_count_map.get(bucket, previous_cumulative_count))
+            sample.bucket_counts[i] = cumulative_count - previous_cumulative_count
+            previous_cumulative_count = cumulative_count
+        sample.count = previous_cumulative_count
+        sample.sum = sum_map.get(label_values, 0.0)
+        sample.min = 0.0
+        sample.max = math.inf
+        histogram_map[label_values] = (histogram, sample)
+    return histogram_map
+
+
+class MetricRequestHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render_prometheus_text(MetricRegistry.get_all()).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', f'{PROMETHEUS_CONTENT_TYPE}; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metric_server(port: int, host: str = '0.0.0.0') -> http.server.ThreadingHTTPServer:
+    """
+    Serves `/metrics` of the process in a daemon thread, for processes which are not web apps, e.g. job workers
+    """
+    server = http.server.ThreadingHTTPServer((host, port), MetricRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, name='lation-metric-server', daemon=True)
+    thread.start()
+    return server
@@ -1 +1 @@
-from . import db, job, google_drive, migration, vault
+from . import benchmark, db, job, google_drive, migration, vault
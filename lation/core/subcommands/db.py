@@ -2,6 +2,7 @@ import click
 
 from lation.core.command import Mutex, cli
 from lation.core.database.database import Database
+from lation.core.database.exporter import table_exporter_map
 from lation.core.env import get_env
 
 APP = get_env('APP')
@@ -31,28 +32,36 @@ def db(ctx, url, dialect, driver, username, password, host, port, database_name,
 
 """
 Usage:
-    APP=myapp python lation.py db --url u install-data
+    APP=myapp python lation.py db --url u install-data [--bulk] [--workers n]
 """
 @db.command('install-data')
 @click.pass_obj
-def db_install_data(database):
-    database.install_data(APP)
+@click.option('--bulk', is_flag=True, help='Set this option to prefetch existing rows and write each table in batches')
+@click.option('--workers', default=1, help='Number of connections used to install independent tables concurrently')
+def db_install_data(database, bulk, workers):
+    database.install_data(APP, bulk=bulk, workers=workers)
 
 """
 Usage:
-    APP=myapp python lation.py db --url u reset
+    APP=myapp python lation.py db --url u reset [--bulk] [--workers n]
 """
 @db.command('reset')
 @click.pass_obj
-def db_reset(database):
-    database.reset()
+@click.option('--bulk', is_flag=True, help='Set this option to prefetch existing rows and write each table in batches')
+@click.option('--workers', default=1, help='Number of connections used to install independent tables concurrently')
+def db_reset(database, bulk, workers):
+    database.reset(bulk=bulk, workers=workers)
 
 """
 Usage:
-    APP=myapp python lation.py db --url u export
+    APP=myapp python lation.py db --url u export [--format csv.gz] [--workers n] [--resume]
 """
 @db.command('export')
 @click.pass_obj
 @click.option('--dest-dir', default='./exported-data')
-def db_export(database, dest_dir):
-    database.export(dest_dir)
+@click.option('--format', 'export_format', default='csv', type=click.Choice(list(table_exporter_map.keys())))
+@click.option('--workers', default=1, help='Number of connections used to export tables concurrently')
+@click.option('--chunk-size', default=1000, help='Number of rows fetched from the server-side cursor and written at a time')
+@click.option('--resume', is_flag=True, help='Set this option to skip tables already exported according to the checkpoint file')
+def db_export(database, dest_dir, export_format, workers, chunk_size, resume):
+    database.export(dest_dir, format=export_format, workers=workers, chunk_size=chunk_size, resume=resume)
@@ -1,8 +1,11 @@
 import asyncio
 import click
+import requests
 
 from lation.core.command import cli
-from lation.modules.base.models.job import CoroutineScheduler, Scheduler, JobWorker
+from lation.core.database.database import Database
+from lation.core.metrics import parse_prometheus_text, start_metric_server
+from lation.modules.base.models.job import DB_URL, CoroutineScheduler, JobFailure, JobMetrics, Scheduler, JobWorker
 
 @cli.group('job')
 def job_cmd_group():
@@ -11,9 +14,14 @@ def job_cmd_group():
 """
 Usage:
     python lation.py job scheduler
+    python lation.py job scheduler --metrics-port 9100
 """
 @job_cmd_group.command('scheduler')
-def job_scheduler():
+@click.option('--metrics-port', type=int, default=None, help='Serve job metrics at `/metrics` of this port')
+def job_scheduler(metrics_port):
+    if metrics_port:
+        start_metric_server(metrics_port)
+
     # https://www.technugget.net/using-pythons-asyncio-asynchronously-run-existing-blocking-code-2020/
     async def run_schedulers_concurrently():
         loop = asyncio.get_running_loop()
@@ -26,7 +34,73 @@ def job_scheduler():
 """
 Usage:
     python lation.py job worker
+    python lation.py job worker --concurrency 8 --executor thread --prefetch-count 16
+    python lation.py job worker --queue payment:4 --queue default:2
+    python lation.py job worker --metrics-port 9101
 """
 @job_cmd_group.command('worker')
-def job_worker():
-    JobWorker.run_forever()
+@click.option('--queue', 'queues', multiple=True, help='Consumed queue in format `name[:concurrency]`, defaults to all queues')
+@click.option('--concurrency', default=1, help='Jobs of each queue executed at the same time')
+@click.option('--executor', type=click.Choice([JobWorker.EXECUTOR_THREAD, JobWorker.EXECUTOR_PROCESS]), default=JobWorker.EXECUTOR_THREAD)
+@click.option('--prefetch-count', type=int, default=None, help='Messages of each queue delivered ahead of execution, defaults to twice the concurrency')
+@click.option('--metrics-port', type=int, default=None, help='Serve job metrics at `/metrics` of this port')
+def job_worker(queues, concurrency, executor, prefetch_count, metrics_port):
+    if metrics_port:
+        start_metric_server(metrics_port)
+    queue_concurrency_map = {}
+    for queue in queues:
+        queue_name, _, queue_concurrency = queue.partition(':')
+        queue_concurrency_map[queue_name] = int(queue_concurrency) if queue_concurrency else concurrency
+    JobWorker.run_forever(queue_concurrency_map=queue_concurrency_map,
+                          concurrency=concurrency,
+                          executor=executor,
+                          prefetch_count=prefetch_count)
+
+"""
+Usage:
+    python lation.py job replay-failures
+    python lation.py job replay-failures --id 1 --id 2
+    python lation.py job replay-failures --tablename payment_gateway_trade --method sync
+"""
+@job_cmd_group.command('replay-failures')
+@click.option('--id', 'job_failure_ids', type=int, multiple=True, help='Replay only these job failures')
+@click.option('--tablename', help='Replay only jobs of this table')
+@click.option('--method', 'instance_method_name', help='Replay only jobs of this instance method')
+def job_replay_failures(job_failure_ids, tablename, instance_method_name):
+    database = Database(url=DB_URL)
+    session = database.create_session()
+    try:
+        replayed_count = JobFailure.replay(session,
+                                           job_failure_ids=list(job_failure_ids),
+                                           tablename=tablename,
+                                           instance_method_name=instance_method_name)
+    finally:
+        session.close()
+    print(f'{replayed_count} job failures replayed')
+
+"""
+Usage:
+    python lation.py job metrics --url http://localhost:8000/metrics
+    python lation.py job metrics --url http://scheduler:9100/metrics --url http://worker-1:9101/metrics --url http://worker-2:9101/metrics
+"""
+@job_cmd_group.command('metrics')
+@click.option('--url', 'urls', multiple=True, required=True, help='Metrics endpoint of the app, the scheduler or a worker, samples of all urls are merged')
+def job_metrics(urls):
+    samples = []
+    for url in urls:
+        res = requests.get(url, timeout=10)
+        res.raise_for_status()
+        samples.extend(parse_prometheus_text(res.text))
+
+    def format_seconds(seconds):
+        return '-' if seconds is None else f'{seconds:.3f}'
+
+    summaries = JobMetrics.summarize(samples)
+    print(f'{"job":<48} {"kind":<8} {"runs":>7} {"fail":>5} {"skip":>5} {"retry":>5} {"dead":>5} {"total s":>10} {"share":>6} '
+          f'{"mean s":>8} {"p95 s":>8} {"wait s":>8} {"p95 wait":>8} {"db s":>8} {"http s":>8}')
+    for summary in summaries:
+        print(f'{summary["job"]:<48} {summary["kind"]:<8} {summary["runs"]:>7} {summary["failures"]:>5} {summary["skipped_runs"]:>5} '
+              f'{summary["retries"]:>5} {summary["dead_letters"]:>5} {summary["total_seconds"]:>10.1f} {summary["share"]:>6.1%} '
+              f'{format_seconds(summary["mean_seconds"]):>8} {format_seconds(summary["p95_seconds"]):>8} '
+              f'{format_seconds(summary["mean_queue_wait_seconds"]):>8} {format_seconds(summary["p95_queue_wait_seconds"]):>8} '
+              f'{format_seconds(summary["mean_db_seconds"]):>8} {format_seconds(summary["mean_http_seconds"]):>8}')
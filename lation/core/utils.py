@@ -1,6 +1,7 @@
 import asyncio
 import enum
 import inspect
+import threading
 import time
 from datetime import datetime, timedelta
 from functools import wraps
@@ -35,6 +36,10 @@ def coro(func):
         return asyncio.run(func(*args, **kwargs))
     return wrapper
 
+def chunk_list(items: list, chunk_size: int):
+    for i in range(0, len(items), chunk_size):
+        yield items[i:i + chunk_size]
+
 def fallback_empty_kwarg_to_member(name: str):
     def decorator(func):
         @wraps(func)
@@ -53,6 +58,7 @@ class RateLimiter:
         self.period_in_seconds = period_in_seconds
         self.called_datetimes = []
         self.queued_datetimes = []
+        self.lock = threading.Lock()
 
     def min_waiting_seconds(self) -> int:
         utcnow = datetime.utcnow()
@@ -63,21 +69,24 @@ class RateLimiter:
         if len(self.called_datetimes) + len(self.queued_datetimes) < self.max_calls:
             return 0
 
-        if len(self.called_datetimes) > 0:
-            oldest_called_datetime = self.called_datetimes[0]
-        elif len(self.queued_datetimes) > 0:
-            oldest_called_datetime = self.queued_datetimes[0]
-        elapsed_seconds = (utcnow - oldest_called_datetime).total_seconds()
+        # each queued call waits for its own slot, freed by the call `max_calls` calls before it
+        slot_datetimes = sorted(self.called_datetimes + self.queued_datetimes)
+        freed_slot_datetime = slot_datetimes[len(slot_datetimes) - self.max_calls]
+        elapsed_seconds = (utcnow - freed_slot_datetime).total_seconds()
         return self.period_in_seconds - elapsed_seconds
 
     def wait_strategy(self, func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            waiting_seconds = self.min_waiting_seconds()
+            # callers in other threads see the queued call before this one sleeps
+            with self.lock:
+                waiting_seconds = self.min_waiting_seconds()
+                if waiting_seconds > 0:
+                    self.queued_datetimes.append(datetime.utcnow() + timedelta(seconds=waiting_seconds))
             if waiting_seconds > 0:
-                self.queued_datetimes.append(datetime.utcnow() + timedelta(seconds=waiting_seconds))
                 time.sleep(waiting_seconds)
-            self.called_datetimes.append(datetime.utcnow())
+            with self.lock:
+                self.called_datetimes.append(datetime.utcnow())
             return func(*args, **kwargs)
         return wrapper
 
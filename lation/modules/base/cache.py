@@ -1,7 +1,21 @@
-from datetime import datetime, timedelta
+import heapq
+import itertools
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+
+from lation.core.env import get_env, get_int_env
+
+
+CACHE_BACKEND = get_env('CACHE_BACKEND') or 'memory'
+CACHE_SQLITE_PATH = get_env('CACHE_SQLITE_PATH') or '/tmp/lation-cache.sqlite3'
+CACHE_MAX_SIZE = get_int_env('CACHE_MAX_SIZE', 10000)
 
 class Cache():
-    def set(self, key, value):
+    def set(self, key, value, ttl: timedelta = None):
         raise NotImplementedError
 
     def get(self, key):
@@ -10,31 +24,332 @@ class Cache():
     def evict(self, key):
         raise NotImplementedError
 
+    # not single-flight, engines that can coordinate concurrent misses should override this
+    def get_or_set(self, key, factory, ttl: timedelta = None):
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            self.set(key, value, ttl=ttl)
+        return value
+
     def __del__(self):
         raise NotImplementedError
 
+class CacheStats():
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': self.hit_rate,
+        }
+
+class CacheEntry():
+    __slots__ = ('value', 'expire_time', 'frequency')
+
+    def __init__(self, value, expire_time):
+        self.value = value
+        self.expire_time = expire_time
+        self.frequency = 1
+
+class CacheFlight():
+    __slots__ = ('event', 'value', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
 class MemoryCache(Cache):
-    def __init__(self, ttl: timedelta = None):
-        self._cache: dict = {}
+    """
+    Thread-safe in-process cache bounded by `max_size` entries.
+    Expiry runs on a monotonic clock, lazily on lookup and every `purge_interval` for entries never read again.
+    `eviction_policy` is either `lru` or `lfu` and decides which entry gives way once the cache is full.
+    """
+
+    EVICTION_POLICY_LRU = 'lru'
+    EVICTION_POLICY_LFU = 'lfu'
+
+    _missing = object()
+
+    def __init__(self, ttl: timedelta = None, max_size: int = 10000, eviction_policy: str = EVICTION_POLICY_LRU,
+                 purge_interval: timedelta = timedelta(minutes=1), clock=time.monotonic):
+        if eviction_policy not in (MemoryCache.EVICTION_POLICY_LRU, MemoryCache.EVICTION_POLICY_LFU):
+            raise Exception(f'Unsupported eviction policy `{eviction_policy}`')
+        self._cache: OrderedDict = OrderedDict()
+        self._ttl = ttl
+        self._max_size = max_size
+        self._eviction_policy = eviction_policy
+        self._purge_interval = purge_interval.total_seconds()
+        self._clock = clock
+        self._lock = threading.RLock()
+        # (expire_time, sequence, key) triples, stale triples are skipped when the entry expires later or is gone,
+        # the sequence breaks ties of expire times so that keys, which may not be comparable, are never compared
+        self._expire_heap = []
+        self._expire_sequence = itertools.count()
+        self._next_purge_time = clock() + self._purge_interval
+        # lfu bookkeeping, keys of the same frequency are kept in lru order
+        self._frequency_map = defaultdict(OrderedDict)
+        self._min_frequency = 0
+        self._flight_map = {}
+        self.stats = CacheStats()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def _is_expired(self, entry: CacheEntry, now: float) -> bool:
+        return entry.expire_time != None and entry.expire_time <= now
+
+    def _touch(self, key, entry: CacheEntry):
+        if self._eviction_policy == MemoryCache.EVICTION_POLICY_LRU:
+            self._cache.move_to_end(key)
+            return
+        keys = self._frequency_map[entry.frequency]
+        del keys[key]
+        if not keys:
+            del self._frequency_map[entry.frequency]
+            if self._min_frequency == entry.frequency:
+                self._min_frequency += 1
+        entry.frequency += 1
+        self._frequency_map[entry.frequency][key] = None
+
+    def _remove(self, key):
+        entry = self._cache.pop(key)
+        if self._eviction_policy == MemoryCache.EVICTION_POLICY_LFU:
+            keys = self._frequency_map[entry.frequency]
+            del keys[key]
+            if not keys:
+                del self._frequency_map[entry.frequency]
+        return entry
+
+    def _evict_one(self):
+        if self._eviction_policy == MemoryCache.EVICTION_POLICY_LRU:
+            key = next(iter(self._cache))
+        else:
+            if self._min_frequency not in self._frequency_map:
+                self._min_frequency = min(self._frequency_map.keys())
+            key = next(iter(self._frequency_map[self._min_frequency]))
+        self._remove(key)
+        self.stats.evictions += 1
+
+    def _purge_expired(self, now: float):
+        while self._expire_heap and self._expire_heap[0][0] <= now:
+            expire_time, _, key = heapq.heappop(self._expire_heap)
+            entry = self._cache.get(key)
+            if entry and entry.expire_time == expire_time:
+                self._remove(key)
+                self.stats.expirations += 1
+        self._next_purge_time = now + self._purge_interval
+
+    def _maybe_purge_expired(self, now: float):
+        if now >= self._next_purge_time:
+            self._purge_expired(now)
+
+    def _lookup(self, key):
+        now = self._clock()
+        self._maybe_purge_expired(now)
+        entry = self._cache.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return MemoryCache._missing
+        if self._is_expired(entry, now):
+            self._remove(key)
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return MemoryCache._missing
+        self._touch(key, entry)
+        self.stats.hits += 1
+        return entry.value
+
+    # `ttl` overrides the default ttl of the cache for this key only
+    def set(self, key, value, ttl: timedelta = None):
+        if ttl == None:
+            ttl = self._ttl
+        with self._lock:
+            now = self._clock()
+            self._maybe_purge_expired(now)
+            expire_time = now + ttl.total_seconds() if ttl != None else None
+            if key in self._cache:
+                self._remove(key)
+            while len(self._cache) >= self._max_size:
+                self._evict_one()
+            self._cache[key] = CacheEntry(value, expire_time)
+            if self._eviction_policy == MemoryCache.EVICTION_POLICY_LFU:
+                self._frequency_map[1][key] = None
+                self._min_frequency = 1
+            if expire_time != None:
+                heapq.heappush(self._expire_heap, (expire_time, next(self._expire_sequence), key))
+
+    def get(self, key):
+        with self._lock:
+            value = self._lookup(key)
+        return None if value is MemoryCache._missing else value
+
+    def get_or_set(self, key, factory, ttl: timedelta = None):
+        """
+        Concurrent misses on the same key are collapsed into a single `factory()` call,
+        the other callers wait for its result or its exception
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is not MemoryCache._missing:
+                return value
+            flight = self._flight_map.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = CacheFlight()
+                self._flight_map[key] = flight
+        if not is_leader:
+            flight.event.wait()
+            if flight.error:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = factory()
+            self.set(key, flight.value, ttl=ttl)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flight_map[key]
+            flight.event.set()
+
+    def evict(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._remove(key)
+
+    def purge_expired(self):
+        with self._lock:
+            self._purge_expired(self._clock())
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._expire_heap.clear()
+            self._frequency_map.clear()
+            self._min_frequency = 0
+
+    def __del__(self):
+        self.clear()
+
+class SqliteCache(Cache):
+    """
+    Cache stored in a local SQLite file, so that every worker process on the host shares the same entries.
+    Values are pickled, and expiry uses the wall clock since monotonic clocks are not comparable across processes.
+    Each `namespace` is a table of its own, several caches may share one file.
+    """
+
+    _missing = object()
+
+    def __init__(self, path: str, namespace: str = 'cache', ttl: timedelta = None, max_size: int = 10000,
+                 purge_interval: timedelta = timedelta(minutes=1), busy_timeout: timedelta = timedelta(seconds=5)):
+        self._path = path
+        self._table_name = ''.join(c if c.isalnum() else '_' for c in namespace).lower()
         self._ttl = ttl
+        self._max_size = max_size
+        self._purge_interval = purge_interval.total_seconds()
+        self._busy_timeout = busy_timeout.total_seconds()
+        self._local = threading.local()
+        self._next_purge_time = time.time() + self._purge_interval
+        self.stats = CacheStats()
+        with self._get_connection() as connection:
+            connection.execute(f'CREATE TABLE IF NOT EXISTS {self._table_name} '
+                               f'(key BLOB PRIMARY KEY, value BLOB, expire_time REAL, set_time REAL)')
+            connection.execute(f'CREATE INDEX IF NOT EXISTS {self._table_name}_expire_time ON {self._table_name} (expire_time)')
+            connection.execute(f'CREATE INDEX IF NOT EXISTS {self._table_name}_set_time ON {self._table_name} (set_time)')
+
+    # sqlite connections can't be shared by threads, so each thread opens its own
+    def _get_connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self._path, timeout=self._busy_timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
 
-    def set(self, key, value):
-        self._cache[key] = (value, datetime.utcnow())
+    @staticmethod
+    def _dump_key(key) -> bytes:
+        return pickle.dumps(key, protocol=4)
+
+    def _maybe_purge(self, connection: sqlite3.Connection, now: float):
+        if now < self._next_purge_time:
+            return
+        self._next_purge_time = now + self._purge_interval
+        cursor = connection.execute(f'DELETE FROM {self._table_name} WHERE expire_time <= ?', (now,))
+        self.stats.expirations += cursor.rowcount
+        # entries beyond `max_size` are dropped oldest first
+        cursor = connection.execute(f'DELETE FROM {self._table_name} WHERE key IN '
+                                    f'(SELECT key FROM {self._table_name} ORDER BY set_time DESC LIMIT -1 OFFSET ?)',
+                                    (self._max_size,))
+        self.stats.evictions += cursor.rowcount
+
+    # `ttl` overrides the default ttl of the cache for this key only
+    def set(self, key, value, ttl: timedelta = None):
+        if ttl == None:
+            ttl = self._ttl
+        now = time.time()
+        expire_time = now + ttl.total_seconds() if ttl != None else None
+        connection = self._get_connection()
+        connection.execute(f'INSERT OR REPLACE INTO {self._table_name} (key, value, expire_time, set_time) VALUES (?, ?, ?, ?)',
+                           (SqliteCache._dump_key(key), pickle.dumps(value, protocol=4), expire_time, now))
+        self._maybe_purge(connection, now)
 
     def get(self, key):
-        value, set_time = self._cache.get(key, (None, None))
-        if set_time == None:
+        now = time.time()
+        connection = self._get_connection()
+        row = connection.execute(f'SELECT value, expire_time FROM {self._table_name} WHERE key = ?',
+                                 (SqliteCache._dump_key(key),)).fetchone()
+        if row is None:
+            self.stats.misses += 1
             return None
-        if self._ttl != None and set_time + self._ttl < datetime.utcnow():
+        value, expire_time = row
+        if expire_time != None and expire_time <= now:
+            self.stats.misses += 1
             return None
-        return value
+        self.stats.hits += 1
+        return pickle.loads(value)
 
     def evict(self, key):
-        del self._cache[key]
+        self._get_connection().execute(f'DELETE FROM {self._table_name} WHERE key = ?', (SqliteCache._dump_key(key),))
+
+    def purge_expired(self):
+        self._next_purge_time = 0
+        self._maybe_purge(self._get_connection(), time.time())
+
+    def clear(self):
+        self._get_connection().execute(f'DELETE FROM {self._table_name}')
 
     def __del__(self):
-        for cache_key in self._cache.keys():
-            self.evict[cache_key]
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+
+def create_cache(namespace: str, ttl: timedelta = None) -> Cache:
+    """
+    Creates the cache engine selected by `CACHE_BACKEND`,
+    `memory` keeps entries per process and `sqlite` shares them between the processes of a host through `CACHE_SQLITE_PATH`
+    """
+    if CACHE_BACKEND == 'memory':
+        return MemoryCache(ttl=ttl, max_size=CACHE_MAX_SIZE)
+    elif CACHE_BACKEND == 'sqlite':
+        return SqliteCache(CACHE_SQLITE_PATH, namespace=namespace, ttl=ttl, max_size=CACHE_MAX_SIZE)
+    raise Exception(f'Unsupported cache backend `{CACHE_BACKEND}`')
 
 class CacheRegistry():
     cache_map = {}
@@ -47,11 +362,15 @@ class CacheRegistry():
     def get(cls, key):
         return cls.cache_map[key]
 
+    @classmethod
+    def has(cls, key):
+        return key in cls.cache_map
+
     @classmethod
     def unregister(cls, key):
         del cls.cache_map[key]
 
     @classmethod
     def unregister_all(cls):
-        for cache_key in cls.cache_map.keys():
-            cls.unregister(cache_key)
\ No newline at end of file
+        for cache_key in list(cls.cache_map.keys()):
+            cls.unregister(cache_key)
@@ -1,16 +1,66 @@
+import asyncio
+import contextvars
 import enum
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
+from threading import Lock
 from urllib.parse import urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.models import Response
+from urllib3.util.retry import Retry
+
+from lation.core.env import get_int_env
+from lation.core.metrics import trace_seconds
+
+
+HTTP_CLIENT_POOL_SIZE = get_int_env('HTTP_CLIENT_POOL_SIZE', 10)
+# seconds
+HTTP_CLIENT_CONNECT_TIMEOUT = get_int_env('HTTP_CLIENT_CONNECT_TIMEOUT', 5)
+HTTP_CLIENT_READ_TIMEOUT = get_int_env('HTTP_CLIENT_READ_TIMEOUT', 30)
+# retries of connection errors, only idempotent requests are retried
+HTTP_CLIENT_MAX_RETRIES = get_int_env('HTTP_CLIENT_MAX_RETRIES', 2)
 
 
 class HttpClient:
+    """
+    Requests are sent through a session shared by the process, which keeps connections to each host alive
+    and applies `(HTTP_CLIENT_CONNECT_TIMEOUT, HTTP_CLIENT_READ_TIMEOUT)` unless a `timeout` is given.
+    Connection errors are retried `HTTP_CLIENT_MAX_RETRIES` times unless `max_retries` is given,
+    requests with another `max_retries` go through a session of their own.
+    Cookies are never persisted, so that clients sharing the session don't leak cookies to one another.
+    """
 
     class VerbEnum(enum.Enum):
         GET = 'get'
         POST = 'post'
 
+    # sessions keyed by max retries
+    session_map = {}
+    session_pid = None
+    session_lock = Lock()
+
+    @staticmethod
+    def get_session(max_retries:int=HTTP_CLIENT_MAX_RETRIES) -> requests.Session:
+        # pooled connections must not be shared with forked processes
+        with HttpClient.session_lock:
+            if HttpClient.session_pid != os.getpid():
+                HttpClient.session_map = {}
+                HttpClient.session_pid = os.getpid()
+            session = HttpClient.session_map.get(max_retries)
+            if not session:
+                session = requests.Session()
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                adapter = HTTPAdapter(pool_maxsize=HTTP_CLIENT_POOL_SIZE,
+                                      max_retries=Retry(total=max_retries, backoff_factor=0.3))
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                HttpClient.session_map[max_retries] = session
+            return session
+
     # https://stackoverflow.com/a/47694595/2443984
     @staticmethod
     def is_valid_url(path_or_url:str) -> bool:
@@ -21,9 +71,11 @@ class HttpClient:
             return False
 
     @staticmethod
-    def request_url(http_verb:VerbEnum, url:str, *args, **kwargs) -> Response:
-        action = getattr(requests, http_verb.value)
-        return action(url, *args, **kwargs)
+    def request_url(http_verb:VerbEnum, url:str, *args, max_retries:int=HTTP_CLIENT_MAX_RETRIES, **kwargs) -> Response:
+        action = getattr(HttpClient.get_session(max_retries), http_verb.value)
+        kwargs.setdefault('timeout', (HTTP_CLIENT_CONNECT_TIMEOUT, HTTP_CLIENT_READ_TIMEOUT))
+        with trace_seconds('http'):
+            return action(url, *args, **kwargs)
 
     @staticmethod
     def get_url(url:str, *args, params:dict=None, **kwargs) -> Response:
@@ -68,4 +120,50 @@ class HttpClient:
     def post_json(self, path_or_url:str, *args, **kwargs) -> dict:
         return HttpClient.post_url_json(self.render_url(path_or_url), *args, **kwargs)
 
+
+class AsyncHttpClient():
+    """
+    Coroutine counterpart of `HttpClient`, whose requests run on a thread pool so that they never block the event loop.
+    The pool is as large as the connection pool of the session, so threads don't queue for connections.
+    Methods of `HttpClient` subclasses are awaited through `run_sync`, e.g. `await AsyncHttpClient(LineAPIClient()).run_sync(LineAPIClient.push_message, to, messages)`.
+    """
+
+    thread_pool = ThreadPoolExecutor(max_workers=HTTP_CLIENT_POOL_SIZE, thread_name_prefix='lation-http')
+
+    def __init__(self, client:HttpClient=None):
+        self.client = client if client else HttpClient()
+
+    async def run_sync(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # the context is copied so that the time of requests is traced by the caller
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(AsyncHttpClient.thread_pool, functools.partial(context.run, func, self.client, *args, **kwargs))
+
+    async def request_url(self, http_verb:HttpClient.VerbEnum, url:str, *args, **kwargs) -> Response:
+        return await self.run_sync(lambda client: HttpClient.request_url(http_verb, url, *args, **kwargs))
+
+    async def get_url(self, url:str, *args, params:dict=None, **kwargs) -> Response:
+        return await self.run_sync(lambda client: HttpClient.get_url(url, *args, params=params, **kwargs))
+
+    async def get_url_json(self, url:str, *args, **kwargs) -> dict:
+        return await self.run_sync(lambda client: HttpClient.get_url_json(url, *args, **kwargs))
+
+    async def post_url(self, url:str, *args, data:dict=None, **kwargs) -> Response:
+        return await self.run_sync(lambda client: HttpClient.post_url(url, *args, data=data, **kwargs))
+
+    async def post_url_json(self, url:str, *args, **kwargs) -> dict:
+        return await self.run_sync(lambda client: HttpClient.post_url_json(url, *args, **kwargs))
+
+    async def get(self, path_or_url:str, *args, **kwargs) -> Response:
+        return await self.run_sync(lambda client: client.get(path_or_url, *args, **kwargs))
+
+    async def post(self, path_or_url:str, *args, **kwargs) -> Response:
+        return await self.run_sync(lambda client: client.post(path_or_url, *args, **kwargs))
+
+    async def get_json(self, path_or_url:str, *args, **kwargs) -> dict:
+        return await self.run_sync(lambda client: client.get_json(path_or_url, *args, **kwargs))
+
+    async def post_json(self, path_or_url:str, *args, **kwargs) -> dict:
+        return await self.run_sync(lambda client: client.post_json(path_or_url, *args, **kwargs))
+
 Response = Response
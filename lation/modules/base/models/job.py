@@ -1,21 +1,46 @@
 import asyncio
 import functools
+import heapq
+import inspect
+import logging
+import queue
+import random
+import signal
 import time
+import traceback
+from collections import defaultdict
+from concurrent import futures
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Dict, List
 
 from croniter import croniter
 from sqlalchemy import Column, ForeignKey
+from sqlalchemy.sql import func as sql_func
 from sqlalchemy.orm import relationship
 
-from lation.core.database.database import Database
-from lation.core.database.types import STRING_L_SIZE, STRING_S_SIZE, STRING_XS_SIZE, Boolean, DateTime, Integer, String
-from lation.core.env import get_env
+from lation.core.database.database import DB_POOL_SIZE, Database
+from lation.core.database.types import STRING_L_SIZE, STRING_S_SIZE, STRING_XS_SIZE, JSON, Boolean, DateTime, Integer, String
+from lation.core.env import get_env, get_int_env
+from lation.core.metrics import MetricRegistry, parse_prometheus_histograms, trace
 from lation.core.orm import Base
-from lation.core.utils import call_fn, coro
-from lation.modules.base.models.message_queue import Publisher, Subscriber
+from lation.core.utils import call_fn, chunk_list, coro
+from lation.modules.base.models.message_queue import MessageBroker, Publisher, Subscriber
 
 
 DB_URL = get_env('DB_URL')
+INTERVAL_JOB_THREAD_POOL_SIZE = get_int_env('INTERVAL_JOB_THREAD_POOL_SIZE', 8)
+INTERVAL_JOB_PROCESS_POOL_SIZE = get_int_env('INTERVAL_JOB_PROCESS_POOL_SIZE', 2)
+CRON_JOB_WORKER_COUNT = get_int_env('CRON_JOB_WORKER_COUNT', 4)
+CRON_JOB_RELOAD_INTERVAL = get_int_env('CRON_JOB_RELOAD_INTERVAL', 30)
+JOB_BATCH_CHUNK_SIZE = get_int_env('JOB_BATCH_CHUNK_SIZE', 100)
+JOB_MAX_RETRIES = get_int_env('JOB_MAX_RETRIES', 3)
+# seconds, the n-th retry is delayed for `JOB_RETRY_BACKOFF * 2 ** (n - 1)` seconds up to `JOB_RETRY_BACKOFF_MAX`
+JOB_RETRY_BACKOFF = get_int_env('JOB_RETRY_BACKOFF', 5)
+JOB_RETRY_BACKOFF_MAX = get_int_env('JOB_RETRY_BACKOFF_MAX', 600)
+
+logger = logging.getLogger(__name__)
 
 
 class CronJobLog(Base):
@@ -30,12 +55,54 @@ class CronJobLog(Base):
     return_value = Column(String(STRING_L_SIZE))
 
 
+class JobFailure(Base):
+    """
+    Dead letter of a job which failed on every attempt, replay it with `JobFailure.replay`
+    """
+    __tablename__ = 'job_failure'
+
+    queue_name = Column(String(STRING_S_SIZE))
+    tablename = Column(String(STRING_S_SIZE), index=True)
+    instance_method_name = Column(String(STRING_S_SIZE), index=True)
+    payload = Column(JSON, comment='Job message')
+    attempt_count = Column(Integer)
+    exception = Column(String(STRING_L_SIZE))
+    traceback = Column(String(STRING_L_SIZE))
+    replay_time = Column(DateTime, index=True)
+
+    @staticmethod
+    def replay(session, job_failure_ids:List[int]=None, tablename:str=None, instance_method_name:str=None) -> int:
+        """
+        Republishes unreplayed dead letters with their attempts reset, and returns how many were replayed
+        """
+        query = session.query(JobFailure).filter(JobFailure.replay_time == None)
+        if job_failure_ids:
+            query = query.filter(JobFailure.id.in_(job_failure_ids))
+        if tablename:
+            query = query.filter(JobFailure.tablename == tablename)
+        if instance_method_name:
+            query = query.filter(JobFailure.instance_method_name == instance_method_name)
+        job_failures = query.order_by(JobFailure.id).all()
+        messages_map = defaultdict(list)
+        for job_failure in job_failures:
+            message = {**job_failure.payload, 'attempt': 0}
+            messages_map[(message.get('queue_name'), message.get('priority'))].append(message)
+        publisher = Publisher()
+        for (queue_name, priority), messages in messages_map.items():
+            publisher.publish_batch(messages, queue_name=queue_name, priority=priority)
+        utc_now = datetime.utcnow()
+        for job_failure in job_failures:
+            job_failure.replay_time = utc_now
+        session.commit()
+        return len(job_failures)
+
+
 class CronJob(Base):
     __tablename__ = 'cron_job'
 
     name = Column(String(STRING_S_SIZE), nullable=False)
     is_active = Column(Boolean, default=True)
-    schedule = Column(String(STRING_XS_SIZE), nullable=False, comment='Cron expression. e.g. `0 */5 * * *`')
+    schedule = Column(String(STRING_XS_SIZE), nullable=False, comment='Cron expression. e.g. `0 */5 * * *`, or `* * * * * */15` with seconds as the 6th field')
 
     # latest_cron_job_log_id = Column(Integer, ForeignKey('cron_job_log.id'), index=True)
     # latest_cron_job_log = relationship('CronJobLog', foreign_keys=[latest_cron_job_log_id])
@@ -46,6 +113,9 @@ class CronJob(Base):
             return False
         return croniter.match(self.schedule, datetime.utcnow())
 
+    def get_next_execute_time(self, base_time:datetime) -> datetime:
+        return croniter(self.schedule, base_time).get_next(datetime)
+
     @coro # allow to execute async job func
     async def execute(self):
         func = Scheduler.get_cron_job_func(self.name)
@@ -54,63 +124,264 @@ class CronJob(Base):
         return await call_fn(func, self)
 
 
+class JobMetrics:
+    """
+    Metrics shared by cron jobs, interval jobs and worker jobs, labelled by job name and kind.
+    Queue wait is the delay between the time a job was due, published or ticked and the time it started,
+    db and http seconds are collected by the trace of the job run.
+    Metrics are kept per process, jobs executed in process pools report back to the parent process to be observed.
+    """
+
+    KIND_CRON = 'cron'
+    KIND_INTERVAL = 'interval'
+    KIND_WORKER = 'worker'
+
+    queue_wait_histogram = MetricRegistry.histogram('job_queue_wait_seconds',
+                                                    'Delay between the time jobs were due and the time they started',
+                                                    label_names=('job', 'kind'))
+    execution_histogram = MetricRegistry.histogram('job_execution_seconds',
+                                                   'Duration of job runs',
+                                                   label_names=('job', 'kind', 'status'))
+    db_histogram = MetricRegistry.histogram('job_db_seconds',
+                                            'Time spent in database queries by job runs',
+                                            label_names=('job', 'kind'))
+    http_histogram = MetricRegistry.histogram('job_http_seconds',
+                                              'Time spent in http requests by job runs',
+                                              label_names=('job', 'kind'))
+    retries_histogram = MetricRegistry.histogram('job_retries',
+                                                 'Retries which job runs had gone through before',
+                                                 label_names=('job', 'kind'),
+                                                 buckets=(0, 1, 2, 3, 5, 10))
+    skipped_run_counter = MetricRegistry.counter('job_skipped_runs_total',
+                                                 'Job runs skipped because previous runs were still running',
+                                                 label_names=('job', 'kind'))
+    retry_counter = MetricRegistry.counter('job_retries_total', 'Failed jobs requeued for retry', label_names=('job',))
+    dead_letter_counter = MetricRegistry.counter('job_dead_letters_total', 'Failed jobs which ran out of retries', label_names=('job',))
+
+    @staticmethod
+    def observe(kind:str, job_name:str, status:str, execution_seconds:float, trace_seconds_map:dict=None,
+                queue_wait_seconds:float=None, retries:int=None):
+        trace_seconds_map = trace_seconds_map or {}
+        JobMetrics.execution_histogram.observe(execution_seconds, job=job_name, kind=kind, status=status)
+        JobMetrics.db_histogram.observe(trace_seconds_map.get('db', 0), job=job_name, kind=kind)
+        JobMetrics.http_histogram.observe(trace_seconds_map.get('http', 0), job=job_name, kind=kind)
+        if queue_wait_seconds != None:
+            JobMetrics.queue_wait_histogram.observe(max(0, queue_wait_seconds), job=job_name, kind=kind)
+        if retries != None:
+            JobMetrics.retries_histogram.observe(retries, job=job_name, kind=kind)
+
+    @staticmethod
+    def summarize(samples:List[tuple]) -> List[dict]:
+        """
+        Summarizes parsed samples of job metrics per job and kind, ordered by the total execution time.
+        Samples scraped from several processes are merged.
+        """
+        label_names = ('job', 'kind')
+        execution_map = parse_prometheus_histograms(samples, JobMetrics.execution_histogram.name, label_names)
+        queue_wait_map = parse_prometheus_histograms(samples, JobMetrics.queue_wait_histogram.name, label_names)
+        db_map = parse_prometheus_histograms(samples, JobMetrics.db_histogram.name, label_names)
+        http_map = parse_prometheus_histograms(samples, JobMetrics.http_histogram.name, label_names)
+        failure_count_map = defaultdict(float)
+        counter_map = defaultdict(float)
+        for name, labels, value in samples:
+            if name == f'{JobMetrics.execution_histogram.name}_count' and labels.get('status') == 'failure':
+                failure_count_map[(labels.get('job'), labels.get('kind'))] += value
+            elif name in (JobMetrics.skipped_run_counter.name, JobMetrics.retry_counter.name, JobMetrics.dead_letter_counter.name):
+                counter_map[(name, labels.get('job'), labels.get('kind', JobMetrics.KIND_WORKER))] += value
+
+        def get_mean(histogram_map, key):
+            histogram_sample = histogram_map.get(key)
+            if not histogram_sample or histogram_sample[1].count == 0:
+                return None
+            return histogram_sample[1].sum / histogram_sample[1].count
+
+        def get_p95(histogram_map, key):
+            histogram_sample = histogram_map.get(key)
+            if not histogram_sample or histogram_sample[1].count == 0:
+                return None
+            histogram, sample = histogram_sample
+            return histogram.get_quantile(sample, 0.95)
+
+        total_seconds = sum(sample.sum for _, sample in execution_map.values()) or 1
+        summaries = []
+        for key, (_, sample) in execution_map.items():
+            job_name, kind = key
+            summaries.append({
+                'job': job_name,
+                'kind': kind,
+                'runs': sample.count,
+                'failures': int(failure_count_map[key]),
+                'skipped_runs': int(counter_map[(JobMetrics.skipped_run_counter.name, job_name, kind)]),
+                'retries': int(counter_map[(JobMetrics.retry_counter.name, job_name, kind)]),
+                'dead_letters': int(counter_map[(JobMetrics.dead_letter_counter.name, job_name, kind)]),
+                'total_seconds': sample.sum,
+                'share': sample.sum / total_seconds,
+                'mean_seconds': get_mean(execution_map, key),
+                'p95_seconds': get_p95(execution_map, key),
+                'mean_queue_wait_seconds': get_mean(queue_wait_map, key),
+                'p95_queue_wait_seconds': get_p95(queue_wait_map, key),
+                'mean_db_seconds': get_mean(db_map, key),
+                'mean_http_seconds': get_mean(http_map, key),
+            })
+        summaries.sort(key=lambda summary: summary['total_seconds'], reverse=True)
+        return summaries
+
+
+def run_interval_job_in_worker(job_name:str) -> tuple:
+    """
+    Entrypoint of interval jobs offloaded to a thread or a process, which has no access to the event loop of the app.
+    Processes look the job up by name since the decorated function itself can't be pickled.
+    Returns the result along with the start time and the traced seconds of the run.
+    """
+    start_time = time.time()
+    func = CoroutineScheduler.func_map[job_name]
+    get_session = CoroutineScheduler.get_session_factory()
+    with trace() as job_trace:
+        if inspect.iscoroutinefunction(func):
+            result = asyncio.run(func(get_session=get_session))
+        else:
+            result = func(get_session=get_session)
+    return result, start_time, job_trace.seconds_map
+
+def init_interval_job_process():
+    # connections inherited from the parent process must neither be used nor closed by children
+    Database.engine_map = {}
+    CoroutineScheduler.database = None
+
+
 class CoroutineScheduler:
+    """
+    Runs interval jobs on the event loop of the app.
+    Sync jobs are offloaded to a thread pool by default so they never stall the loop,
+    and coroutine jobs which block on sync IO can be sent to the `thread` or `process` executor explicitly.
+    """
+
+    EXECUTOR_LOOP = 'loop'
+    EXECUTOR_THREAD = 'thread'
+    EXECUTOR_PROCESS = 'process'
 
     coroutine_map = {}
+    func_map = {}
     database = None
+    thread_pool = None
+    process_pool = None
 
     @staticmethod
-    def register_interval_job(seconds:float):
+    def register_interval_job(seconds:float, executor:str=None, max_concurrency:int=1, jitter:float=0, skip_if_running:bool=True):
+        """
+        `executor` defaults to `loop` for coroutine functions and `thread` for sync functions.
+        At most `max_concurrency` runs of the job are in flight, ticks beyond that are skipped if `skip_if_running`,
+        otherwise they wait for a slot. Each tick is delayed by a random `[0, jitter)` seconds.
+        """
 
         def decorator(func):
+            job_name = func.__name__
+            job_executor = executor or (CoroutineScheduler.EXECUTOR_LOOP if inspect.iscoroutinefunction(func) else CoroutineScheduler.EXECUTOR_THREAD)
+            if job_executor not in (CoroutineScheduler.EXECUTOR_LOOP, CoroutineScheduler.EXECUTOR_THREAD, CoroutineScheduler.EXECUTOR_PROCESS):
+                raise Exception(f'Unsupported executor `{job_executor}` of interval job `{job_name}`')
+            if job_executor == CoroutineScheduler.EXECUTOR_LOOP and not inspect.iscoroutinefunction(func):
+                raise Exception(f'Interval job `{job_name}` should be a coroutine function to be executed in event loop')
+
+            async def run_once(get_session, tick_time:float):
+                start_time = time.time()
+                trace_seconds_map = {}
+                status = 'success'
+                try:
+                    if job_executor == CoroutineScheduler.EXECUTOR_LOOP:
+                        with trace() as job_trace:
+                            trace_seconds_map = job_trace.seconds_map
+                            result = await func(get_session=get_session)
+                    else:
+                        loop = asyncio.get_running_loop()
+                        pool = CoroutineScheduler.get_pool(job_executor)
+                        result, start_time, trace_seconds_map = await loop.run_in_executor(pool, run_interval_job_in_worker, job_name)
+                    if result:
+                        logger.info(f'Interval job `{job_name}` executed successfully with result: {result}')
+                except Exception as e:
+                    status = 'failure'
+                    logger.exception(f'Interval job `{job_name}` failed with following exception: {e!r}')
+                finally:
+                    JobMetrics.observe(JobMetrics.KIND_INTERVAL, job_name, status,
+                                       execution_seconds=time.time() - start_time,
+                                       trace_seconds_map=trace_seconds_map,
+                                       queue_wait_seconds=start_time - tick_time)
 
             @functools.wraps(func)
-            async def wrapped_func(*args, **kwargs):
+            async def wrapped_func(get_session):
+                loop = asyncio.get_running_loop()
+                semaphore = asyncio.Semaphore(max_concurrency)
+                running_tasks = set()
+
+                async def run_with_slot(tick_time:float):
+                    async with semaphore:
+                        await run_once(get_session, tick_time)
+
+                next_tick_time = loop.time()
                 while True:
-                    _, job_result = await asyncio.gather(
-                        asyncio.sleep(seconds),
-                        func(*args, **kwargs),
-                        return_exceptions=True,
-                    )
-                    if job_result:
-                        if isinstance(job_result, Exception):
-                            print(f'Interval job `{func.__name__}` failed with following exception:')
-                            print(job_result)
-                        else:
-                            print(f'Interval job `{func.__name__}` executed successfully with result:')
-                            print(job_result)
-
-            CoroutineScheduler.coroutine_map[func.__name__] = wrapped_func
+                    if skip_if_running and len(running_tasks) >= max_concurrency:
+                        JobMetrics.skipped_run_counter.inc(job=job_name, kind=JobMetrics.KIND_INTERVAL)
+                        logger.warning(f'Interval job `{job_name}` skipped since {len(running_tasks)} runs are still running')
+                    else:
+                        task = asyncio.ensure_future(run_with_slot(time.time()))
+                        running_tasks.add(task)
+                        task.add_done_callback(running_tasks.discard)
+                    next_tick_time += seconds
+                    delay = next_tick_time - loop.time() + (random.uniform(0, jitter) if jitter else 0)
+                    await asyncio.sleep(max(0, delay))
+
+            CoroutineScheduler.coroutine_map[job_name] = wrapped_func
+            CoroutineScheduler.func_map[job_name] = func
 
             return wrapped_func
 
         return decorator
 
     @classmethod
-    def start_interval_jobs(cls):
+    def get_pool(cls, executor:str):
+        if executor == cls.EXECUTOR_THREAD:
+            if not cls.thread_pool:
+                cls.thread_pool = ThreadPoolExecutor(max_workers=INTERVAL_JOB_THREAD_POOL_SIZE, thread_name_prefix='lation-interval-job')
+            return cls.thread_pool
+        if not cls.process_pool:
+            cls.process_pool = ProcessPoolExecutor(max_workers=INTERVAL_JOB_PROCESS_POOL_SIZE, initializer=init_interval_job_process)
+        return cls.process_pool
+
+    @classmethod
+    def get_session_factory(cls):
         def get_session():
             if not cls.database:
                 cls.database = Database(url=DB_URL)
             session = cls.database.get_session()
             return session
+        return get_session
 
+    @classmethod
+    def start_interval_jobs(cls):
+        get_session = cls.get_session_factory()
         for coroutine_name in CoroutineScheduler.coroutine_map:
             coroutine = CoroutineScheduler.coroutine_map[coroutine_name]
             asyncio.ensure_future(coroutine(get_session=get_session))
 
 
 class Scheduler:
+    """
+    Keeps a heap of the next execute time of every active cron job and sleeps until the earliest one.
+    Due jobs are dispatched to a thread pool, each with its own session, and a job is never run twice at the same time.
+    Cron job rows are reloaded only when the table changes, which is checked every `CRON_JOB_RELOAD_INTERVAL` seconds.
+    Runs missed while the scheduler was down are logged, and executed once on start for jobs registered with `catch_up`.
+    """
 
     fn_map = {}
     config_map = {}
 
     @staticmethod
-    def register_cron_job(execute_once_initialized=False):
+    def register_cron_job(execute_once_initialized=False, catch_up=False):
 
         def decorator(func):
             Scheduler.fn_map[func.__name__] = func
             Scheduler.config_map[func.__name__] = {
                 'execute_once_initialized': execute_once_initialized,
+                'catch_up': catch_up,
             }
 
             @functools.wraps(func)
@@ -134,55 +405,206 @@ class Scheduler:
         try:
             cron_jobs = session.query(CronJob).all()
         except Exception as e:
-            print(e)
+            logger.exception(f'Failed to load cron jobs: {e!r}')
             cron_jobs = []
         return cron_jobs
 
+    @staticmethod
+    def get_cron_job_table_signature(session) -> tuple:
+        try:
+            return session.query(sql_func.count(CronJob.id), sql_func.max(CronJob.id), sql_func.max(CronJob.update_time)).one()
+        except Exception as e:
+            logger.exception(f'Failed to check cron jobs: {e!r}')
+            return None
+
+    @staticmethod
+    def get_missed_cron_jobs(session, cron_jobs, utc_now:datetime):
+        if not cron_jobs:
+            return []
+        last_execute_time_map = dict(session.query(CronJobLog.cron_job_id, sql_func.max(CronJobLog.execute_time))
+                                            .filter(CronJobLog.cron_job_id.in_([cron_job.id for cron_job in cron_jobs]))
+                                            .group_by(CronJobLog.cron_job_id)
+                                            .all())
+        missed_cron_jobs = []
+        for cron_job in cron_jobs:
+            last_execute_time = last_execute_time_map.get(cron_job.id)
+            if last_execute_time and cron_job.get_next_execute_time(last_execute_time) < utc_now:
+                missed_cron_jobs.append((cron_job, last_execute_time))
+        return missed_cron_jobs
+
+    @staticmethod
+    def build_schedule_heap(cron_jobs, utc_now:datetime):
+        schedule_heap = []
+        for cron_job in cron_jobs:
+            if not cron_job.is_active:
+                continue
+            if not Scheduler.get_cron_job_func(cron_job.name):
+                logger.warning(f'Cron job `{cron_job.name}` is not registered')
+                continue
+            try:
+                heapq.heappush(schedule_heap, (cron_job.get_next_execute_time(utc_now), cron_job.id, cron_job.schedule))
+            except Exception as e:
+                logger.error(f'Cron job `{cron_job.name}` has invalid schedule `{cron_job.schedule}`: {e!r}')
+        return schedule_heap
+
     @staticmethod
     def run_forever():
         database = Database(url=DB_URL)
+        thread_pool = ThreadPoolExecutor(max_workers=CRON_JOB_WORKER_COUNT, thread_name_prefix='lation-cron-job')
+        running_futures = {}
+
+        def dispatch(cron_job_id:int, cron_job_name:str, due_time:datetime=None):
+            future = running_futures.get(cron_job_id)
+            if future and not future.done():
+                JobMetrics.skipped_run_counter.inc(job=cron_job_name, kind=JobMetrics.KIND_CRON)
+                logger.warning(f'Cron job `{cron_job_name}` skipped since previous execution is still running')
+                return
+            running_futures[cron_job_id] = thread_pool.submit(Scheduler.execute_cron_job_by_id, database, cron_job_id, due_time)
 
         # execute initialized round
-        session = database.get_session()
-        cron_jobs = Scheduler.get_cron_jobs(session)
-        for cron_job in cron_jobs:
-            config = Scheduler.get_cron_job_config(cron_job.name)
-            if config['execute_once_initialized']:
-                Scheduler.execute_cron_job(session, cron_job)
+        session = database.create_session()
+        try:
+            table_signature = Scheduler.get_cron_job_table_signature(session)
+            cron_jobs = Scheduler.get_cron_jobs(session)
+            utc_now = datetime.utcnow()
+            missed_cron_jobs = Scheduler.get_missed_cron_jobs(session, [cron_job for cron_job in cron_jobs if cron_job.is_active], utc_now) if cron_jobs else []
+            missed_cron_job_ids = set()
+            for cron_job, last_execute_time in missed_cron_jobs:
+                config = Scheduler.get_cron_job_config(cron_job.name) or {}
+                logger.warning(f'Cron job `{cron_job.name}` missed runs since {last_execute_time}')
+                if config.get('catch_up'):
+                    missed_cron_job_ids.add(cron_job.id)
+            for cron_job in cron_jobs:
+                config = Scheduler.get_cron_job_config(cron_job.name)
+                if not config:
+                    continue
+                if config['execute_once_initialized'] or cron_job.id in missed_cron_job_ids:
+                    dispatch(cron_job.id, cron_job.name)
+            cron_job_name_map = {cron_job.id: cron_job.name for cron_job in cron_jobs}
+            schedule_heap = Scheduler.build_schedule_heap(cron_jobs, utc_now)
+        finally:
+            session.close()
 
         # execute scheduled rounds
+        next_reload_check_time = time.monotonic() + CRON_JOB_RELOAD_INTERVAL
         while True:
             utc_now = datetime.utcnow()
-            seconds_to_next_minute = 61 - utc_now.second # use 61 to prevent overlapping
-            time.sleep(seconds_to_next_minute)
+            while schedule_heap and schedule_heap[0][0] <= utc_now:
+                execute_time, cron_job_id, schedule = heapq.heappop(schedule_heap)
+                dispatch(cron_job_id, cron_job_name_map[cron_job_id], execute_time)
+                next_execute_time = croniter(schedule, max(execute_time, utc_now)).get_next(datetime)
+                heapq.heappush(schedule_heap, (next_execute_time, cron_job_id, schedule))
+
+            if time.monotonic() >= next_reload_check_time:
+                next_reload_check_time = time.monotonic() + CRON_JOB_RELOAD_INTERVAL
+                session = database.create_session()
+                try:
+                    new_table_signature = Scheduler.get_cron_job_table_signature(session)
+                    if new_table_signature != None and new_table_signature != table_signature:
+                        logger.info('Cron job table changed, reloading cron jobs')
+                        table_signature = new_table_signature
+                        cron_jobs = Scheduler.get_cron_jobs(session)
+                        cron_job_name_map = {cron_job.id: cron_job.name for cron_job in cron_jobs}
+                        schedule_heap = Scheduler.build_schedule_heap(cron_jobs, datetime.utcnow())
+                finally:
+                    session.close()
+
+            seconds_to_next_reload_check = next_reload_check_time - time.monotonic()
+            if schedule_heap:
+                seconds_to_next_execution = (schedule_heap[0][0] - datetime.utcnow()).total_seconds()
+                time.sleep(max(0, min(seconds_to_next_execution, seconds_to_next_reload_check)))
+            else:
+                time.sleep(max(0, seconds_to_next_reload_check))
 
-            session = database.get_session()
-            cron_jobs = Scheduler.get_cron_jobs(session)
-            for cron_job in cron_jobs:
-                if cron_job.should_execute:
-                    Scheduler.execute_cron_job(session, cron_job)
+    @staticmethod
+    def execute_cron_job_by_id(database, cron_job_id:int, due_time:datetime=None):
+        session = database.create_session()
+        try:
+            cron_job = session.query(CronJob).get(cron_job_id)
+            if cron_job:
+                Scheduler.execute_cron_job(session, cron_job, due_time=due_time)
+        except Exception as e:
+            logger.exception(f'Failed to execute cron job {cron_job_id}: {e!r}')
+        finally:
+            session.close()
 
     @staticmethod
-    def execute_cron_job(session, cron_job):
+    def execute_cron_job(session, cron_job, due_time:datetime=None):
         cron_job_log = CronJobLog(cron_job=cron_job)
         session.add(cron_job_log)
         session.flush()
-        try:
-            execute_time = datetime.utcnow()
-            cron_job_log.return_value = cron_job.execute()
-        except Exception as e:
-            cron_job_log.exception = repr(e)
-        finally:
-            cron_job_log.execute_time = execute_time
-            cron_job_log.finish_time = datetime.utcnow()
-            # cron_job.latest_cron_job_log_id = cron_job_log.id
-            session.commit()
+        status = 'success'
+        with trace() as job_trace:
+            try:
+                execute_time = datetime.utcnow()
+                cron_job_log.return_value = cron_job.execute()
+            except Exception as e:
+                status = 'failure'
+                cron_job_log.exception = repr(e)
+            finally:
+                cron_job_log.execute_time = execute_time
+                cron_job_log.finish_time = datetime.utcnow()
+        JobMetrics.observe(JobMetrics.KIND_CRON, cron_job.name, status,
+                           execution_seconds=(cron_job_log.finish_time - execute_time).total_seconds(),
+                           trace_seconds_map=job_trace.seconds_map,
+                           queue_wait_seconds=(execute_time - due_time).total_seconds() if due_time else None)
+        # cron_job.latest_cron_job_log_id = cron_job_log.id
+        session.commit()
 
 
 class JobProducer(Publisher):
+    """
+    Publishes method calls of a model instance as job messages.
+    Messages go to the queue and priority given explicitly, otherwise to the route registered for the model and method,
+    otherwise to the default queue.
+    """
+
+    route_map = {}
 
-    def __init__(self, instance):
+    def __init__(self, instance, queue_name:str=None, priority:int=None):
         self.instance = instance
+        self.queue_name = queue_name
+        self.priority = priority
+
+    @staticmethod
+    def batch(instances, chunk_size:int=None, queue_name:str=None, priority:int=None):
+        return JobBatchProducer(instances, chunk_size=chunk_size, queue_name=queue_name, priority=priority)
+
+    @staticmethod
+    def register_route(model_class, instance_method_name:str=None, queue_name:str=MessageBroker.DEFAULT_QUEUE_NAME, priority:int=None,
+                       max_retries:int=None):
+        """
+        Routes jobs of `model_class` and its subclasses, or only jobs of its `instance_method_name` method, to `queue_name`.
+        Failed jobs are retried up to `max_retries` times, defaults to `JOB_MAX_RETRIES`.
+        """
+        JobProducer.route_map[(model_class, instance_method_name)] = {
+            'queue_name': queue_name,
+            'priority': priority,
+            'max_retries': max_retries,
+        }
+
+    @staticmethod
+    def get_route(model_class, instance_method_name:str) -> dict:
+        for cls in model_class.__mro__:
+            route = JobProducer.route_map.get((cls, instance_method_name)) or JobProducer.route_map.get((cls, None))
+            if route:
+                return route
+        return {'queue_name': MessageBroker.DEFAULT_QUEUE_NAME, 'priority': None, 'max_retries': None}
+
+    @staticmethod
+    def build_message(model_class, instance_method_name:str, args, kwargs, queue_name:str=None, priority:int=None) -> dict:
+        route = JobProducer.get_route(model_class, instance_method_name)
+        return {
+            'tablename': model_class.__tablename__,
+            'instance_method_name': instance_method_name,
+            'args': args,
+            'kwargs': kwargs,
+            'queue_name': queue_name or route['queue_name'],
+            'priority': priority if priority != None else route['priority'],
+            'max_retries': route['max_retries'] if route['max_retries'] != None else JOB_MAX_RETRIES,
+            'attempt': 0,
+            'publish_time': time.time(),
+        }
 
     def __getattr__(self, name):
         if not hasattr(self.instance, '__class__'):
@@ -191,45 +613,312 @@ class JobProducer(Publisher):
             raise Exception(f'{self.instance} does not have any attribute named {name}')
 
         def replaced_func(*args, **kwargs):
-            self.publish({
-                'tablename': self.instance.__class__.__tablename__,
-                'primary_key_value': self.instance.id,
-                'instance_method_name': name,
-                'args': args,
-                'kwargs': kwargs,
-            })
+            message = JobProducer.build_message(self.instance.__class__, name, args, kwargs, self.queue_name, self.priority)
+            message['primary_key_value'] = self.instance.id
+            self.publish(message, queue_name=message['queue_name'], priority=message['priority'])
+
+        return replaced_func
+
+
+class JobBatchProducer(Publisher):
+    """
+    Calls the same method with the same arguments on many instances of a model through one message per `chunk_size` instances,
+    so that the chunks are executed concurrently by the workers of the queue.
+    The worker loads the instances of a chunk with one `IN` query and commits it,
+    each call runs in a savepoint so that a failing instance doesn't affect the others.
+    """
+
+    def __init__(self, instances, chunk_size:int=None, queue_name:str=None, priority:int=None):
+        self.instances = list(instances)
+        self.chunk_size = chunk_size
+        self.queue_name = queue_name
+        self.priority = priority
+        model_classes = {instance.__class__ for instance in self.instances}
+        if len(model_classes) > 1:
+            raise Exception(f'Instances of a batch should be of the same model, got {model_classes}')
+
+    def __getattr__(self, name):
+        if self.instances and not hasattr(self.instances[0], name):
+            raise Exception(f'{self.instances[0].__class__} does not have any attribute named {name}')
+
+        def replaced_func(*args, **kwargs):
+            if not self.instances:
+                return
+            message = JobProducer.build_message(self.instances[0].__class__, name, args, kwargs, self.queue_name, self.priority)
+            chunk_size = self.chunk_size or JOB_BATCH_CHUNK_SIZE
+            messages = [{**message, 'primary_key_values': [instance.id for instance in chunk_instances], 'chunk_size': chunk_size}
+                        for chunk_instances in chunk_list(self.instances, chunk_size)]
+            self.publish_batch(messages, queue_name=message['queue_name'], priority=message['priority'])
 
         return replaced_func
 
 
+def init_job_worker_process():
+    # connections inherited from the parent process must neither be used nor closed by children
+    Database.engine_map = {}
+    JobWorker.database = Database(url=DB_URL)
+
+def get_job_name(body:dict) -> str:
+    return f"{body['tablename']}.{body['instance_method_name']}"
+
+def retry_or_dead_letter_job(body:dict, exception_description:str, traceback_description:str) -> bool:
+    """
+    Requeues a failed job with exponential backoff, or stores it as a `JobFailure` once it runs out of retries.
+    Returns whether the job is retried.
+    """
+    job_name = get_job_name(body)
+    attempt = body.get('attempt', 0) + 1
+    max_retries = body.get('max_retries', JOB_MAX_RETRIES)
+    if attempt <= max_retries:
+        delay_seconds = min(JOB_RETRY_BACKOFF * 2 ** (attempt - 1), JOB_RETRY_BACKOFF_MAX)
+        logger.warning(f'Job `{job_name}` will be retried in {delay_seconds}s, attempt {attempt}/{max_retries}')
+        # the backoff delay is not counted as queue wait
+        Publisher().publish({**body, 'attempt': attempt, 'publish_time': time.time() + delay_seconds},
+                            queue_name=body.get('queue_name'),
+                            priority=body.get('priority'),
+                            delay_seconds=delay_seconds)
+        return True
+    logger.error(f'Job `{job_name}` is dead-lettered after {attempt} attempts')
+    session = JobWorker.database.create_session()
+    try:
+        session.add(JobFailure(queue_name=body.get('queue_name'),
+                               tablename=body['tablename'],
+                               instance_method_name=body['instance_method_name'],
+                               payload=body,
+                               attempt_count=attempt,
+                               exception=exception_description[:STRING_L_SIZE],
+                               traceback=traceback_description[-STRING_L_SIZE:]))
+        session.commit()
+    finally:
+        session.close()
+    return False
+
+def execute_job(body:dict) -> dict:
+    """
+    Executes a job message with a session of its own and commits it, runs in the thread or process pool of `JobWorker`.
+    Returns the metrics of the run, which are observed by the consumer process.
+    """
+    start_time = time.time()
+    with trace() as job_trace:
+        if 'primary_key_values' in body:
+            is_failed, is_retried = execute_batch_job(body)
+        else:
+            is_failed, is_retried = execute_single_job(body)
+    publish_time = body.get('publish_time')
+    return {
+        'job_name': get_job_name(body),
+        'status': 'failure' if is_failed else 'success',
+        'execution_seconds': time.time() - start_time,
+        'trace_seconds_map': job_trace.seconds_map,
+        'queue_wait_seconds': start_time - publish_time if publish_time else None,
+        'retries': body.get('attempt', 0),
+        'is_retried': is_retried,
+    }
+
+def execute_single_job(body:dict) -> tuple:
+    tablename, primary_key_value = body['tablename'], body['primary_key_value']
+    instance_method_name, args, kwargs = body['instance_method_name'], body['args'], body['kwargs']
+
+    database = JobWorker.database
+    model_class = database.find_model_class_by_tablename(tablename)
+    session = database.create_session()
+    try:
+        instance = session.query(model_class).get(primary_key_value)
+        if not instance:
+            logger.warning(f'{tablename} cannot find instance with id {primary_key_value}')
+            return False, False
+        func = getattr(instance, instance_method_name)
+        func(*args, **kwargs)
+        session.commit()
+        return False, False
+    except Exception as e:
+        session.rollback()
+        logger.exception(f'Job `{tablename}.{instance_method_name}` of id {primary_key_value} failed: {e!r}')
+        return True, retry_or_dead_letter_job(body, repr(e), traceback.format_exc())
+    finally:
+        session.close()
+
+def execute_batch_job(body:dict) -> tuple:
+    tablename, primary_key_values = body['tablename'], body['primary_key_values']
+    instance_method_name, args, kwargs = body['instance_method_name'], body['args'], body['kwargs']
+    chunk_size = body.get('chunk_size') or JOB_BATCH_CHUNK_SIZE
+
+    database = JobWorker.database
+    model_class = database.find_model_class_by_tablename(tablename)
+    session = database.create_session()
+    failed_primary_key_values = []
+    exception_descriptions = []
+    traceback_descriptions = []
+    try:
+        for i, chunk_primary_key_values in enumerate(chunk_list(primary_key_values, chunk_size)):
+            try:
+                instances = session.query(model_class).filter(model_class.id.in_(chunk_primary_key_values)).all()
+                missing_primary_key_values = set(chunk_primary_key_values) - {instance.id for instance in instances}
+                if missing_primary_key_values:
+                    logger.warning(f'{tablename} cannot find instances with ids {sorted(missing_primary_key_values)}')
+                for instance in instances:
+                    savepoint = session.begin_nested()
+                    try:
+                        getattr(instance, instance_method_name)(*args, **kwargs)
+                        savepoint.commit()
+                    except Exception as e:
+                        savepoint.rollback()
+                        failed_primary_key_values.append(instance.id)
+                        exception_descriptions.append(f'{instance.id}: {e!r}')
+                        traceback_descriptions.append(traceback.format_exc())
+                        logger.exception(f'Job `{tablename}.{instance_method_name}` of id {instance.id} failed: {e!r}')
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                # the chunk is lost as a whole, so every instance in it is retried
+                failed_primary_key_values = [pk for pk in failed_primary_key_values if pk not in chunk_primary_key_values]
+                failed_primary_key_values.extend(chunk_primary_key_values)
+                exception_descriptions.append(repr(e))
+                traceback_descriptions.append(traceback.format_exc())
+                logger.exception(f'Batch job `{tablename}.{instance_method_name}` failed: {e!r}')
+    finally:
+        session.close()
+    if failed_primary_key_values:
+        logger.error(f'Batch job `{tablename}.{instance_method_name}` failed for ids {failed_primary_key_values}')
+        return True, retry_or_dead_letter_job({**body, 'primary_key_values': failed_primary_key_values},
+                                              '\n'.join(exception_descriptions),
+                                              '\n'.join(traceback_descriptions))
+    return False, False
+
+
 class JobWorker(Subscriber):
+    """
+    Consumes job messages on the consumer thread and executes them concurrently in thread or process pools,
+    one pool per consumed queue so that a burst in one queue never takes the executors of another.
+    Channels are not thread-safe, so messages are acknowledged back on the consumer thread once their jobs committed,
+    and the prefetch count of each queue bounds how many messages are queued for its pool.
+    On SIGTERM or SIGINT consuming stops, and running jobs are drained and acknowledged before the worker exits.
+    """
 
-    @classmethod
-    def run_forever(cls):
-        cls.database = Database(url=DB_URL)
-        super().run_forever()
+    EXECUTOR_THREAD = 'thread'
+    EXECUTOR_PROCESS = 'process'
 
-    def get_callbacks(self):
-        return [self.on_receive_job]
+    # seconds between acknowledgements of finished jobs when no message arrives
+    ACK_INTERVAL = 0.1
 
-    def on_receive_job(self, body, message):
-        tablename, primary_key_value = body['tablename'], body['primary_key_value']
-        instance_method_name, args, kwargs = body['instance_method_name'], body['args'], body['kwargs']
+    database = None
+    queue_concurrency_map = {}
+    prefetch_count_map = {}
+    pool_map = {}
+
+    @classmethod
+    def run_forever(cls, queue_concurrency_map:Dict[str, int]=None, concurrency:int=1, executor:str=EXECUTOR_THREAD, prefetch_count:int=None):
+        """
+        `queue_concurrency_map` maps the names of consumed queues to their concurrency,
+        all registered queues are consumed with `concurrency` each if not given
+        """
+        if not queue_concurrency_map:
+            queue_concurrency_map = {queue_name: concurrency for queue_name in MessageBroker.queue_map}
+        for queue_name in queue_concurrency_map:
+            MessageBroker.get_queue(queue_name)
+        cls.queue_concurrency_map = queue_concurrency_map
+        cls.prefetch_count_map = {queue_name: prefetch_count or queue_concurrency * 2 for queue_name, queue_concurrency in queue_concurrency_map.items()}
+        cls.database = Database(url=DB_URL, pool_size=max(DB_POOL_SIZE, sum(queue_concurrency_map.values())))
+        for queue_name, queue_concurrency in queue_concurrency_map.items():
+            if executor == cls.EXECUTOR_THREAD:
+                cls.pool_map[queue_name] = ThreadPoolExecutor(max_workers=queue_concurrency, thread_name_prefix=f'lation-job-worker-{queue_name}')
+            elif executor == cls.EXECUTOR_PROCESS:
+                cls.pool_map[queue_name] = ProcessPoolExecutor(max_workers=queue_concurrency, initializer=init_job_worker_process)
+            else:
+                raise Exception(f'Unsupported executor `{executor}`')
+
+        def handle_stop_signal(signum, frame):
+            logger.info(f'Received signal {signum}, draining running jobs...')
+            cls.stop()
+
+        signal.signal(signal.SIGTERM, handle_stop_signal)
+        signal.signal(signal.SIGINT, handle_stop_signal)
+        try:
+            super().run_forever()
+        finally:
+            for pool in cls.pool_map.values():
+                pool.shutdown(wait=True)
+            logger.info('Job worker stopped')
+
+    def __init__(self):
+        super().__init__()
+        self.finished_messages = queue.SimpleQueue()
+        self.running_futures = set()
+
+    def run(self, _tokens=1, **kwargs):
+        return super().run(_tokens, safety_interval=JobWorker.ACK_INTERVAL, **kwargs)
+
+    def get_consumers(self, Consumer, channel):
+        """
+        The prefetch count is applied per channel, so every queue other than the first consumes on a channel of its own,
+        opened on the same connection and closed along with it.
+        """
+        cls = self.__class__
+        consumers = []
+        for i, queue_name in enumerate(cls.queue_concurrency_map):
+            queue_channel = channel if i == 0 else channel.connection.client.channel()
+            consumers.append(Consumer.func(queue_channel,
+                                           [MessageBroker.get_queue(queue_name)],
+                                           callbacks=[functools.partial(self.on_receive_job, queue_name)],
+                                           accept=['json'],
+                                           prefetch_count=cls.prefetch_count_map[queue_name],
+                                           **Consumer.keywords))
+        return consumers
+
+    def on_receive_job(self, queue_name, body, message):
         cls = self.__class__
+        future = cls.pool_map[queue_name].submit(execute_job, body)
+        self.running_futures.add(future)
 
-        model_class = cls.database.find_model_class_by_tablename(tablename)
-        session = cls.database.get_session()
-        instance = session.query(model_class).get(primary_key_value)
+        def on_done(future):
+            if future.exception():
+                logger.error(f'Job executor failed, the message will be requeued: {future.exception()!r}')
+            else:
+                JobWorker.observe_job_run(future.result())
+            self.finished_messages.put((future, message))
 
-        if not instance:
-            print(f'{tablename} cannot find instance with id {primary_key_value}')
-            return
+        future.add_done_callback(on_done)
 
+    @staticmethod
+    def observe_job_run(job_run:dict):
+        job_name = job_run['job_name']
+        if job_run['status'] == 'failure':
+            if job_run['is_retried']:
+                JobMetrics.retry_counter.inc(job=job_name)
+            else:
+                JobMetrics.dead_letter_counter.inc(job=job_name)
+        JobMetrics.observe(JobMetrics.KIND_WORKER, job_name, job_run['status'],
+                           execution_seconds=job_run['execution_seconds'],
+                           trace_seconds_map=job_run['trace_seconds_map'],
+                           queue_wait_seconds=job_run['queue_wait_seconds'],
+                           retries=job_run['retries'])
+
+    def ack_finished_messages(self):
+        while True:
+            try:
+                future, message = self.finished_messages.get_nowait()
+            except queue.Empty:
+                return
+            self.running_futures.discard(future)
+            try:
+                # the job may have failed without its retry or dead letter being stored, so it is delivered again
+                if future.exception():
+                    message.requeue()
+                else:
+                    message.ack()
+            except Exception as e:
+                # the message is redelivered by the broker once the channel is gone
+                logger.error(f'Failed to acknowledge message: {e!r}')
+
+    def on_iteration(self):
+        self.ack_finished_messages()
+
+    @contextmanager
+    def extra_context(self, connection, channel):
         try:
-            func = getattr(instance, instance_method_name)
-            func(*args, **kwargs)
-            session.commit()
-        except Exception as e:
-            session.rollback()
+            yield
         finally:
-            message.ack()
+            if self.running_futures:
+                logger.info(f'Waiting for {len(self.running_futures)} running jobs...')
+                futures.wait(list(self.running_futures))
+            self.ack_finished_messages()
@@ -1,59 +1,153 @@
+import threading
 import time
-from typing import List, Callable
+from typing import List, Callable, Optional
 
-from kombu import Connection, Exchange, Producer, Queue
+from kombu import Connection, Exchange, Queue, pools
 from kombu.mixins import ConsumerMixin
 
-from lation.core.env import get_env
+from lation.core.env import get_bool_env, get_env, get_int_env
 
 
 APP = get_env('APP')
 MESSAGE_QUEUE_URL = get_env('MESSAGE_QUEUE_URL')
+# wait for the broker to acknowledge every published message, pyamqp transport only
+MESSAGE_QUEUE_CONFIRM_PUBLISH = get_bool_env('MESSAGE_QUEUE_CONFIRM_PUBLISH', False)
+MESSAGE_QUEUE_POOL_LIMIT = get_int_env('MESSAGE_QUEUE_POOL_LIMIT', 10)
+
+pools.set_limit(MESSAGE_QUEUE_POOL_LIMIT)
 
 class MessageClient:
 
     @staticmethod
-    def establish_connection():
-        assert MESSAGE_QUEUE_URL != None, 'MESSAGE_QUEUE_URL is required'
+    def get_connection(url:Optional[str]=None) -> Connection:
+        url = url or MESSAGE_QUEUE_URL
+        assert url != None, 'MESSAGE_QUEUE_URL is required'
+        transport_options = {'confirm_publish': True} if MESSAGE_QUEUE_CONFIRM_PUBLISH else {}
+        return Connection(url, transport_options=transport_options)
+
+    @staticmethod
+    def establish_connection(url:Optional[str]=None):
         # https://github.com/celery/kombu/issues/596#issuecomment-225751069
-        conn = Connection(MESSAGE_QUEUE_URL)
+        conn = MessageClient.get_connection(url)
         revived_conn = conn.ensure_connection(max_retries=3)
         return revived_conn
 
 
 class MessageBroker:
+    """
+    Named queues bound to the default exchange, `default` keeps the queue and routing key every app has been using.
+    Queues registered with `max_priority` deliver higher priority messages first,
+    RabbitMQ can't add priorities to an existing queue so they are only given to new queues.
+    """
+
+    DEFAULT_QUEUE_NAME = 'default'
+
     exchange = Exchange('default_exchange', 'topic', durable=True)
-    queue = Queue(f'default_queue_{APP}', exchange=exchange, routing_key=f'app.{APP}')
+    queue_map = {}
 
+    declared_queue_keys = set()
+    declared_queue_keys_lock = threading.Lock()
 
-class Publisher:
+    @classmethod
+    def register_queue(cls, name:str, max_priority:Optional[int]=None) -> Queue:
+        if name in cls.queue_map:
+            return cls.queue_map[name]
+        routing_key = f'app.{APP}' if name == cls.DEFAULT_QUEUE_NAME else f'app.{APP}.{name}'
+        queue_arguments = {'x-max-priority': max_priority} if max_priority else None
+        queue = Queue(f'{name}_queue_{APP}', exchange=cls.exchange, routing_key=routing_key, queue_arguments=queue_arguments)
+        cls.queue_map[name] = queue
+        return queue
+
+    @classmethod
+    def get_queue(cls, name:Optional[str]=None) -> Queue:
+        name = name or cls.DEFAULT_QUEUE_NAME
+        if name not in cls.queue_map:
+            raise Exception(f'Queue `{name}` is not registered')
+        return cls.queue_map[name]
+
+    @classmethod
+    def get_delay_queue(cls, name:Optional[str], delay_seconds:int) -> Queue:
+        """
+        Queue without consumers whose messages expire after `delay_seconds` and are dead-lettered back to queue `name`.
+        Every delay gets a queue of its own since RabbitMQ only expires messages at the head of a queue.
+        """
+        queue = cls.get_queue(name)
+        return Queue(f'{queue.name}_delay_{delay_seconds}s',
+                     exchange=cls.exchange,
+                     routing_key=f'{queue.routing_key}.delay.{delay_seconds}s',
+                     queue_arguments={
+                         'x-message-ttl': delay_seconds * 1000,
+                         'x-dead-letter-exchange': cls.exchange.name,
+                         'x-dead-letter-routing-key': queue.routing_key,
+                     })
 
-    def publish(self, message):
+    @classmethod
+    def declare_once(cls, producer, queue:Queue):
+        key = (producer.connection.as_uri(), queue.name)
+        if key in cls.declared_queue_keys:
+            return
+        with cls.declared_queue_keys_lock:
+            if key in cls.declared_queue_keys:
+                return
+            queue(producer.channel).declare()
+            cls.declared_queue_keys.add(key)
+
+MessageBroker.queue = MessageBroker.register_queue(MessageBroker.DEFAULT_QUEUE_NAME)
+
+
+class Publisher:
+    """
+    Publishes through producers kept in kombu's per-process pools,
+    so that connections and channels are reused across messages instead of opened for each of them
+    """
+
+    message_queue_url = None
+
+    retry_policy = {
+        'interval_start': 0, # First retry immediately,
+        'interval_step': 2,  # then increase by 2s for every retry.
+        'interval_max': 30,  # but don't exceed 30s between retries.
+        'max_retries': 30,   # give up after 30 tries.
+    }
+
+    def publish(self, message, queue_name:Optional[str]=None, priority:Optional[int]=None, delay_seconds:Optional[int]=None):
+        self.publish_batch([message], queue_name=queue_name, priority=priority, delay_seconds=delay_seconds)
+
+    # messages with `delay_seconds` are delivered to queue `queue_name` once the delay elapsed
+    def publish_batch(self, messages:List[dict], queue_name:Optional[str]=None, priority:Optional[int]=None, delay_seconds:Optional[int]=None):
+        if not messages:
+            return
         exchange = MessageBroker.exchange
-        queue = MessageBroker.queue
+        if delay_seconds:
+            queue = MessageBroker.get_delay_queue(queue_name, delay_seconds)
+        else:
+            queue = MessageBroker.get_queue(queue_name)
+        connection = MessageClient.get_connection(self.message_queue_url)
 
         # https://docs.celeryproject.org/projects/kombu/en/stable/userguide/producers.html#basics
-        with MessageClient.establish_connection() as conn:
-            producer = Producer(conn)
-            producer.publish(message,
-                             serializer='json',
-                             exchange=exchange,
-                             routing_key=queue.routing_key,
-                             declare=[queue],
-                             retry=True,
-                             retry_policy={
-                                 'interval_start': 0, # First retry immediately,
-                                 'interval_step': 2,  # then increase by 2s for every retry.
-                                 'interval_max': 30,  # but don't exceed 30s between retries.
-                                 'max_retries': 30,   # give up after 30 tries.
-                             })
+        # https://docs.celeryproject.org/projects/kombu/en/stable/userguide/pools.html
+        with pools.producers[connection].acquire(block=True) as producer:
+            MessageBroker.declare_once(producer, queue)
+            for message in messages:
+                producer.publish(message,
+                                 serializer='json',
+                                 exchange=exchange,
+                                 routing_key=queue.routing_key,
+                                 priority=priority,
+                                 retry=True,
+                                 retry_policy=Publisher.retry_policy)
 
 
 class Subscriber(ConsumerMixin):
 
+    # unacknowledged messages the broker delivers at once, `None` for unlimited
+    prefetch_count = None
+    # set by `stop()`, consuming stops and `run_forever` returns instead of reconnecting
+    is_stopping = False
+
     @classmethod
     def run_forever(cls):
-        while True:
+        while not cls.is_stopping:
             try:
                 cls().run()
             except Exception as e:
@@ -62,13 +156,25 @@ class Subscriber(ConsumerMixin):
                 print('[Subscriber] will retry run() after 5 seconds')
                 time.sleep(5)
 
+    @classmethod
+    def stop(cls):
+        cls.is_stopping = True
+
     def __init__(self):
         self.connection = MessageClient.establish_connection()
 
+    @property
+    def should_stop(self):
+        return self.__class__.is_stopping
+
+    @should_stop.setter
+    def should_stop(self, value):
+        self.__class__.is_stopping = value
+
     def get_consumers(self, Consumer, channel):
         queue = MessageBroker.queue
         return [
-            Consumer([queue], callbacks=self.get_callbacks(), accept=['json']),
+            Consumer([queue], callbacks=self.get_callbacks(), accept=['json'], prefetch_count=self.prefetch_count),
         ]
 
     def get_callbacks(self) -> List[Callable]:
@@ -14,6 +14,7 @@ from lation.core.env import get_env
 from lation.core.orm import Base, JoinedTableInheritanceMixin, SingleTableInheritanceMixin
 from lation.modules.base.models.currency import Currency
 from lation.modules.base.models.job import JobProducer
+from lation.modules.base.models.message_queue import MessageBroker
 from lation.modules.base_fastapi.routers.schemas import StatusEnum
 from lation.modules.base.vendors.ecpay_payment_sdk import ECPayPaymentSdk
 
@@ -254,3 +255,10 @@ class ECPayPaymentGatewayTrade(PaymentGatewayTrade):
             print(f'ECPayPaymentGatewayTrade id=`{self.id}`, number=`{self.number}` is successfully synced')
         except Exception as e:
             print(f'ECPayPaymentGatewayTrade id=`{self.id}`, number=`{self.number}` is failed to sync')
+
+
+# keep payment syncs away from bulk jobs such as notifications,
+# and sync the trades a gateway scan fans out to ahead of further scans
+MessageBroker.register_queue('payment', max_priority=10)
+JobProducer.register_route(PaymentGateway, 'sync_payment', queue_name='payment', priority=1)
+JobProducer.register_route(PaymentGatewayTrade, 'sync', queue_name='payment', priority=5)
@@ -1,26 +1,148 @@
+import asyncio
 import functools
+import hashlib
+import inspect
+import json
+import math
+import time
+from datetime import timedelta
+from typing import Callable, Optional
+from urllib.parse import urlencode
 
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
-from lation.core.utils import call_fn
+from lation.core.database.session_executor import SessionExecutor
+from lation.modules.base.cache import CacheRegistry
 from lation.modules.base_fastapi.dependencies import get_session
 
 
+RESPONSE_CACHE_KEY = 'API_RESPONSE_CACHE'
+
+
 def managed_transaction(func):
 
     @functools.wraps(func)
     async def wrap_func(*args, session: Session = Depends(get_session), **kwargs):
+        session_executor = session if isinstance(session, SessionExecutor) else SessionExecutor(session)
         try:
-            result = await call_fn(func, *args, session=session, **kwargs)
-            session.commit()
+            if inspect.iscoroutinefunction(func):
+                result = await func(*args, session=session, **kwargs)
+            else:
+                result = await run_in_threadpool(func, *args, session=session, **kwargs)
+            await session_executor.commit()
         except HTTPException as e:
-            session.rollback()
+            await session_executor.rollback()
             raise e
         except Exception as e:
-            session.rollback()
+            await session_executor.rollback()
             raise e
         # don't close session here, or you won't be able to response
         return result
 
     return wrap_func
+
+
+def get_default_response_cache_key(request: Request) -> str:
+    query = urlencode(sorted(request.query_params.multi_items()))
+    return f'{request.url.path}?{query}'
+
+def cached_response(ttl: timedelta, key: Optional[Callable[[Request], str]] = None,
+                    stale_ttl: Optional[timedelta] = None, cache_key: str = RESPONSE_CACHE_KEY):
+    """
+    Caches the JSON encoded result of a route in the cache registered under `cache_key`,
+    keyed by path and sorted query params unless `key(request)` is given.
+    Responses carry an ETag and are answered with 304 on a matching If-None-Match,
+    and `Cache-Control: no-cache` on the request skips the cached entry.
+    Within `stale_ttl` after expiry the stale response is served while a single background call refreshes it,
+    the refresh reuses the arguments resolved for the request that triggered it.
+    The route is called directly when no cache is registered.
+    """
+    get_key = key or get_default_response_cache_key
+    stale_seconds = stale_ttl.total_seconds() if stale_ttl else 0
+    # in-process single-flight, maps keys to futures of the entry being computed
+    flight_map = {}
+    refresh_tasks = set()
+
+    def decorator(func):
+
+        async def call(kwargs):
+            if inspect.iscoroutinefunction(func):
+                return await func(**kwargs)
+            return await run_in_threadpool(func, **kwargs)
+
+        async def compute(cache, entry_key, kwargs):
+            if entry_key in flight_map:
+                return await asyncio.shield(flight_map[entry_key])
+            future = asyncio.get_running_loop().create_future()
+            flight_map[entry_key] = future
+            try:
+                content = jsonable_encoder(await call(kwargs))
+                body = json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+                entry = {
+                    'body': body,
+                    'etag': f'"{hashlib.sha1(body).hexdigest()}"',
+                    'fresh_until': time.time() + ttl.total_seconds(),
+                }
+                cache.set(entry_key, entry, ttl=ttl + (stale_ttl or timedelta()))
+                future.set_result(entry)
+                return entry
+            except Exception as e:
+                future.set_exception(e)
+                # retrieve the exception so that an unawaited future is not reported
+                future.exception()
+                raise e
+            finally:
+                del flight_map[entry_key]
+
+        def revalidate(cache, entry_key, kwargs):
+            if entry_key in flight_map:
+                return
+            task = asyncio.ensure_future(compute(cache, entry_key, kwargs))
+            refresh_tasks.add(task)
+            task.add_done_callback(lambda task: (refresh_tasks.discard(task), task.cancelled() or task.exception()))
+
+        def to_response(request, entry, is_stale):
+            max_age = max(0, math.ceil(entry['fresh_until'] - time.time()))
+            cache_control = f'max-age={max_age}'
+            if stale_seconds:
+                cache_control += f', stale-while-revalidate={int(stale_seconds)}'
+            headers = {'ETag': entry['etag'], 'Cache-Control': cache_control}
+            if is_stale:
+                headers['Warning'] = '110 - "Response is Stale"'
+            if_none_match = request.headers.get('if-none-match')
+            if if_none_match and entry['etag'] in [etag.strip() for etag in if_none_match.split(',')]:
+                return Response(status_code=304, headers=headers)
+            return Response(content=entry['body'], media_type='application/json', headers=headers)
+
+        @functools.wraps(func)
+        async def wrap_func(*args, request: Request, **kwargs):
+            if accepts_request:
+                kwargs['request'] = request
+            if not CacheRegistry.has(cache_key):
+                return await call(kwargs)
+            cache = CacheRegistry.get(cache_key)
+            entry_key = f'cached_response:{get_key(request)}'
+            no_cache = 'no-cache' in request.headers.get('cache-control', '')
+            entry = None if no_cache else cache.get(entry_key)
+            if entry is None:
+                entry = await compute(cache, entry_key, kwargs)
+            elif time.time() >= entry['fresh_until']:
+                revalidate(cache, entry_key, kwargs)
+                return to_response(request, entry, True)
+            return to_response(request, entry, False)
+
+        # expose `request` to FastAPI even when the route doesn't declare it
+        signature = inspect.signature(func)
+        accepts_request = 'request' in signature.parameters
+        if not accepts_request:
+            parameters = [parameter for parameter in signature.parameters.values() if parameter.kind != inspect.Parameter.VAR_KEYWORD]
+            var_keyword_parameters = [parameter for parameter in signature.parameters.values() if parameter.kind == inspect.Parameter.VAR_KEYWORD]
+            request_parameter = inspect.Parameter('request', inspect.Parameter.KEYWORD_ONLY, annotation=Request)
+            signature = signature.replace(parameters=parameters + [request_parameter] + var_keyword_parameters)
+        wrap_func.__signature__ = signature
+        return wrap_func
+
+    return decorator
@@ -1,12 +1,17 @@
 from typing import Iterator
 
-from fastapi import Request
+from fastapi import Depends, Request
 from sqlalchemy.orm import Session
 
+from lation.core.database.session_executor import SessionExecutor
+
 
 def get_session(request: Request) -> Iterator[Session]:
-    request.state.session = request.app.state.database.get_session()
+    request.state.session = request.app.state.database.create_session()
     try:
         yield request.state.session
     finally:
         request.state.session.close()
+
+async def get_session_executor(session: Session = Depends(get_session)) -> SessionExecutor:
+    return SessionExecutor(session)
@@ -1,8 +1,10 @@
 import os
 
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
 
 from lation.core.env import IMAGE_TAG
+from lation.core.metrics import PROMETHEUS_CONTENT_TYPE, MetricRegistry, render_prometheus_text
 from lation.modules.base_fastapi.routers.schemas import LivenessSchema, ResponseSchema as Response, StatusEnum, VersionSchema
 
 
@@ -16,3 +18,7 @@ def liveness():
 def version():
     version = IMAGE_TAG if IMAGE_TAG else 'local'
     return Response[VersionSchema](status=StatusEnum.SUCCESS, data=version)
+
+@router.get('/metrics', tags=['system'], response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_prometheus_text(MetricRegistry.get_all()), media_type=PROMETHEUS_CONTENT_TYPE)
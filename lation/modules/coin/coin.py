@@ -1,3 +1,6 @@
+from datetime import timedelta
+
+from lation.modules.base.cache import CacheRegistry, create_cache
 from lation.modules.customer.customer import CustomerApp
 from lation.modules.coin.routers import bitfinex, experiment, user
 
@@ -9,3 +12,11 @@ class CoinFastApp(CustomerApp):
         self.include_router(user.router)
         self.include_router(bitfinex.router)
         self.include_router(experiment.router)
+        self.init_cache_registry()
+
+    def init_cache_registry(self):
+        @self.on_event('startup')
+        async def on_startup():
+            CacheRegistry.register(experiment.EXCHANGE_INSIGHT_CACHE_KEY,
+                                   create_cache(experiment.EXCHANGE_INSIGHT_CACHE_KEY,
+                                                ttl=timedelta(seconds=experiment.EXCHANGE_INSIGHT_CACHE_TTL)))
@@ -4,7 +4,7 @@ from lation.modules.coin.bitfinex_api_client import BitfinexAPIClient
 from lation.modules.customer.dependencies import get_current_user
 
 
-async def get_bitfinex_api_client(end_user=Depends(get_current_user)) -> BitfinexAPIClient:
+def get_bitfinex_api_client(end_user=Depends(get_current_user)) -> BitfinexAPIClient:
     end_user_bitfinex_config = end_user.end_user_bitfinex_config
     if not end_user_bitfinex_config:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Bitfinex config not found')
@@ -6,6 +6,7 @@ from lation.modules.base.models.end_user import EndUser
 from lation.modules.base.models.job import CoroutineScheduler, JobProducer, Scheduler
 from lation.modules.coin.bitfinex_api_client import BitfinexAPIClient
 from lation.modules.coin.models.config import EndUserBitfinexConfig
+from lation.modules.customer.models.entitlement import EndUserEntitlement
 
 
 ##############
@@ -27,7 +28,7 @@ def arg_max_ask_amount(book):
             max_ask_amount_index, max_ask_amount = i, amount
     return max_ask_amount_index
 
-@CoroutineScheduler.register_interval_job(10)
+@CoroutineScheduler.register_interval_job(10, executor=CoroutineScheduler.EXECUTOR_THREAD)
 async def calculate_recommended_funding_rate(get_session):
     global bitfinex_funding_market_recommended_ask_rates
     book_r0 = bitfinex_api_client.get_book('fUSD', 'R0', 100)
@@ -48,9 +49,10 @@ def apply_bitfinex_funding_strategy(cron_job) -> str:
                 EndUserBitfinexConfig.funding_strategy != None)\
         .all()
     ask_rate = get_bitfinex_funding_market_recommended_ask_rate()
-    for end_user in end_users:
-        if end_user.is_subscribed_to_any_products(['CFB']):
-            JobProducer(end_user).apply_bitfinex_funding_strategy(ask_rate)
+    entitled_end_user_ids = EndUserEntitlement.get_entitled_end_user_ids(session, [end_user.id for end_user in end_users], ['CFB'])
+    # a strategy takes seconds to talk to bitfinex, so every user is a message of its own to run concurrently
+    JobProducer.batch([end_user for end_user in end_users if end_user.id in entitled_end_user_ids], chunk_size=1)\
+        .apply_bitfinex_funding_strategy(ask_rate)
 
     end_user_ids = [end_user.id for end_user in end_users]
     return f'ask_rate={ask_rate}, end_user_ids={end_user_ids}'
@@ -23,7 +23,7 @@ async def get_bitfinex_metrics():
             tags=['bitfinex'],
             dependencies=[Depends(login_required), Depends(subscription_required(['CFB']))],
             response_model=Response[List[WalletSchema]])
-async def list_wallets(bitfinex_api_client=Depends(get_bitfinex_api_client)):
+def list_wallets(bitfinex_api_client=Depends(get_bitfinex_api_client)):
     wallets = bitfinex_api_client.get_user_wallets()
     return Response[List[WalletSchema]](status=StatusEnum.SUCCESS, data=wallets)
 
@@ -31,8 +31,8 @@ async def list_wallets(bitfinex_api_client=Depends(get_bitfinex_api_client)):
             tags=['bitfinex'],
             dependencies=[Depends(login_required), Depends(subscription_required(['CFB']))],
             response_model=Response[List[LedgerSchema]])
-async def list_30_day_interest_ledgers(currency:BitfinexAPIClient.CurrencyEnum,
-                                       bitfinex_api_client=Depends(get_bitfinex_api_client)):
+def list_30_day_interest_ledgers(currency:BitfinexAPIClient.CurrencyEnum,
+                                 bitfinex_api_client=Depends(get_bitfinex_api_client)):
     utc_now = datetime.utcnow()
     start = utc_now - timedelta(days=30)
     ledgers = bitfinex_api_client.get_user_ledgers(currency, start=start, end=utc_now, limit=40, category=BitfinexAPIClient.LedgerCategoryEnum.MARGIN_SWAP_INTEREST_PAYMENT)
@@ -42,7 +42,7 @@ async def list_30_day_interest_ledgers(currency:BitfinexAPIClient.CurrencyEnum,
             tags=['bitfinex'],
             dependencies=[Depends(login_required), Depends(subscription_required(['CFB']))],
             response_model=Response[List[FundingCreditSchema]])
-async def list_funding_credits(symbol:str, bitfinex_api_client=Depends(get_bitfinex_api_client)):
+def list_funding_credits(symbol:str, bitfinex_api_client=Depends(get_bitfinex_api_client)):
     funding_credits = bitfinex_api_client.get_user_funding_credits(symbol)
     return Response[List[FundingCreditSchema]](status=StatusEnum.SUCCESS, data=funding_credits)
 
@@ -50,7 +50,7 @@ async def list_funding_credits(symbol:str, bitfinex_api_client=Depends(get_bitfi
             tags=['bitfinex'],
             dependencies=[Depends(login_required), Depends(subscription_required(['CFB']))],
             response_model=Response[List[FundingOfferSchema]])
-async def list_funding_credits(symbol:str, bitfinex_api_client=Depends(get_bitfinex_api_client)):
+def list_funding_credits(symbol:str, bitfinex_api_client=Depends(get_bitfinex_api_client)):
     funding_offers = bitfinex_api_client.get_user_funding_offers(symbol)
     return Response[List[FundingOfferSchema]](status=StatusEnum.SUCCESS, data=funding_offers)
 
@@ -58,6 +58,6 @@ async def list_funding_credits(symbol:str, bitfinex_api_client=Depends(get_bitfi
              tags=['bitfinex'],
              dependencies=[Depends(login_required), Depends(subscription_required(['CFB']))],
              response_model=Response[UpdateFundingOfferSchema])
-async def cancel_funding_offer(offer_id:int, bitfinex_api_client=Depends(get_bitfinex_api_client)):
+def cancel_funding_offer(offer_id:int, bitfinex_api_client=Depends(get_bitfinex_api_client)):
     cancel_funding_offer = bitfinex_api_client.cancel_user_funding_offer(offer_id)
     return Response[UpdateFundingOfferSchema](status=StatusEnum.SUCCESS, data=cancel_funding_offer)
@@ -1,69 +1,171 @@
+import asyncio
 import csv
+import logging
 import os
 import random
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from bs4 import BeautifulSoup
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, status
 from fastapi.responses import FileResponse
 
-from lation.modules.base.http_client import HttpClient
+from lation.core.env import get_int_env
+from lation.modules.base.cache import CacheRegistry
+from lation.modules.base.http_client import AsyncHttpClient, HttpClient
 
 
+EXCHANGE_INSIGHT_CACHE_KEY = 'EXCHANGE_INSIGHT_CACHE'
+# seconds
+EXCHANGE_INSIGHT_SOURCE_TIMEOUT = get_int_env('EXCHANGE_INSIGHT_SOURCE_TIMEOUT', 10)
+EXCHANGE_INSIGHT_CACHE_TTL = get_int_env('EXCHANGE_INSIGHT_CACHE_TTL', 600)
+EXCHANGE_INSIGHT_PARTIAL_CACHE_TTL = get_int_env('EXCHANGE_INSIGHT_PARTIAL_CACHE_TTL', 60)
+
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
 class SymbolClient(HttpClient):
+    """
+    Requests are sent once and time out after `EXCHANGE_INSIGHT_SOURCE_TIMEOUT` seconds, so that the threads of a source
+    which exceeds it are released about when the source is given up, instead of piling up on `AsyncHttpClient.thread_pool`
+    """
+
+    REQUEST_OPTIONS = {
+        'timeout': EXCHANGE_INSIGHT_SOURCE_TIMEOUT,
+        'max_retries': 0,
+    }
+    # hosts of the sources, pointed at stub servers by tests
+    HOST_MAP = {
+        'top': 'https://coinmarketcap.com',
+        'binance': 'https://www.binance.com',
+        'huobi': 'https://www.huobi.com',
+        'coinbase': 'https://www.coinbase.com',
+        'okex': 'https://www.okex.com',
+        'ftx': 'https://ftx.com',
+    }
 
     def get_top_monthly_volume_symbols(self, n):
-        res = self.get('https://coinmarketcap.com/currencies/volume/monthly/')
+        res = self.get(f"{SymbolClient.HOST_MAP['top']}/currencies/volume/monthly/", **SymbolClient.REQUEST_OPTIONS)
+        res.raise_for_status()
         soup = BeautifulSoup(res.text, 'html.parser')
         cells = soup.find_all('td', class_='cmc-table__cell--sort-by__symbol')
         symbols = [cell.getText() for cell in cells]
+        if not symbols:
+            raise Exception('Cannot find any symbol in the top monthly volume table')
         return symbols[:n]
 
     # https://www.binance.com/en/markets
     def get_binance_symbols(self):
-        data = self.get_json('https://www.binance.com/gateway-api/v1/public/marketing/symbol/list')
+        data = self.get_json(f"{SymbolClient.HOST_MAP['binance']}/gateway-api/v1/public/marketing/symbol/list", **SymbolClient.REQUEST_OPTIONS)
         symbols = [datum['name'] for datum in data['data']]
         return symbols
 
     # https://www.huobi.com/zh-cn/assetintro/
     def get_huobi_symbols(self):
-        data = self.get_json('https://www.huobi.com/-/x/pro/v2/beta/common/currencies')
+        data = self.get_json(f"{SymbolClient.HOST_MAP['huobi']}/-/x/pro/v2/beta/common/currencies", **SymbolClient.REQUEST_OPTIONS)
         symbols = [datum['display_name'] for datum in data['data']]
         return symbols
 
+    COINBASE_PAGE_COUNT = 5
+
     # https://www.coinbase.com/price/s/listed?resolution=hour&page=2
+    def get_coinbase_symbols_page(self, page):
+        data = self.get_json(f"{SymbolClient.HOST_MAP['coinbase']}/api/v2/assets?filter=all&limit=30&page={page}", **SymbolClient.REQUEST_OPTIONS)
+        return [datum['symbol'] for datum in data['data']]
+
     def get_coinbase_symbols(self):
         symbols = []
-        for page in range(1,6):
-            data = self.get_json(f'https://www.coinbase.com/api/v2/assets?filter=all&limit=30&page={page}')
-            symbols += [datum['symbol'] for datum in data['data']]
+        for page in range(1, SymbolClient.COINBASE_PAGE_COUNT + 1):
+            symbols += self.get_coinbase_symbols_page(page)
         return symbols
 
     # https://www.okex.com/hk/markets/coin-list
     def get_okex_symbols(self):
-        data = self.get_json('https://www.okex.com/v2/support/info/announce/listProject')
+        data = self.get_json(f"{SymbolClient.HOST_MAP['okex']}/v2/support/info/announce/listProject", **SymbolClient.REQUEST_OPTIONS)
         symbols = [datum['project'] for datum in data['data']['list']]
         return symbols
 
     # https://ftx.com/markets
     def get_ftx_symbols(self):
-        data = self.get_json('https://ftx.com/api/coins')
+        data = self.get_json(f"{SymbolClient.HOST_MAP['ftx']}/api/coins", **SymbolClient.REQUEST_OPTIONS)
         symbols = [datum['id'] for datum in data['result']]
         return symbols
 
 
+EXCHANGE_SOURCE_NAMES = ('binance', 'huobi', 'coinbase', 'okex', 'ftx')
+
+# in-flight fetches keyed by cache key, so concurrent misses share a single fetch
+snapshot_task_map = {}
+
+async def fetch_coinbase_symbols(client:AsyncHttpClient):
+    pages = await asyncio.gather(*[client.run_sync(SymbolClient.get_coinbase_symbols_page, page)
+                                   for page in range(1, SymbolClient.COINBASE_PAGE_COUNT + 1)])
+    return [symbol for page in pages for symbol in page]
+
+async def fetch_source(name:str, coroutine):
+    try:
+        return await asyncio.wait_for(coroutine, timeout=EXCHANGE_INSIGHT_SOURCE_TIMEOUT)
+    except Exception as e:
+        logger.warning(f'Failed to fetch symbols of `{name}`: {e!r}')
+        return None
+
+async def fetch_exchange_insight_snapshot() -> dict:
+    """
+    Fetches every source concurrently, a source which fails or exceeds `EXCHANGE_INSIGHT_SOURCE_TIMEOUT` is `None`
+    """
+    client = AsyncHttpClient(SymbolClient())
+    source_coroutine_map = {
+        'top': client.run_sync(SymbolClient.get_top_monthly_volume_symbols, None),
+        'binance': client.run_sync(SymbolClient.get_binance_symbols),
+        'huobi': client.run_sync(SymbolClient.get_huobi_symbols),
+        'coinbase': fetch_coinbase_symbols(client),
+        'okex': client.run_sync(SymbolClient.get_okex_symbols),
+        'ftx': client.run_sync(SymbolClient.get_ftx_symbols),
+    }
+    results = await asyncio.gather(*[fetch_source(name, coroutine) for name, coroutine in source_coroutine_map.items()])
+    result_map = dict(zip(source_coroutine_map.keys(), results))
+    return {
+        'top_symbols': result_map['top'],
+        'exchange_symbols_map': {name: set(result_map[name]) if result_map[name] is not None else None
+                                 for name in EXCHANGE_SOURCE_NAMES},
+        'fetch_time': datetime.utcnow(),
+    }
+
+async def get_exchange_insight_snapshot() -> dict:
+    """
+    Snapshots are reused for `EXCHANGE_INSIGHT_CACHE_TTL` seconds, or `EXCHANGE_INSIGHT_PARTIAL_CACHE_TTL` seconds if any source is missing
+    """
+    cache = CacheRegistry.get(EXCHANGE_INSIGHT_CACHE_KEY) if CacheRegistry.has(EXCHANGE_INSIGHT_CACHE_KEY) else None
+    snapshot = cache.get(EXCHANGE_INSIGHT_CACHE_KEY) if cache is not None else None
+    if snapshot:
+        return snapshot
+    task = snapshot_task_map.get(EXCHANGE_INSIGHT_CACHE_KEY)
+    if not task:
+        task = asyncio.ensure_future(fetch_exchange_insight_snapshot())
+        snapshot_task_map[EXCHANGE_INSIGHT_CACHE_KEY] = task
+        task.add_done_callback(lambda task: snapshot_task_map.pop(EXCHANGE_INSIGHT_CACHE_KEY, None))
+    snapshot = await asyncio.shield(task)
+    if cache is not None and snapshot['top_symbols'] is not None:
+        is_partial = any(symbols is None for symbols in snapshot['exchange_symbols_map'].values())
+        ttl = EXCHANGE_INSIGHT_PARTIAL_CACHE_TTL if is_partial else EXCHANGE_INSIGHT_CACHE_TTL
+        cache.set(EXCHANGE_INSIGHT_CACHE_KEY, snapshot, ttl=timedelta(seconds=ttl))
+    return snapshot
+
 @router.get('/symbols/exchange-insight/download', tags=['experiment'])
 async def download_exchange_insight_symbols(top_n:int=50):
-    client = SymbolClient()
-    top_symbols = client.get_top_monthly_volume_symbols(top_n)
-    binance_symbols = client.get_binance_symbols()
-    huobi_symbols = client.get_huobi_symbols()
-    coinbase_symbols = client.get_coinbase_symbols()
-    okex_symbols = client.get_okex_symbols()
-    ftx_symbols = client.get_ftx_symbols()
+    snapshot = await get_exchange_insight_snapshot()
+    if snapshot['top_symbols'] is None:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail='Failed to fetch top volume symbols')
+    top_symbols = snapshot['top_symbols'][:top_n]
+    exchange_symbols_map = snapshot['exchange_symbols_map']
+    unavailable_source_names = [name for name, symbols in exchange_symbols_map.items() if symbols is None]
+
+    # symbols of unavailable sources are marked as unknown
+    def get_listed_value(name, symbol):
+        symbols = exchange_symbols_map[name]
+        if symbols is None:
+            return '?'
+        return 'yes' if symbol in symbols else ''
 
     datetime_str = datetime.utcnow().strftime("%Y_%m_%d_%H_%M_%S")
     file_path = os.path.join('./', f'exchange_insight_{datetime_str}_random_{random.randint(1, 1000)}.csv')
@@ -74,10 +176,8 @@ async def download_exchange_insight_symbols(top_n:int=50):
             writer.writerow({
                 'symbol': symbol,
                 'rank_by_30d_volume': i + 1,
-                'binance': 'yes' if symbol in binance_symbols else '',
-                'huobi': 'yes' if symbol in huobi_symbols else '',
-                'coinbase': 'yes' if symbol in coinbase_symbols else '',
-                'okex': 'yes' if symbol in okex_symbols else '',
-                'ftx': 'yes' if symbol in ftx_symbols else '',
+                **{name: get_listed_value(name, symbol) for name in EXCHANGE_SOURCE_NAMES},
             })
-    return FileResponse(file_path, filename=f'exchange_insight_{datetime_str}.csv')
+    return FileResponse(file_path,
+                        filename=f'exchange_insight_{datetime_str}.csv',
+                        headers={'X-Unavailable-Sources': ','.join(unavailable_source_names)})
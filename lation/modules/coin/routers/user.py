@@ -18,7 +18,7 @@ router = APIRouter()
             tags=['end_user'],
             dependencies=[Depends(login_required)],
             response_model=Response[EndUserBitfinexConfigSchema])
-async def get_bitfinex_config(end_user=Depends(get_current_user), session:Session=Depends(get_session)):
+def get_bitfinex_config(end_user=Depends(get_current_user), session:Session=Depends(get_session)):
     end_user_bitfinex_config = end_user.end_user_bitfinex_config
     if not end_user_bitfinex_config:
         end_user_bitfinex_config = EndUserBitfinexConfigSchema(funding_strategy=get_default_bitfinex_funding_strategy())
@@ -31,8 +31,8 @@ async def get_bitfinex_config(end_user=Depends(get_current_user), session:Sessio
              dependencies=[Depends(login_required)],
              response_model=Response[EndUserBitfinexConfigSchema])
 @managed_transaction
-async def update_bitfinex_config(config:EndUserBitfinexConfigSchema,
-                                 end_user=Depends(get_current_user), session:Session=Depends(get_session)):
+def update_bitfinex_config(config:EndUserBitfinexConfigSchema,
+                           end_user=Depends(get_current_user), session:Session=Depends(get_session)):
     end_user_bitfinex_config = end_user.end_user_bitfinex_config
     if not end_user_bitfinex_config:
         end_user_bitfinex_config = EndUserBitfinexConfig(end_user=end_user)
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from lation.core.env import get_int_env
+from lation.modules.base.cache import CacheRegistry
+from lation.modules.base.models.end_user import EndUser, EndUserToken
+
+
+ACCESS_TOKEN_CACHE_TTL = get_int_env('ACCESS_TOKEN_CACHE_TTL', 300)
+
+
+class AccessTokenCache():
+    """
+    Maps access token values to `{ end_user_token_id, end_user_id, expiration_time }`.
+    Entries never outlive the token itself, and are evicted once the deactivation of the token or its end user is committed,
+    evicting earlier would let a concurrent request cache the token again while the database still has it active.
+    Register a cache shared by workers under `CACHE_KEY` to keep workers consistent,
+    otherwise `ACCESS_TOKEN_CACHE_TTL` bounds how long other workers may accept a revoked token.
+    """
+
+    CACHE_KEY = 'ACCESS_TOKEN_CACHE'
+    # key of `session.info` collecting the token values to evict once the session commits
+    SESSION_INFO_KEY = 'access_token_cache_invalidated_token_values'
+
+    @classmethod
+    def get_cache(cls):
+        if not CacheRegistry.has(cls.CACHE_KEY):
+            return None
+        return CacheRegistry.get(cls.CACHE_KEY)
+
+    @classmethod
+    def get(cls, token_value: str) -> Optional[dict]:
+        cache = cls.get_cache()
+        if cache is None:
+            return None
+        entry = cache.get(token_value)
+        if not entry:
+            return None
+        if entry['expiration_time'] != None and entry['expiration_time'] <= datetime.utcnow().timestamp():
+            cache.evict(token_value)
+            return None
+        return entry
+
+    @classmethod
+    def set(cls, end_user_token: EndUserToken):
+        cache = cls.get_cache()
+        if cache is None:
+            return
+        ttl = timedelta(seconds=ACCESS_TOKEN_CACHE_TTL)
+        expiration_time = None
+        if end_user_token.expiration_time:
+            ttl = min(ttl, end_user_token.expiration_time - datetime.utcnow())
+            expiration_time = end_user_token.expiration_time.timestamp()
+        if ttl <= timedelta(0):
+            return
+        cache.set(end_user_token.value, {
+            'end_user_token_id': end_user_token.id,
+            'end_user_id': end_user_token.end_user_id,
+            'expiration_time': expiration_time,
+        }, ttl=ttl)
+
+    @classmethod
+    def invalidate(cls, token_value: str):
+        cache = cls.get_cache()
+        if cache is None or not token_value:
+            return
+        cache.evict(token_value)
+
+    @classmethod
+    def invalidate_on_commit(cls, session: Optional[Session], token_value: str):
+        if not token_value:
+            return
+        if not session:
+            cls.invalidate(token_value)
+            return
+        session.info.setdefault(cls.SESSION_INFO_KEY, set()).add(token_value)
+
+
+# values collected before a rollback are evicted by the next commit as well, which costs a database lookup only
+@event.listens_for(Session, 'after_commit')
+def on_session_after_commit(session):
+    for token_value in session.info.pop(AccessTokenCache.SESSION_INFO_KEY, ()):
+        AccessTokenCache.invalidate(token_value)
+
+@event.listens_for(EndUserToken.is_active, 'set', propagate=True)
+def on_end_user_token_is_active_set(end_user_token, value, oldvalue, initiator):
+    if not value:
+        AccessTokenCache.invalidate_on_commit(object_session(end_user_token), end_user_token.value)
+
+@event.listens_for(EndUser.is_active, 'set')
+def on_end_user_is_active_set(end_user, value, oldvalue, initiator):
+    if value:
+        return
+    session = object_session(end_user)
+    if not session or not end_user.id:
+        return
+    token_values = session.query(EndUserToken.value)\
+        .filter(EndUserToken.end_user_id == end_user.id, EndUserToken.is_active == True)\
+        .all()
+    for token_value, in token_values:
+        AccessTokenCache.invalidate_on_commit(session, token_value)
@@ -2,7 +2,9 @@ from datetime import timedelta
 
 from fastapi import Response
 
+from lation.modules.base.cache import CacheRegistry, create_cache
 from lation.modules.base_fastapi.base_fastapi import BaseFastAPI
+from lation.modules.customer.access_token_cache import AccessTokenCache
 
 
 class CustomerApp(BaseFastAPI):
@@ -15,12 +17,19 @@ class CustomerApp(BaseFastAPI):
 
         super().__init__()
         super().init_database()
+        self.init_access_token_cache()
         self.include_router(user.router)
         self.include_router(oauth.router)
         self.include_router(payment.router)
         self.include_router(product.router)
         self.include_router(subscription.router)
 
+    def init_access_token_cache(self):
+        @self.on_event('startup')
+        async def on_startup():
+            if not CacheRegistry.has(AccessTokenCache.CACHE_KEY):
+                CacheRegistry.register(AccessTokenCache.CACHE_KEY, create_cache(AccessTokenCache.CACHE_KEY))
+
 
 def lation_set_access_token(self, token_value:str, **kwargs):
     self.lation_set_cookie(CustomerApp.ACCESS_TOKEN_COOKIE_KEY,
@@ -1,13 +1,18 @@
+from datetime import datetime
 from typing import List, Optional
 
 from fastapi import Depends, HTTPException, Request, Response, Security, status
 from fastapi.security.api_key import APIKeyCookie, APIKeyHeader
-from sqlalchemy.orm import Session
+from sqlalchemy import or_
+from sqlalchemy.orm import Session, contains_eager, make_transient_to_detached
 
+from lation.core.database.session_executor import SessionExecutor
 from lation.modules.base.models.end_user import EndUser, EndUserToken
 from lation.modules.base.models.payment import PaymentGateway
-from lation.modules.base_fastapi.dependencies import get_session
+from lation.modules.base_fastapi.dependencies import get_session_executor
+from lation.modules.customer.access_token_cache import AccessTokenCache
 from lation.modules.customer.customer import CustomerApp
+from lation.modules.customer.models.entitlement import EndUserEntitlement
 from lation.modules.customer.models.platform import Platform
 
 
@@ -27,25 +32,50 @@ async def get_access_token(access_token_cookie:Optional[str]=Security(access_tok
     else:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Access token required')
 
-async def login_required(request:Request, access_token:str=Depends(get_access_token), session:Session=Depends(get_session)):
-    end_user_token = session.query(EndUserToken)\
-        .filter(EndUserToken.value == access_token, EndUserToken.is_active == True)\
-        .one_or_none()
+async def login_required(request:Request, access_token:str=Depends(get_access_token), session_executor:SessionExecutor=Depends(get_session_executor)):
+    cached_end_user_token = AccessTokenCache.get(access_token)
+    if cached_end_user_token:
+        request.state.end_user_token_id = cached_end_user_token['end_user_token_id']
+        request.state.end_user_id = cached_end_user_token['end_user_id']
+        return
+
+    def get_end_user_token(session:Session) -> Optional[EndUserToken]:
+        utc_now = datetime.utcnow()
+        return session.query(EndUserToken)\
+            .join(EndUserToken.end_user)\
+            .options(contains_eager(EndUserToken.end_user))\
+            .filter(EndUserToken.value == access_token,
+                    EndUserToken.is_active == True,
+                    or_(EndUserToken.expiration_time == None, utc_now < EndUserToken.expiration_time),
+                    EndUser.is_active == True)\
+            .one_or_none()
+
+    end_user_token = await session_executor.run_sync(get_end_user_token)
     if not end_user_token:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid access token')
-    request.state.end_user_token = end_user_token
+    AccessTokenCache.set(end_user_token)
+    request.state.end_user_token_id = end_user_token.id
+    request.state.end_user_id = end_user_token.end_user_id
+    request.state.end_user = end_user_token.end_user
 
-async def get_current_user(request:Request) -> EndUser:
-    end_user_token = request.state.end_user_token
-    return end_user_token.end_user
+async def get_current_user(request:Request, session_executor:SessionExecutor=Depends(get_session_executor)) -> EndUser:
+    end_user = getattr(request.state, 'end_user', None)
+    if end_user:
+        return end_user
+    # attach an unloaded end user to the session instead of querying it, attributes are loaded on first access
+    end_user = EndUser(id=request.state.end_user_id)
+    make_transient_to_detached(end_user)
+    return session_executor.session.merge(end_user, load=False)
 
-async def get_current_platform(session:Session=Depends(get_session)) -> Platform:
-    return session.query(Platform).one()
+async def get_current_platform(session_executor:SessionExecutor=Depends(get_session_executor)) -> Platform:
+    return await session_executor.run_sync(lambda session: session.query(Platform).one())
 
 def subscription_required(product_codes: List[str]):
 
-    async def product_inforce_required(end_user=Depends(get_current_user)):
-        if not end_user.is_subscribed_to_any_products(product_codes):
+    async def product_inforce_required(end_user=Depends(get_current_user),
+                                       session_executor:SessionExecutor=Depends(get_session_executor)):
+        entitled_end_user_ids = await session_executor.run_sync(EndUserEntitlement.get_entitled_end_user_ids, [end_user.id], product_codes)
+        if end_user.id not in entitled_end_user_ids:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Invalid subscription')
 
     return product_inforce_required
@@ -1 +1 @@
-from . import end_user, job, oauth_user, payment, platform, product, subscription
+from . import end_user, entitlement, job, oauth_user, payment, platform, product, subscription
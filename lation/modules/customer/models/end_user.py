@@ -1,27 +1,21 @@
-from datetime import datetime
 from typing import List
 
 from sqlalchemy.orm import object_session
 
-from lation.modules.base.models.end_user import EndUser
-from lation.modules.customer.models.product import Order, OrderPlan, Plan, Product
-from lation.modules.customer.models.subscription import Subscription
+from lation.modules.base.models.end_user import EndUser, EndUserToken
+from lation.modules.customer.access_token_cache import AccessTokenCache
+from lation.modules.customer.models.entitlement import EndUserEntitlement
 
 
 def is_subscribed_to_any_products(self, product_codes: List[str]):
     session = object_session(self)
-    utc_now = datetime.utcnow()
-    inforce_subscriptions = session.query(Subscription)\
-        .join(Subscription.order_plan)\
-        .join(OrderPlan.order)\
-        .join(OrderPlan.plan)\
-        .join(Plan.product)\
-        .filter(Subscription.subscribe_time <= utc_now, utc_now < Subscription.due_time)\
-        .filter(Order.end_user == self)\
-        .filter(Order.state == Order.StateEnum.EFFECTIVE.value)\
-        .filter(Product.code.in_(product_codes))\
-        .limit(1)\
-        .all()
-    return len(inforce_subscriptions) > 0
+    return self.id in EndUserEntitlement.get_entitled_end_user_ids(session, [self.id], product_codes)
 
 EndUser.is_subscribed_to_any_products = is_subscribed_to_any_products
+
+
+# the access token cache is invalidated by attribute event, see `AccessTokenCache`
+def deactivate(self):
+    self.is_active = False
+
+EndUserToken.deactivate = deactivate
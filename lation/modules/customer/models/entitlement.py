@@ -0,0 +1,74 @@
+from datetime import datetime
+from typing import Iterable, List, Optional, Set
+
+from sqlalchemy import Column, ForeignKey, event
+from sqlalchemy.orm import Session
+
+from lation.core.database.types import STRING_XS_SIZE, DateTime, Integer, String
+from lation.core.orm import Base
+from lation.modules.customer.models.product import Order, OrderPlan, Plan, Product
+from lation.modules.customer.models.subscription import Subscription
+
+
+class EndUserEntitlement(Base):
+    """
+    Denormalized `Subscription -> OrderPlan -> Order -> Plan -> Product` join of effective orders,
+    kept in sync on every flush touching orders or subscriptions
+    """
+    __tablename__ = 'end_user_entitlement'
+
+    end_user_id = Column(Integer, ForeignKey('end_user.id'), index=True)
+    product_code = Column(String(STRING_XS_SIZE), index=True, comment='Product code')
+    subscription_id = Column(Integer, ForeignKey('subscription.id'), index=True)
+    valid_from = Column(DateTime, index=True, comment='Subscribe time (UTC+0)')
+    valid_until = Column(DateTime, index=True, comment='Due time (UTC+0)')
+
+    @classmethod
+    def refresh(cls, session:Session, end_user_ids:Optional[Iterable[int]]=None):
+        table = cls.__table__
+        query = session.query(Order.end_user_id, Product.code, Subscription.id, Subscription.subscribe_time, Subscription.due_time)\
+            .select_from(Subscription)\
+            .join(Subscription.order_plan)\
+            .join(OrderPlan.order)\
+            .join(OrderPlan.plan)\
+            .join(Plan.product)\
+            .filter(Order.state == Order.StateEnum.EFFECTIVE.value)\
+            .filter(Order.end_user_id != None, Subscription.due_time != None)
+        delete_statement = table.delete()
+        if end_user_ids is not None:
+            end_user_ids = list(end_user_ids)
+            if len(end_user_ids) == 0:
+                return
+            query = query.filter(Order.end_user_id.in_(end_user_ids))
+            delete_statement = delete_statement.where(table.c.end_user_id.in_(end_user_ids))
+        session.execute(delete_statement)
+        session.execute(table.insert().from_select(
+            ['end_user_id', 'product_code', 'subscription_id', 'valid_from', 'valid_until'],
+            query.statement))
+
+    @classmethod
+    def get_entitled_end_user_ids(cls, session:Session, end_user_ids:List[int], product_codes:List[str]) -> Set[int]:
+        if len(end_user_ids) == 0:
+            return set()
+        utc_now = datetime.utcnow()
+        rows = session.query(cls.end_user_id)\
+            .filter(cls.end_user_id.in_(end_user_ids),
+                    cls.product_code.in_(product_codes),
+                    cls.valid_from <= utc_now,
+                    utc_now < cls.valid_until)\
+            .distinct()\
+            .all()
+        return {end_user_id for end_user_id, in rows}
+
+
+@event.listens_for(Session, 'after_flush')
+def refresh_flushed_end_user_entitlements(session, flush_context):
+    end_user_ids = set()
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, Order):
+            end_user_ids.add(instance.end_user_id)
+        elif isinstance(instance, Subscription) and instance.order_plan and instance.order_plan.order:
+            end_user_ids.add(instance.order_plan.order.end_user_id)
+    end_user_ids.discard(None)
+    if end_user_ids:
+        EndUserEntitlement.refresh(session, end_user_ids)
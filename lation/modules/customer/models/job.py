@@ -2,6 +2,7 @@ from sqlalchemy.orm import object_session
 
 from lation.modules.base.models.job import JobProducer, Scheduler
 from lation.modules.base.models.payment import PaymentGateway
+from lation.modules.customer.models.entitlement import EndUserEntitlement
 
 
 @Scheduler.register_cron_job()
@@ -11,3 +12,11 @@ def sync_payment(cron_job):
     for payment_gateway in payment_gateways:
         JobProducer(payment_gateway).sync_payment()
     return f'payment_gateways={payment_gateways}'
+
+
+@Scheduler.register_cron_job(execute_once_initialized=True)
+def refresh_end_user_entitlements(cron_job):
+    session = object_session(cron_job)
+    EndUserEntitlement.refresh(session)
+    count = session.query(EndUserEntitlement).count()
+    return f'entitlements={count}'
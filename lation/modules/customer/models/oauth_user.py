@@ -8,6 +8,8 @@ from sqlalchemy.orm import Session, backref, relationship
 from lation.core.database.types import JSON, STRING_L_SIZE, STRING_M_SIZE, STRING_S_SIZE, STRING_XS_SIZE, Integer, String
 from lation.core.orm import Base, JoinedTableInheritanceMixin
 from lation.modules.base.models.end_user import EndUser, EndUserEmail
+from lation.modules.base.models.job import JobProducer
+from lation.modules.base.models.message_queue import MessageBroker
 from lation.modules.base_fastapi.line_api_client import LineAPIClient
 from lation.modules.customer.schemas.oauth import BaseAuthorizationSchema, GoogleAuthorizationSchema, LineAuthorizationSchema
 
@@ -149,3 +151,7 @@ class LineUserToken(OAuthUserToken, OIDCMixin):
     __lation__ = {
         'polymorphic_identity': 'line_user_token'
     }
+
+
+MessageBroker.register_queue('notification')
+JobProducer.register_route(LineUser, 'push_message', queue_name='notification')
@@ -18,7 +18,7 @@ router = APIRouter()
 @router.get('/payment-gateways',
             tags=['payment'],
             response_model=Response[List[PaymentGatewaySchema]])
-async def list_payment_gateways(platform=Depends(get_current_platform)):
+def list_payment_gateways(platform=Depends(get_current_platform)):
     valid_payment_gateway_lation_ids = 'base.ecpay_staging_payment_gateway' if DEV else 'base.ecpay_payment_gateway'
     payment_gateways = [pg for pg in platform.payment_gateways if pg.lation_id in valid_payment_gateway_lation_ids]
     return Response[List[PaymentGatewaySchema]](status=StatusEnum.SUCCESS, data=payment_gateways)
@@ -27,24 +27,24 @@ async def list_payment_gateways(platform=Depends(get_current_platform)):
 @router.post('/payment-gateways/ecpay/callbacks/payment',
              tags=['payment'])
 @managed_transaction
-async def payment_ecpay_callback(MerchantID:str=Form(None),
-                                 MerchantTradeNo:str=Form(None),
-                                 StoreID:str=Form(None),
-                                 RtnCode:int=Form(None),
-                                 RtnMsg:str=Form(None),
-                                 TradeNo:str=Form(None),
-                                 TradeAmt:int=Form(None),
-                                 PaymentDate:str=Form(None),
-                                 PaymentType:str=Form(None),
-                                 PaymentTypeChargeFee:float=Form(None),
-                                 TradeDate:str=Form(None),
-                                 SimulatePaid:int=Form(None),
-                                 CustomField1:str=Form(None),
-                                 CustomField2:str=Form(None),
-                                 CustomField3:str=Form(None),
-                                 CustomField4:str=Form(None),
-                                 CheckMacValue:str=Form(None),
-                                 session:Session=Depends(get_session)):
+def payment_ecpay_callback(MerchantID:str=Form(None),
+                           MerchantTradeNo:str=Form(None),
+                           StoreID:str=Form(None),
+                           RtnCode:int=Form(None),
+                           RtnMsg:str=Form(None),
+                           TradeNo:str=Form(None),
+                           TradeAmt:int=Form(None),
+                           PaymentDate:str=Form(None),
+                           PaymentType:str=Form(None),
+                           PaymentTypeChargeFee:float=Form(None),
+                           TradeDate:str=Form(None),
+                           SimulatePaid:int=Form(None),
+                           CustomField1:str=Form(None),
+                           CustomField2:str=Form(None),
+                           CustomField3:str=Form(None),
+                           CustomField4:str=Form(None),
+                           CheckMacValue:str=Form(None),
+                           session:Session=Depends(get_session)):
     try:
         ECPayPaymentGateway.handle_payment_result(session, {
             'MerchantID': MerchantID,
@@ -72,11 +72,11 @@ async def payment_ecpay_callback(MerchantID:str=Form(None),
 
 @router.post('/payment-gateways/ecpay/callbacks/order-result',
              tags=['payment'])
-async def payment_ecpay_callback(MerchantTradeNo:str=Form(None),
-                                 RtnCode:int=Form(None),
-                                 CustomField3:str=Form(None),
-                                 CustomField4:str=Form(None),
-                                 session:Session=Depends(get_session)):
+def payment_ecpay_callback(MerchantTradeNo:str=Form(None),
+                           RtnCode:int=Form(None),
+                           CustomField3:str=Form(None),
+                           CustomField4:str=Form(None),
+                           session:Session=Depends(get_session)):
     is_verified, trade = ECPayPaymentGateway.verify_payment_result(session, {
         'MerchantTradeNo': MerchantTradeNo,
         'RtnCode': RtnCode,
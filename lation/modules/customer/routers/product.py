@@ -4,9 +4,10 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import HTMLResponse, RedirectResponse
 from sqlalchemy.orm import Session, contains_eager
 
+from lation.core.database.session_executor import SessionExecutor
 from lation.modules.base.models.payment import PaymentGateway
 from lation.modules.base_fastapi.decorators import managed_transaction
-from lation.modules.base_fastapi.dependencies import get_session
+from lation.modules.base_fastapi.dependencies import get_session, get_session_executor
 from lation.modules.base_fastapi.routers.schemas import ResponseSchema as Response, StatusEnum
 from lation.modules.customer.dependencies import login_required, get_current_user
 from lation.modules.customer.models.product import Product, Plan, Order, OrderPlan
@@ -18,7 +19,7 @@ router = APIRouter()
 @router.get('/products',
             tags=['product'],
             response_model=Response[List[ProductSchema]])
-async def list_products(session:Session=Depends(get_session)):
+def list_products(session:Session=Depends(get_session)):
     products = session.query(Product)\
         .outerjoin(Product.plans)\
         .options(
@@ -34,22 +35,26 @@ async def list_products(session:Session=Depends(get_session)):
             response_model=Response[List[OrderSchema]])
 @managed_transaction
 async def list_orders(end_user=Depends(get_current_user),
-                session:Session=Depends(get_session)):
-    orders = session.query(Order)\
-        .join(Order.order_plans)\
-        .join(OrderPlan.plan)\
-        .join(Plan.product)\
-        .filter(Order.end_user_id == end_user.id, Order.state.in_([Order.StateEnum.EFFECTIVE.value]))\
-        .options(
-            contains_eager(Order.order_plans)
-                .noload(OrderPlan.order))\
-        .options(
-            contains_eager(Order.order_plans)
-                .contains_eager(OrderPlan.plan)
-                .contains_eager(Plan.product)
-                .noload(Product.plans))\
-        .all()
-    return Response[List[OrderSchema]](status=StatusEnum.SUCCESS, data=orders)
+                session:SessionExecutor=Depends(get_session_executor)):
+    # build the response on the executor as well, since schema validation may lazy load relationships
+    def list_orders_sync(session:Session):
+        orders = session.query(Order)\
+            .join(Order.order_plans)\
+            .join(OrderPlan.plan)\
+            .join(Plan.product)\
+            .filter(Order.end_user_id == end_user.id, Order.state.in_([Order.StateEnum.EFFECTIVE.value]))\
+            .options(
+                contains_eager(Order.order_plans)
+                    .noload(OrderPlan.order))\
+            .options(
+                contains_eager(Order.order_plans)
+                    .contains_eager(OrderPlan.plan)
+                    .contains_eager(Plan.product)
+                    .noload(Product.plans))\
+            .all()
+        return Response[List[OrderSchema]](status=StatusEnum.SUCCESS, data=orders)
+
+    return await session.run_sync(list_orders_sync)
 
 
 @router.post('/orders',
@@ -57,7 +62,7 @@ async def list_orders(end_user=Depends(get_current_user),
             dependencies=[Depends(login_required)],
             response_model=Response[PrimitiveOrderSchema])
 @managed_transaction
-async def create_order(order_data:CreateOrderSchema,
+def create_order(order_data:CreateOrderSchema,
                  end_user=Depends(get_current_user),
                  session:Session=Depends(get_session)):
     plan = session.query(Plan).get(order_data.plan_id)
@@ -87,7 +92,7 @@ async def create_order(order_data:CreateOrderSchema,
             tags=['product'],
             dependencies=[Depends(login_required)])
 @managed_transaction
-async def charge_order(order_id:int, payment_gateway_id:int, session:Session=Depends(get_session)):
+def charge_order(order_id:int, payment_gateway_id:int, session:Session=Depends(get_session)):
     order = session.query(Order).get(order_id)
     if not order:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Order not found')
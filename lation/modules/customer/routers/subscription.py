@@ -4,8 +4,9 @@ from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session, contains_eager
 
+from lation.core.database.session_executor import SessionExecutor
 from lation.modules.base_fastapi.decorators import managed_transaction
-from lation.modules.base_fastapi.dependencies import get_session
+from lation.modules.base_fastapi.dependencies import get_session, get_session_executor
 from lation.modules.base_fastapi.routers.schemas import ResponseSchema as Response, StatusEnum
 from lation.modules.customer.dependencies import login_required, get_current_user
 from lation.modules.customer.models.product import Order, OrderPlan, Plan, Product
@@ -19,31 +20,35 @@ router = APIRouter()
             tags=['subscription'],
             dependencies=[Depends(login_required)],
             response_model=Response[List[SubscriptionSchema]])
-def list_subscriptionss(is_active:Optional[bool]=None,
-                        end_user=Depends(get_current_user),
-                        session:Session=Depends(get_session)):
-    query = session.query(Subscription)\
-        .join(Subscription.order_plan)\
-        .join(OrderPlan.order)\
-        .join(OrderPlan.plan)\
-        .join(Order.payment)\
-        .join(Plan.product)\
-        .filter(Order.end_user_id == end_user.id)\
-        .options(
-            contains_eager(Subscription.order_plan)
-                .contains_eager(OrderPlan.order)
-                .noload(Order.order_plans))\
-        .options(
-            contains_eager(Subscription.order_plan)
-                .contains_eager(OrderPlan.plan)
-                .contains_eager(Plan.product)
-                .noload(Product.plans))
-    if is_active == True:
-        query = query.filter(Subscription.unsubscribe_time == None)
-    elif is_active == False:
-        query = query.filter(Subscription.unsubscribe_time != None)
-    subscriptions = query.all()
-    return Response[List[SubscriptionSchema]](status=StatusEnum.SUCCESS, data=subscriptions)
+async def list_subscriptionss(is_active:Optional[bool]=None,
+                              end_user=Depends(get_current_user),
+                              session_executor:SessionExecutor=Depends(get_session_executor)):
+    # build the response on the executor as well, since schema validation may lazy load relationships
+    def list_subscriptions_sync(session:Session):
+        query = session.query(Subscription)\
+            .join(Subscription.order_plan)\
+            .join(OrderPlan.order)\
+            .join(OrderPlan.plan)\
+            .join(Order.payment)\
+            .join(Plan.product)\
+            .filter(Order.end_user_id == end_user.id)\
+            .options(
+                contains_eager(Subscription.order_plan)
+                    .contains_eager(OrderPlan.order)
+                    .noload(Order.order_plans))\
+            .options(
+                contains_eager(Subscription.order_plan)
+                    .contains_eager(OrderPlan.plan)
+                    .contains_eager(Plan.product)
+                    .noload(Product.plans))
+        if is_active == True:
+            query = query.filter(Subscription.unsubscribe_time == None)
+        elif is_active == False:
+            query = query.filter(Subscription.unsubscribe_time != None)
+        subscriptions = query.all()
+        return Response[List[SubscriptionSchema]](status=StatusEnum.SUCCESS, data=subscriptions)
+
+    return await session_executor.run_sync(list_subscriptions_sync)
 
 
 @router.post('/subscriptions',
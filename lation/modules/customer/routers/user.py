@@ -1,9 +1,11 @@
 from datetime import datetime, timedelta
-from fastapi import APIRouter, Depends, HTTPException, Response as FastAPIResponse, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response as FastAPIResponse, status
 from sqlalchemy.orm import Session
 from starlette.responses import RedirectResponse
 
 from lation.core.env import get_env
+from lation.modules.base.models.end_user import EndUserToken
+from lation.modules.base_fastapi.decorators import managed_transaction
 from lation.modules.base_fastapi.dependencies import get_session
 from lation.modules.base_fastapi.line_api_client import LineAPIClient
 from lation.modules.base_fastapi.routers.schemas import ResponseSchema as Response, StatusEnum
@@ -20,7 +22,12 @@ router = APIRouter()
              tags=['end_user'],
              dependencies=[Depends(login_required)],
              response_model=Response)
-def logout(response:FastAPIResponse, end_user=Depends(get_current_user)):
+@managed_transaction
+def logout(request:Request,
+           response:FastAPIResponse,
+           session:Session=Depends(get_session)):
+    end_user_token = session.query(EndUserToken).get(request.state.end_user_token_id)
+    end_user_token.deactivate()
     response.lation_unset_access_token()
     return Response(status=StatusEnum.SUCCESS)
 
@@ -0,0 +1,111 @@
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+
+class AccountState():
+    """
+    Balances, positions and open orders of an account kept up to date from the websocket `fills` and `orders` channels
+    https://docs.ftx.com/#fills-2
+    https://docs.ftx.com/#orders-2
+    Fills only move sizes, so the state is replaced by a REST snapshot on `reconcile`, and the leverage
+    of the snapshot is scaled by the change of the position notional since then.
+    """
+
+    # sizes closer to zero are rounding residues of applied fills
+    ZERO_SIZE = 1e-9
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.balance_map: Dict[str, dict] = {}
+        self.position_map: Dict[str, dict] = {}
+        self.open_order_map: Dict[int, dict] = {}
+        self.leverage: float = 0
+        self.position_notional: float = 0
+        self.reconcile_time: Optional[float] = None
+        self.applied_fill_count = 0
+
+    @staticmethod
+    def get_position_notional(position_map: Dict[str, dict], price_map: Dict[str, float]) -> float:
+        return sum(abs(position['net_size']) * price_map.get(future, 0) for future, position in position_map.items())
+
+    def is_stale(self, max_age: float, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        return self.reconcile_time is None or now - self.reconcile_time > max_age
+
+    def invalidate(self):
+        with self.lock:
+            self.reconcile_time = None
+
+    def reconcile(self, fetch_snapshot: Callable[[], Tuple[dict, dict, float]], price_map: Dict[str, float], max_retries: int = 3):
+        """
+        `fetch_snapshot` returns the balance map, position map and leverage over REST.
+        Fills arriving while fetching may or may not be in the snapshot, so it is fetched again until none arrives.
+        """
+        for _ in range(max_retries):
+            applied_fill_count = self.applied_fill_count
+            balance_map, position_map, leverage = fetch_snapshot()
+            with self.lock:
+                if applied_fill_count != self.applied_fill_count:
+                    continue
+                self.balance_map = balance_map
+                self.position_map = position_map
+                self.leverage = leverage
+                self.position_notional = AccountState.get_position_notional(position_map, price_map)
+                self.reconcile_time = time.time()
+                return
+        raise Exception(f'Account keeps filling while reconciling, gave up after {max_retries} retries')
+
+    def apply_fill(self, fill: dict):
+        sign = 1 if fill['side'] == 'buy' else -1
+        size = fill['size'] * sign
+        with self.lock:
+            if fill.get('future'):
+                self._add_position(fill['future'], size)
+            else:
+                self._add_balance(fill['baseCurrency'], size)
+                self._add_balance(fill['quoteCurrency'], -size * fill['price'])
+            if fill.get('fee') and fill.get('feeCurrency'):
+                self._add_balance(fill['feeCurrency'], -fill['fee'])
+            self.applied_fill_count += 1
+
+    def apply_order(self, order: dict):
+        with self.lock:
+            if order['status'] == 'closed':
+                self.open_order_map.pop(order['id'], None)
+            else:
+                self.open_order_map[order['id']] = order
+
+    def _add_balance(self, coin: str, amount: float):
+        total = self.balance_map.get(coin, {}).get('total', 0) + amount
+        if abs(total) < AccountState.ZERO_SIZE:
+            self.balance_map.pop(coin, None)
+        else:
+            self.balance_map[coin] = {'total': total}
+
+    def _add_position(self, future: str, size: float):
+        net_size = self.position_map.get(future, {}).get('net_size', 0) + size
+        if abs(net_size) < AccountState.ZERO_SIZE:
+            self.position_map.pop(future, None)
+        else:
+            self.position_map[future] = {'net_size': net_size}
+
+    def get_balance_map(self) -> Dict[str, dict]:
+        with self.lock:
+            return {coin: dict(balance) for coin, balance in self.balance_map.items()}
+
+    def get_position_map(self) -> Dict[str, dict]:
+        with self.lock:
+            return {future: dict(position) for future, position in self.position_map.items()}
+
+    # `None` if positions are opened from none since the snapshot, which leaves nothing to scale
+    def get_leverage(self, price_map: Dict[str, float]) -> Optional[float]:
+        with self.lock:
+            position_notional = AccountState.get_position_notional(self.position_map, price_map)
+            if not self.position_notional:
+                return self.leverage if not position_notional else None
+            return self.leverage * position_notional / self.position_notional
+
+    def has_open_orders(self, market_name: str) -> bool:
+        with self.lock:
+            return any(order['market'] == market_name for order in self.open_order_map.values())
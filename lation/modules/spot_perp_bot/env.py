@@ -1,4 +1,4 @@
-from lation.core.env import get_env
+from lation.core.env import get_env, get_int_env
 
 
 FTX_API_KEY_ROOT = get_env('FTX_API_KEY_ROOT')
@@ -12,3 +12,9 @@ FTX_API_SECRET_MOM = get_env('FTX_API_SECRET_MOM')
 
 FTX_API_KEY_SISTER = get_env('FTX_API_KEY_SISTER')
 FTX_API_SECRET_SISTER = get_env('FTX_API_SECRET_SISTER')
+
+# seconds, pairs with older tickers are not ranked, `0` ranks tickers of any age
+FTX_TICKER_MAX_AGE = get_int_env('FTX_TICKER_MAX_AGE', 300)
+
+# seconds, account states fed by websocket fills and orders are reconciled with REST at this interval, `0` reads REST every time
+FTX_ACCOUNT_RECONCILE_INTERVAL = get_int_env('FTX_ACCOUNT_RECONCILE_INTERVAL', 60)
@@ -3,24 +3,29 @@ import asyncio
 import enum
 import hmac
 import json
+import math
 import random
 import statistics
+import threading
 import time
 import urllib.parse
-import zlib
 from collections import defaultdict, deque
 from datetime import datetime, timedelta
 from decimal import ROUND_FLOOR, Decimal
-from itertools import zip_longest
-from typing import Any, DefaultDict, Deque, Dict, List, Optional, Tuple
+from typing import Any, Awaitable, Callable, DefaultDict, Deque, Dict, Iterable, List, Optional, Tuple
 
+import numpy as np
 from gevent.event import Event
 from pydantic.utils import deep_update
 from requests import Request, Session, Response
 
 from lation.core.logger import create_logger
 from lation.core.utils import RateLimiter, SingletonMetaclass
+from lation.modules.spot_perp_bot.account_state import AccountState
+from lation.modules.spot_perp_bot.env import FTX_ACCOUNT_RECONCILE_INTERVAL, FTX_TICKER_MAX_AGE
+from lation.modules.spot_perp_bot.orderbook import OrderBook
 from lation.modules.spot_perp_bot.schemas import FtxArbitrageStrategyConfig
+from lation.modules.spot_perp_bot.ticker_store import TickerStore
 from lation.modules.spot_perp_bot.websocket_manager import WebsocketManager
 
 
@@ -44,8 +49,14 @@ class FTXSpotFuturesArbitrageStrategy():
     ])
     white_list_coins = set(['FTT'])
 
-    pair_map = None
+    # shared by strategies of all accounts, tickers are written by the websocket thread
+    # and funding rates by the strategy holding `funding_rate_lock`, strategies read snapshots of it
+    ticker_store = None
+    # the websocket client of the strategy which created `ticker_store`, whose ticker listener feeds it
+    ticker_store_ws_client = None
+    ticker_store_lock = threading.Lock()
     last_funding_rate_update_time = None
+    funding_rate_lock = threading.Lock()
 
     class OrderDirection(str, enum.Enum):
         SPOT_LONG_PERP_SHORT = 'SPOT_LONG_PERP_SHORT'
@@ -74,6 +85,26 @@ class FTXSpotFuturesArbitrageStrategy():
         self.rest_api_client = rest_api_client
         self.ws_client = ws_client
         self.config = config
+        # jobs placing orders of the account run in separate threads, they must not trade at the same time
+        self.lock = threading.Lock()
+        # pairs of the strategy, in the order of `ticker_store` indexes
+        self.pair_map = None
+        self.pairs = None
+        self.ticker_store = None
+        # indexes of pairs with balances or positions as of the last fetch, `None` before the first fetch
+        self.held_pair_indexes: Optional[set] = None
+        # balances, positions and leverage are read from `account_state` unless the reconcile interval is `0`
+        self.account_state = AccountState()
+        self.account_ws_client = None
+        if FTX_ACCOUNT_RECONCILE_INTERVAL and rest_api_client.api_key:
+            self.account_ws_client = FtxAccountWebsocketClient(api_key=rest_api_client.api_key,
+                                                               api_secret=rest_api_client.api_secret,
+                                                               subaccount_name=rest_api_client.subaccount_name)
+            self.account_ws_client.add_fill_listener(self.account_state.apply_fill)
+            self.account_ws_client.add_order_listener(self.account_state.apply_order)
+            self.account_ws_client.add_reconnect_listener(self.account_state.invalidate)
+            self.account_ws_client.subscribe('fills')
+            self.account_ws_client.subscribe('orders')
         self.initialize_pair_map()
         self.update_spread_rate()
         # TODO: check margin funding is enabled
@@ -94,12 +125,21 @@ class FTXSpotFuturesArbitrageStrategy():
         self.config = FtxArbitrageStrategyConfig(**deep_update(self.config.dict(), partial_config))
         return self.get_config()
 
-    def get_current_leverage(self) -> float:
+    def fetch_current_leverage(self) -> float:
         account_info = self.rest_api_client.get_account_info()
         current_mf = account_info['marginFraction']
         current_leverage = 0 if not current_mf else 1 / current_mf
         return current_leverage
 
+    def get_current_leverage(self) -> float:
+        if not self.account_ws_client:
+            return self.fetch_current_leverage()
+        current_leverage = self.get_account_state().get_leverage(self.get_perp_price_map())
+        if current_leverage is None:
+            self.account_state.invalidate()
+            current_leverage = self.get_account_state().get_leverage(self.get_perp_price_map()) or 0
+        return current_leverage
+
     def get_market_name_map(self) -> dict:
         markets = self.rest_api_client.list_markets()
         market_name_map = {market['name']: market for market in markets}
@@ -138,31 +178,75 @@ class FTXSpotFuturesArbitrageStrategy():
                     'perp_min_provide_size': Decimal(str(perp_market['minProvideSize'])),
                     'min_provide_size': Decimal(str(max(spot_market['minProvideSize'], perp_market['minProvideSize']))),
                 }
-        cls.pair_map = pair_map
-
-    def update_spread_rate(self):
+        self.pair_map = pair_map
+        self.pairs = list(pair_map.values())
+        self.ticker_store = self.get_shared_ticker_store()
+
+    def get_shared_ticker_store(self) -> TickerStore:
+        """
+        Reuses the shared store if it has the pairs of the strategy, otherwise replaces it.
+        The replaced store stops receiving tickers, and its funding rates are carried over
+        since they are fetched once an hour only.
+        """
         cls = self.__class__
-        for pair_key, pair in cls.pair_map.items():
-            spot_ticker = self.ws_client.get_ticker(pair['spot_market_name'])
-            perp_ticker = self.ws_client.get_ticker(pair['perp_market_name'])
-            if not spot_ticker or not perp_ticker:
-                time.sleep(1)
-                self.update_spread_rate()
-                return
-            spot_price = (spot_ticker['bid'] + spot_ticker['ask']) / 2
-            perp_price = (perp_ticker['bid'] + perp_ticker['ask']) / 2
-            increase_spot_price = spot_ticker['ask']
-            increase_perp_price = perp_ticker['bid']
-            decrease_spot_price = spot_ticker['bid']
-            decrease_perp_price = perp_ticker['ask']
-            increase_spread_rate = (increase_perp_price - increase_spot_price) / increase_spot_price
-            decrease_spread_rate = (decrease_perp_price - decrease_spot_price) / decrease_spot_price
-            cls.pair_map[pair_key].update({
-                'spot_price': spot_price,
-                'perp_price': perp_price,
-                'increase_spread_rate': increase_spread_rate,
-                'decrease_spread_rate': decrease_spread_rate,
-            })
+        with cls.ticker_store_lock:
+            previous_ticker_store = cls.ticker_store
+            if previous_ticker_store and previous_ticker_store.pair_keys == list(self.pair_map.keys()):
+                return previous_ticker_store
+            ticker_store = TickerStore(list(self.pair_map.keys()),
+                                       [pair['spot_market_name'] for pair in self.pairs],
+                                       [pair['perp_market_name'] for pair in self.pairs])
+            ticker_store.is_valid[:] = [pair['is_valid'] for pair in self.pairs]
+            for pair in self.pairs:
+                ticker_store.update(pair['spot_market_name'], self.ws_client.get_ticker(pair['spot_market_name']))
+                ticker_store.update(pair['perp_market_name'], self.ws_client.get_ticker(pair['perp_market_name']))
+            if previous_ticker_store:
+                # each account has a client of its own, the listener is on the one of the strategy which created the store
+                cls.ticker_store_ws_client.remove_ticker_listener(previous_ticker_store.update)
+                for pair_key, i in ticker_store.pair_index_map.items():
+                    previous_i = previous_ticker_store.pair_index_map.get(pair_key)
+                    if previous_i is not None:
+                        ticker_store.funding_rate[i] = previous_ticker_store.funding_rate[previous_i]
+            self.ws_client.add_ticker_listener(ticker_store.update)
+            cls.ticker_store = ticker_store
+            cls.ticker_store_ws_client = self.ws_client
+            return ticker_store
+
+    def refresh_ticker_store(self) -> TickerStore:
+        # the shared store is replaced once a strategy of another account has other pairs, and is no longer updated then
+        cls = self.__class__
+        if self.ticker_store is not cls.ticker_store:
+            self.ticker_store = self.get_shared_ticker_store()
+        return self.ticker_store
+
+    def update_spread_rate(self) -> Dict[str, np.ndarray]:
+        """
+        Pairs whose tickers are missing or older than `FTX_TICKER_MAX_AGE` seconds are marked with `is_ticker_fresh=False`
+        and keep their last rates, instead of blocking until every ticker arrives
+        """
+        self.refresh_ticker_store()
+        spread_rate_map = self.ticker_store.get_spread_rates(max_age=FTX_TICKER_MAX_AGE or None)
+        for pair, spot_price, perp_price, increase_spread_rate, decrease_spread_rate, is_fresh, funding_rate in zip(
+            self.pairs,
+            spread_rate_map['spot_price'].tolist(),
+            spread_rate_map['perp_price'].tolist(),
+            spread_rate_map['increase_spread_rate'].tolist(),
+            spread_rate_map['decrease_spread_rate'].tolist(),
+            spread_rate_map['is_fresh'].tolist(),
+            self.ticker_store.funding_rate.tolist(),
+        ):
+            pair['is_ticker_fresh'] = is_fresh
+            # funding rates are fetched by any of the strategies sharing `ticker_store`
+            if not math.isnan(funding_rate):
+                pair['funding_rate'] = funding_rate
+            if is_fresh:
+                pair.update({
+                    'spot_price': spot_price,
+                    'perp_price': perp_price,
+                    'increase_spread_rate': increase_spread_rate,
+                    'decrease_spread_rate': decrease_spread_rate,
+                })
+        return spread_rate_map
 
     def should_update_funding_rate(self):
         # won't update funding rate within the same hour
@@ -180,14 +264,24 @@ class FTXSpotFuturesArbitrageStrategy():
         funding_rates_map = defaultdict(list)
         for fr in funding_rates:
             funding_rates_map[fr['future']].append(fr['rate'])
-        for base_currency, quote_currency in cls.pair_map:
+        for base_currency, quote_currency in self.pair_map:
             _, perp_market = FTXSpotFuturesArbitrageStrategy.get_pair_market(market_name_map, base_currency, quote_currency)
             funding_rates = funding_rates_map[perp_market['name']]
-            cls.pair_map[(base_currency, quote_currency)].update({
-                'funding_rate': statistics.mean(funding_rates),
+            funding_rate = statistics.mean(funding_rates)
+            self.pair_map[(base_currency, quote_currency)].update({
+                'funding_rate': funding_rate,
             })
+            self.ticker_store.funding_rate[self.ticker_store.pair_index_map[(base_currency, quote_currency)]] = funding_rate
         cls.last_funding_rate_update_time = datetime.utcnow()
 
+    # funding rates are shared, only one of the strategies running concurrently fetches them
+    def update_funding_rate_if_needed(self):
+        cls = self.__class__
+        with cls.funding_rate_lock:
+            if self.should_update_funding_rate():
+                market_name_map = self.get_market_name_map()
+                self.update_funding_rate(market_name_map)
+
     def get_too_much_currencies(self, balance_map: dict) -> List[str]:
         # check each coin shares balanced percentage
         usd_value = balance_map['USD']['total']
@@ -215,7 +309,7 @@ class FTXSpotFuturesArbitrageStrategy():
 
     def get_sorted_pairs_from_market(self, pair_direction: PairDirection, reverse=False) -> List[dict]:
         cls = self.__class__
-        self.update_spread_rate()
+        spread_rate_map = self.update_spread_rate()
 
         spread_rate_key = None
         if pair_direction == cls.PairDirection.INCREASE:
@@ -224,32 +318,22 @@ class FTXSpotFuturesArbitrageStrategy():
             spread_rate_key = 'decrease_spread_rate'
 
         # won't update funding rate within the same hour
-        if self.should_update_funding_rate():
-            market_name_map = self.get_market_name_map()
-            self.update_funding_rate(market_name_map)
-
-        # filter out risking pairs
-        pair_map = {key: pair for key, pair in cls.pair_map.items()
-                    # if pair['is_valid'] and pair[spread_rate_key] * pair['funding_rate'] > 0}
-                    if pair['is_valid']}
-        pairs = pair_map.values()
-
-        # sort by spread rate
-        spread_rate_pairs = [pair for pair in sorted(pairs, key=lambda pair: pair[spread_rate_key], reverse=True)]
-
-        for i, pair in enumerate(spread_rate_pairs):
-            pair_map[(pair['base_currency'], pair['quote_currency'])].update({
-                'spread_rate_rank': i,
+        self.update_funding_rate_if_needed()
+
+        # filter out risking pairs and pairs with stale tickers
+        ticker_store = self.ticker_store
+        mask = ticker_store.is_valid & spread_rate_map['is_fresh'] & np.isfinite(ticker_store.funding_rate)
+
+        # sort by the sum of the ranks of spread rate and funding rate
+        indexes, spread_rate_ranks, funding_rate_ranks = ticker_store.rank(spread_rate_map[spread_rate_key], mask, reverse=reverse)
+        sorted_pairs = []
+        for i, spread_rate_rank, funding_rate_rank in zip(indexes.tolist(), spread_rate_ranks.tolist(), funding_rate_ranks.tolist()):
+            pair = self.pairs[i]
+            pair.update({
+                'spread_rate_rank': spread_rate_rank,
+                'funding_rate_rank': funding_rate_rank,
             })
-
-        # sort by funding rate
-        funding_rate_pairs = [pair for pair in sorted(pairs, key=lambda pair: abs(pair['funding_rate']), reverse=True)]
-        for i, pair in enumerate(funding_rate_pairs):
-            pair_map[(pair['base_currency'], pair['quote_currency'])].update({
-                'funding_rate_rank': i,
-            })
-
-        sorted_pairs = sorted(pair_map.values(), key=lambda pair: pair['spread_rate_rank'] + pair['funding_rate_rank'], reverse=reverse)
+            sorted_pairs.append(pair)
         return sorted_pairs
 
     def get_best_pair_from_market(self, random_from_top_n: int = 3) -> Optional[dict]:
@@ -268,30 +352,40 @@ class FTXSpotFuturesArbitrageStrategy():
         cls = self.__class__
         sorted_pairs = self.get_sorted_pairs_from_market(cls.PairDirection.DECREASE, reverse=True)
         balance_map, position_map = self.get_asset_map()
-        pair_collections = []
-        for pair in sorted_pairs:
-            balance = balance_map.get(pair['base_currency'])
-            position = position_map.get(pair['perp_market_name'])
-            if not balance or not position:
-                continue
-            if balance['total'] <= 0 or position['net_size'] >= 0:
-                continue
-            if balance['total'] < pair['min_provide_size'] or -position['net_size'] < pair['min_provide_size']:
-                continue
-            pair_collections.append((pair, balance, position))
-        return pair_collections
+        return self.get_pair_collections(sorted_pairs, balance_map, position_map)
 
-    def get_balance_map(self) -> dict:
+    def fetch_balance_map(self) -> dict:
         balances = self.rest_api_client.list_wallet_balances()
         balance_map = {balance['coin']: {'total': balance['total']} for balance in balances if balance['total'] != 0}
         return balance_map
 
-    def get_position_map(self) -> dict:
+    def fetch_position_map(self) -> dict:
         positions = self.rest_api_client.list_positions()
         # netSize: Size of position. Positive if long, negative if short.
         position_map = {position['future']: {'net_size': position['netSize']} for position in positions if position['netSize'] != 0}
         return position_map
 
+    def fetch_account_snapshot(self) -> Tuple[dict, dict, float]:
+        return self.fetch_balance_map(), self.fetch_position_map(), self.fetch_current_leverage()
+
+    def get_perp_price_map(self) -> Dict[str, float]:
+        return {pair['perp_market_name']: pair['perp_price'] for pair in self.pairs if pair.get('perp_price')}
+
+    def get_account_state(self) -> AccountState:
+        if self.account_state.is_stale(FTX_ACCOUNT_RECONCILE_INTERVAL):
+            self.account_state.reconcile(self.fetch_account_snapshot, self.get_perp_price_map())
+        return self.account_state
+
+    def get_balance_map(self) -> dict:
+        if not self.account_ws_client:
+            return self.fetch_balance_map()
+        return self.get_account_state().get_balance_map()
+
+    def get_position_map(self) -> dict:
+        if not self.account_ws_client:
+            return self.fetch_position_map()
+        return self.get_account_state().get_position_map()
+
     def get_asset_map(self) -> Tuple[dict, dict]:
         return self.get_balance_map(), self.get_position_map()
 
@@ -299,7 +393,7 @@ class FTXSpotFuturesArbitrageStrategy():
         cls = self.__class__
         unique_base_currencies = set(['USD', 'USDT'])
         imbalanced_pairs = []
-        for pair in cls.pair_map.values():
+        for pair in self.pair_map.values():
             if pair['base_currency'] in unique_base_currencies:
                 continue
             unique_base_currencies.add(pair['base_currency'])
@@ -451,79 +545,98 @@ class FTXSpotFuturesArbitrageStrategy():
             order_market, order_side, order_price, order_size, type_=order_type, client_id=order_client_id)
         return order
 
+    async def increase_pair_by_rules(self, pair: dict, current_leverage: float):
+        if self.config.always_increase_pair.enabled and pair['increase_spread_rate'] > self.config.always_increase_pair.gt_spread_rate:
+            self.log_info(f"[pair always increasing...] @base_currency={pair['base_currency']} @spread={pair['increase_spread_rate']}")
+            try:
+                spot_order, perp_order = await self.increase_pair(pair, fixed_quote_amount=self.config.always_increase_pair.quote_amount)
+                self.log_info(f'- [pair always increased]')
+                self.log_info(f"- [spot] {spot_order['market']}: {spot_order['side']} amount {spot_order['size']}")
+                self.log_info(f"- [perp] {perp_order['market']}: {perp_order['side']} amount {perp_order['size']}")
+            except Exception as e:
+                self.log_error(f'- [pair unable to increase] {e}')
+        elif (
+            self.config.increase_pair.enabled and
+            current_leverage < self.config.increase_pair.lt_leverage and
+            pair['increase_spread_rate'] > self.config.increase_pair.gt_spread_rate
+        ):
+            leverage_diff = self.config.increase_pair.lt_leverage - current_leverage
+            fixed_quote_amount = FTXSpotFuturesArbitrageStrategy.get_quote_amount_from_rules(
+                abs(leverage_diff), self.config.increase_pair.leverage_diff_to_quote_amount_rules)
+            self.log_info(f"[pair increasing...] @leverage={current_leverage} @base_currency={pair['base_currency']} @spread={pair['increase_spread_rate']}")
+            try:
+                spot_order, perp_order = await self.increase_pair(pair, fixed_quote_amount=fixed_quote_amount)
+                self.log_info('- [pair increased]')
+                self.log_info(f"- [spot] {spot_order['market']}: {spot_order['side']} amount {spot_order['size']}")
+                self.log_info(f"- [perp] {perp_order['market']}: {perp_order['side']} amount {perp_order['size']}")
+            except Exception as e:
+                self.log_error(f'- [pair unable to increase] {e}')
+        else:
+            self.log_info(f"[pair skipped increase] @leverage={current_leverage} @base_currency={pair['base_currency']} @spread={pair['increase_spread_rate']}")
+
+    async def decrease_pair_collections_by_rules(self, pair_collections: List[Tuple[dict, dict, dict]], current_leverage: float):
+        is_always_decreased = False
+        if self.config.always_decrease_pair.enabled:
+            for pair, balance, position in pair_collections:
+                if pair['decrease_spread_rate'] < self.config.always_decrease_pair.lt_spread_rate:
+                    self.log_info(f"[pair always decreasing...] @base_currency={pair['base_currency']} @spread={pair['decrease_spread_rate']}")
+                    try:
+                        spot_order, perp_order = await self.decrease_pair(pair, balance, position, fixed_quote_amount=self.config.always_decrease_pair.quote_amount)
+                        is_always_decreased = True
+                        self.log_info(f'- [pair always decreased]')
+                        self.log_info(f"- [spot] {spot_order['market']}: {spot_order['side']} amount {spot_order['size']}")
+                        self.log_info(f"- [perp] {perp_order['market']}: {perp_order['side']} amount {perp_order['size']}")
+                    except Exception as e:
+                        self.log_error(f'- [pair unable to always decrease] {e}')
+        if not is_always_decreased and (
+            self.config.decrease_pair.enabled and
+            self.config.decrease_pair.gt_leverage < current_leverage <= self.config.close_pair.gt_leverage and
+            pair_collections
+        ):
+            pair, balance, position = pair_collections[0]
+            if pair['decrease_spread_rate'] < self.config.decrease_pair.lt_spread_rate:
+                leverage_diff = current_leverage - self.config.decrease_pair.gt_leverage
+                fixed_quote_amount = FTXSpotFuturesArbitrageStrategy.get_quote_amount_from_rules(
+                    abs(leverage_diff), self.config.decrease_pair.leverage_diff_to_quote_amount_rules)
+                self.log_info(f"[pair decreasing...] @leverage={current_leverage} @base_currency={pair['base_currency']} @spread={pair['decrease_spread_rate']}")
+                try:
+                    spot_order, perp_order = await self.decrease_pair(pair, balance, position, fixed_quote_amount=fixed_quote_amount)
+                    self.log_info('- [pair decreased]')
+                    self.log_info(f"- [spot] {spot_order['market']}: {spot_order['side']} amount {spot_order['size']}")
+                    self.log_info(f"- [perp] {perp_order['market']}: {perp_order['side']} amount {perp_order['size']}")
+                except Exception as e:
+                    self.log_error(f'- [pair unable to decrease] {e}')
+
+    def balance_pairs(self, pairs: List[dict], balance_map: dict, position_map: dict):
+        for pair in pairs:
+            # the other leg of a pair being made is still open
+            if self.account_state.has_open_orders(pair['spot_market_name']) or self.account_state.has_open_orders(pair['perp_market_name']):
+                continue
+            balance = balance_map.get(pair['base_currency'])
+            position = position_map.get(pair['perp_market_name'])
+            order = self.balance_pair(pair, balance, position)
+            if order:
+                self.log_info(f'[pair balanced]')
+                self.log_info(f"- {order['market']}: {order['side']} amount {order['size']}")
+
     async def execute(self):
+        is_event_driven = self.is_event_driven()
         current_leverage = 0
         if self.config.increase_pair.enabled or self.config.decrease_pair.enabled:
             current_leverage = self.get_current_leverage()
 
-        # increase pairs
-        if self.config.always_increase_pair.enabled or self.config.increase_pair.enabled:
+        # increase pairs, left to `run_event_loop` in event-driven mode
+        if not is_event_driven and (self.config.always_increase_pair.enabled or self.config.increase_pair.enabled):
             pair = self.get_best_pair_from_market()
             if not pair:
                 self.log_info(f'[no pair to (always) increase]')
             else:
-                if self.config.always_increase_pair.enabled and pair['increase_spread_rate'] > self.config.always_increase_pair.gt_spread_rate:
-                    self.log_info(f"[pair always increasing...] @base_currency={pair['base_currency']} @spread={pair['increase_spread_rate']}")
-                    try:
-                        spot_order, perp_order = await self.increase_pair(pair, fixed_quote_amount=self.config.always_increase_pair.quote_amount)
-                        self.log_info(f'- [pair always increased]')
-                        self.log_info(f"- [spot] {spot_order['market']}: {spot_order['side']} amount {spot_order['size']}")
-                        self.log_info(f"- [perp] {perp_order['market']}: {perp_order['side']} amount {perp_order['size']}")
-                    except Exception as e:
-                        self.log_error(f'- [pair unable to increase] {e}')
-                elif (
-                    self.config.increase_pair.enabled and
-                    current_leverage < self.config.increase_pair.lt_leverage and
-                    pair['increase_spread_rate'] > self.config.increase_pair.gt_spread_rate
-                ):
-                    leverage_diff = self.config.increase_pair.lt_leverage - current_leverage
-                    fixed_quote_amount = FTXSpotFuturesArbitrageStrategy.get_quote_amount_from_rules(
-                        abs(leverage_diff), self.config.increase_pair.leverage_diff_to_quote_amount_rules)
-                    self.log_info(f"[pair increasing...] @leverage={current_leverage} @base_currency={pair['base_currency']} @spread={pair['increase_spread_rate']}")
-                    try:
-                        spot_order, perp_order = await self.increase_pair(pair, fixed_quote_amount=fixed_quote_amount)
-                        self.log_info('- [pair increased]')
-                        self.log_info(f"- [spot] {spot_order['market']}: {spot_order['side']} amount {spot_order['size']}")
-                        self.log_info(f"- [perp] {perp_order['market']}: {perp_order['side']} amount {perp_order['size']}")
-                    except Exception as e:
-                        self.log_error(f'- [pair unable to increase] {e}')
-                else:
-                    self.log_info(f"[pair skipped increase] @leverage={current_leverage} @base_currency={pair['base_currency']} @spread={pair['increase_spread_rate']}")
+                await self.increase_pair_by_rules(pair, current_leverage)
 
-        # decrease pairs
-        if self.config.always_decrease_pair.enabled or self.config.decrease_pair.enabled:
+        # decrease pairs, left to `run_event_loop` in event-driven mode
+        if not is_event_driven and (self.config.always_decrease_pair.enabled or self.config.decrease_pair.enabled):
             pair_collections = self.get_worst_pair_collections_from_asset()
-            is_always_decreased = False
-            if self.config.always_decrease_pair.enabled:
-                for pair, balance, position in pair_collections:
-                    if pair['decrease_spread_rate'] < self.config.always_decrease_pair.lt_spread_rate:
-                        self.log_info(f"[pair always decreasing...] @base_currency={pair['base_currency']} @spread={pair['decrease_spread_rate']}")
-                        try:
-                            spot_order, perp_order = await self.decrease_pair(pair, balance, position, fixed_quote_amount=self.config.always_decrease_pair.quote_amount)
-                            is_always_decreased = True
-                            self.log_info(f'- [pair always decreased]')
-                            self.log_info(f"- [spot] {spot_order['market']}: {spot_order['side']} amount {spot_order['size']}")
-                            self.log_info(f"- [perp] {perp_order['market']}: {perp_order['side']} amount {perp_order['size']}")
-                        except Exception as e:
-                            self.log_error(f'- [pair unable to always decrease] {e}')
-            if not is_always_decreased and (
-                self.config.decrease_pair.enabled and
-                self.config.decrease_pair.gt_leverage < current_leverage <= self.config.close_pair.gt_leverage and
-                pair_collections
-            ):
-                pair, balance, position = pair_collections[0]
-                if pair['decrease_spread_rate'] < self.config.decrease_pair.lt_spread_rate:
-                    leverage_diff = current_leverage - self.config.decrease_pair.gt_leverage
-                    fixed_quote_amount = FTXSpotFuturesArbitrageStrategy.get_quote_amount_from_rules(
-                        abs(leverage_diff), self.config.decrease_pair.leverage_diff_to_quote_amount_rules)
-                    self.log_info(f"[pair decreasing...] @leverage={current_leverage} @base_currency={pair['base_currency']} @spread={pair['decrease_spread_rate']}")
-                    try:
-                        spot_order, perp_order = await self.decrease_pair(pair, balance, position, fixed_quote_amount=fixed_quote_amount)
-                        self.log_info('- [pair decreased]')
-                        self.log_info(f"- [spot] {spot_order['market']}: {spot_order['side']} amount {spot_order['size']}")
-                        self.log_info(f"- [perp] {perp_order['market']}: {perp_order['side']} amount {perp_order['size']}")
-                    except Exception as e:
-                        self.log_error(f'- [pair unable to decrease] {e}')
+            await self.decrease_pair_collections_by_rules(pair_collections, current_leverage)
 
         # close pairs
         if self.config.close_pair.gt_leverage < current_leverage:
@@ -542,14 +655,197 @@ class FTXSpotFuturesArbitrageStrategy():
 
         # balance pairs
         balance_map, position_map = self.get_asset_map()
+        self.update_held_pair_indexes(balance_map, position_map)
         imbalanced_pairs = self.get_imbalanced_pairs(balance_map, position_map)
-        for pair in imbalanced_pairs:
+        self.balance_pairs(imbalanced_pairs, balance_map, position_map)
+
+    def is_event_driven(self) -> bool:
+        return bool(self.config.event_driven and self.config.event_driven.enabled)
+
+    def update_held_pair_indexes(self, balance_map: dict, position_map: dict):
+        self.held_pair_indexes = set([i for i, pair in enumerate(self.pairs)
+                                      if pair['base_currency'] in balance_map or pair['perp_market_name'] in position_map])
+
+    def get_spread_rate_thresholds(self) -> Tuple[float, float]:
+        """
+        The lowest increase spread rate and the highest decrease spread rate at which any enabled rule may trade
+        """
+        increase_spread_rates = [math.inf]
+        if self.config.always_increase_pair.enabled:
+            increase_spread_rates.append(self.config.always_increase_pair.gt_spread_rate)
+        if self.config.increase_pair.enabled:
+            increase_spread_rates.append(self.config.increase_pair.gt_spread_rate)
+        decrease_spread_rates = [-math.inf]
+        if self.config.always_decrease_pair.enabled:
+            decrease_spread_rates.append(self.config.always_decrease_pair.lt_spread_rate)
+        if self.config.decrease_pair.enabled:
+            decrease_spread_rates.append(self.config.decrease_pair.lt_spread_rate)
+        return min(increase_spread_rates), max(decrease_spread_rates)
+
+    def get_crossed_pair_directions(self, market_name: str, now: Optional[float] = None) -> List[Tuple[int, PairDirection]]:
+        """
+        Pairs of `market_name` whose spread rates are across the thresholds, checked on every ticker message.
+        Only held pairs are worth decreasing, all of them are checked until the assets are fetched once.
+        """
+        cls = self.__class__
+        ticker_store = self.refresh_ticker_store()
+        increase_threshold, decrease_threshold = self.get_spread_rate_thresholds()
+        pair_directions = []
+        for _, i in ticker_store.market_index_map.get(market_name, ()):
+            spread_rates = ticker_store.get_spread_rate(i, now=now, max_age=FTX_TICKER_MAX_AGE or None)
+            if not spread_rates:
+                continue
+            increase_spread_rate, decrease_spread_rate = spread_rates
+            # unknown funding rates are checked after they are fetched
+            if increase_spread_rate > increase_threshold and ticker_store.is_valid[i] and not ticker_store.funding_rate[i] <= 0:
+                pair_directions.append((i, cls.PairDirection.INCREASE))
+            if decrease_spread_rate < decrease_threshold and (self.held_pair_indexes is None or i in self.held_pair_indexes):
+                pair_directions.append((i, cls.PairDirection.DECREASE))
+        return pair_directions
+
+    def get_pair_collections(self, pairs: List[dict], balance_map: dict, position_map: dict) -> List[Tuple[dict, dict, dict]]:
+        pair_collections = []
+        for pair in pairs:
             balance = balance_map.get(pair['base_currency'])
             position = position_map.get(pair['perp_market_name'])
-            order = self.balance_pair(pair, balance, position)
-            if order:
-                self.log_info(f'[pair balanced]')
-                self.log_info(f"- {order['market']}: {order['side']} amount {order['size']}")
+            if not balance or not position:
+                continue
+            if balance['total'] <= 0 or position['net_size'] >= 0:
+                continue
+            if balance['total'] < pair['min_provide_size'] or -position['net_size'] < pair['min_provide_size']:
+                continue
+            pair_collections.append((pair, balance, position))
+        return pair_collections
+
+    async def execute_pair_events(self, pair_directions: Iterable[Tuple[int, PairDirection]], filled_pair_indexes: Iterable[int]):
+        """
+        Re-evaluates only the given pairs with the rules of `execute`, fetching the account once for all of them
+        """
+        cls = self.__class__
+        pair_directions = set(pair_directions)
+        filled_pair_indexes = set(filled_pair_indexes)
+        self.update_spread_rate()
+        self.update_funding_rate_if_needed()
+
+        balance_map, position_map = self.get_asset_map()
+        self.update_held_pair_indexes(balance_map, position_map)
+
+        # balance filled pairs before trading on the same assets
+        if filled_pair_indexes:
+            filled_base_currencies = set([self.pairs[i]['base_currency'] for i in filled_pair_indexes])
+            imbalanced_pairs = [pair for pair in self.get_imbalanced_pairs(balance_map, position_map)
+                                if pair['base_currency'] in filled_base_currencies]
+            self.balance_pairs(imbalanced_pairs, balance_map, position_map)
+
+        increase_pairs = [self.pairs[i] for i, pair_direction in sorted(pair_directions) if pair_direction == cls.PairDirection.INCREASE]
+        decrease_pairs = [self.pairs[i] for i, pair_direction in sorted(pair_directions) if pair_direction == cls.PairDirection.DECREASE]
+        if not increase_pairs and not decrease_pairs:
+            return
+        current_leverage = 0
+        if self.config.increase_pair.enabled or self.config.decrease_pair.enabled:
+            current_leverage = self.get_current_leverage()
+
+        if increase_pairs:
+            increase_threshold, _ = self.get_spread_rate_thresholds()
+            too_much_currencies = self.get_too_much_currencies(balance_map)
+            crossed_pair_keys = set()
+            for pair in increase_pairs:
+                # tickers may have moved back while waiting for the lock
+                if not pair['is_ticker_fresh'] or not pair['is_valid'] or pair['increase_spread_rate'] <= increase_threshold:
+                    continue
+                if pair['base_currency'] in too_much_currencies or not pair.get('funding_rate', 0) > 0:
+                    continue
+                crossed_pair_keys.add((pair['base_currency'], pair['quote_currency']))
+            # like `execute`, at most one pair is increased per batch, so that the leverage read above stays under the cap
+            pair = next((pair for pair in self.get_sorted_pairs_from_market(cls.PairDirection.INCREASE)
+                         if (pair['base_currency'], pair['quote_currency']) in crossed_pair_keys), None)
+            if pair:
+                await self.increase_pair_by_rules(pair, current_leverage)
+
+        if decrease_pairs:
+            _, decrease_threshold = self.get_spread_rate_thresholds()
+            decrease_pairs = [pair for pair in decrease_pairs if pair['is_ticker_fresh'] and pair['decrease_spread_rate'] < decrease_threshold]
+            decrease_pairs.sort(key=lambda pair: pair['decrease_spread_rate'])
+            pair_collections = self.get_pair_collections(decrease_pairs, balance_map, position_map)
+            await self.decrease_pair_collections_by_rules(pair_collections, current_leverage)
+
+    async def run_event_loop(self):
+        """
+        Event-driven mode, runs until `config.event_driven` is disabled.
+        Ticker and fill messages are pushed from the websocket thread into an asyncio queue,
+        a pair is evaluated once its spread crosses a threshold, at most once per `debounce_seconds`,
+        and filled pairs are balanced once their fills settle.
+        """
+        cls = self.__class__
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        last_event_time_map: Dict[Tuple[int, str], float] = {}
+
+        # called in the websocket thread
+        def on_ticker(market_name: str, ticker: dict):
+            if not self.is_event_driven():
+                return
+            now = time.time()
+            for i, pair_direction in self.get_crossed_pair_directions(market_name, now=now):
+                if now - last_event_time_map.get((i, pair_direction), -math.inf) < self.config.event_driven.debounce_seconds:
+                    continue
+                last_event_time_map[(i, pair_direction)] = now
+                loop.call_soon_threadsafe(queue.put_nowait, (i, pair_direction))
+
+        def on_fill(fill: dict):
+            for _, i in self.ticker_store.market_index_map.get(fill.get('market'), ()):
+                loop.call_soon_threadsafe(queue.put_nowait, (i, None))
+
+        # fills of the shared market data client are of the account it logs in as
+        fill_ws_client = self.account_ws_client or self.ws_client
+        self.ws_client.add_ticker_listener(on_ticker)
+        fill_ws_client.add_fill_listener(on_fill)
+        if not self.account_ws_client:
+            self.ws_client.get_fills()
+        self.log_info('[event loop started]')
+        settle_time_map: Dict[int, float] = {}
+        try:
+            while self.is_event_driven():
+                timeout = 1
+                if settle_time_map:
+                    timeout = max(0, min(timeout, min(settle_time_map.values()) - loop.time()))
+                events = []
+                try:
+                    events.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    pass
+                while not queue.empty():
+                    events.append(queue.get_nowait())
+
+                pair_directions = set()
+                for i, pair_direction in events:
+                    if pair_direction:
+                        pair_directions.add((i, pair_direction))
+                    else:
+                        settle_time_map[i] = loop.time() + self.config.event_driven.fill_settle_seconds
+                now = loop.time()
+                filled_pair_indexes = [i for i, settle_time in settle_time_map.items() if settle_time <= now]
+                for i in filled_pair_indexes:
+                    del settle_time_map[i]
+                if not pair_directions and not filled_pair_indexes:
+                    continue
+
+                try:
+                    with self.lock:
+                        await self.execute_pair_events(pair_directions, filled_pair_indexes)
+                except Exception as e:
+                    self.log_error(f'[event loop failed] {e}')
+        finally:
+            self.ws_client.remove_ticker_listener(on_ticker)
+            fill_ws_client.remove_fill_listener(on_fill)
+            self.log_info('[event loop stopped]')
+
+    def run_exclusively(self, func: Callable[[FTXSpotFuturesArbitrageStrategy], Awaitable]) -> Any:
+        """
+        Runs coroutine function `func` of the strategy in a new event loop of the calling thread, holding the account lock
+        """
+        with self.lock:
+            return asyncio.run(func(self))
 
     async def decrease_negative_funding_payment_pairs(self):
         cls = self.__class__
@@ -567,7 +863,7 @@ class FTXSpotFuturesArbitrageStrategy():
         balance_map, position_map = self.get_asset_map()
         for perp_market_name, payments in funding_payment_map.items():
             if all([p > 0 for p in payments]):
-                pair = next((pair for pair in cls.pair_map.values() if pair['perp_market_name'] == perp_market_name), None)
+                pair = next((pair for pair in self.pair_map.values() if pair['perp_market_name'] == perp_market_name), None)
                 if not pair:
                     continue
                 balance = balance_map.get(pair['base_currency'])
@@ -582,6 +878,8 @@ class FTXSpotFuturesArbitrageStrategy():
 
         self.update_spread_rate()
         for pair, balance, position in evictable_candidates:
+            if not pair['is_ticker_fresh']:
+                continue
             if abs(pair['decrease_spread_rate']) < self.config.garbage_collect.lt_spread_rate:
                 spot_order, perp_order = await self.decrease_pair(pair, balance, position)
 
@@ -727,6 +1025,8 @@ class FtxWebsocketClient(WebsocketManager, metaclass=SingletonMetaclass):
         self._api_key = api_key
         self._api_secret = api_secret
         self._orderbook_update_events: DefaultDict[str, Event] = defaultdict(Event)
+        self._ticker_listeners: List[Callable[[str, Dict], None]] = []
+        self._fill_listeners: List[Callable[[Dict], None]] = []
         self._reset_data()
 
     def _on_open(self, ws):
@@ -738,8 +1038,7 @@ class FtxWebsocketClient(WebsocketManager, metaclass=SingletonMetaclass):
         self._tickers: DefaultDict[str, Dict] = defaultdict(dict)
         self._orderbook_timestamps: DefaultDict[str, float] = defaultdict(float)
         self._orderbook_update_events.clear()
-        self._orderbooks: DefaultDict[str, Dict[str, DefaultDict[float, float]]] = defaultdict(
-            lambda: {side: defaultdict(float) for side in {'bids', 'asks'}})
+        self._orderbooks: DefaultDict[str, OrderBook] = defaultdict(OrderBook)
         self._orderbook_timestamps.clear()
         self._logged_in = False
         self._last_received_orderbook_data_at: float = 0.0
@@ -794,20 +1093,13 @@ class FtxWebsocketClient(WebsocketManager, metaclass=SingletonMetaclass):
             self._subscribe(subscription)
         return list(self._trades[market].copy())
 
-    def get_orderbook(self, market: str) -> Dict[str, List[Tuple[float, float]]]:
+    def get_orderbook(self, market: str, depth: Optional[int] = None) -> Dict[str, List[Tuple[float, float]]]:
         subscription = {'channel': 'orderbook', 'market': market}
         if subscription not in self._subscriptions:
             self._subscribe(subscription)
         if self._orderbook_timestamps[market] == 0:
             self.wait_for_orderbook_update(market, 5)
-        return {
-            side: sorted(
-                [(price, quantity) for price, quantity in list(self._orderbooks[market][side].items())
-                 if quantity],
-                key=lambda order: order[0] * (-1 if side == 'bids' else 1)
-            )
-            for side in {'bids', 'asks'}
-        }
+        return self._orderbooks[market].get_levels(depth)
 
     def get_orderbook_timestamp(self, market: str) -> float:
         return self._orderbook_timestamps[market]
@@ -832,23 +1124,10 @@ class FtxWebsocketClient(WebsocketManager, metaclass=SingletonMetaclass):
         data = message['data']
         if data['action'] == 'partial':
             self._reset_orderbook(market)
-        for side in {'bids', 'asks'}:
-            book = self._orderbooks[market][side]
-            for price, size in data[side]:
-                if size:
-                    book[price] = size
-                else:
-                    del book[price]
-            self._orderbook_timestamps[market] = data['time']
-        checksum = data['checksum']
-        orderbook = self.get_orderbook(market)
-        checksum_data = [
-            ':'.join([f'{float(order[0])}:{float(order[1])}' for order in (bid, offer) if order])
-            for (bid, offer) in zip_longest(orderbook['bids'][:100], orderbook['asks'][:100])
-        ]
-
-        computed_result = int(zlib.crc32(':'.join(checksum_data).encode()))
-        if computed_result != checksum:
+        orderbook = self._orderbooks[market]
+        orderbook.apply(data)
+        self._orderbook_timestamps[market] = data['time']
+        if orderbook.get_checksum() != data['checksum']:
             self._last_received_orderbook_data_at = 0
             self._reset_orderbook(market)
             self._unsubscribe({'market': market, 'channel': 'orderbook'})
@@ -860,11 +1139,31 @@ class FtxWebsocketClient(WebsocketManager, metaclass=SingletonMetaclass):
     def _handle_trades_message(self, message: Dict) -> None:
         self._trades[message['market']].append(message['data'])
 
+    def add_ticker_listener(self, listener: Callable[[str, Dict], None]) -> None:
+        if listener not in self._ticker_listeners:
+            self._ticker_listeners.append(listener)
+
+    def remove_ticker_listener(self, listener: Callable[[str, Dict], None]) -> None:
+        if listener in self._ticker_listeners:
+            self._ticker_listeners.remove(listener)
+
     def _handle_ticker_message(self, message: Dict) -> None:
         self._tickers[message['market']] = message['data']
+        for listener in self._ticker_listeners:
+            listener(message['market'], message['data'])
+
+    def add_fill_listener(self, listener: Callable[[Dict], None]) -> None:
+        if listener not in self._fill_listeners:
+            self._fill_listeners.append(listener)
+
+    def remove_fill_listener(self, listener: Callable[[Dict], None]) -> None:
+        if listener in self._fill_listeners:
+            self._fill_listeners.remove(listener)
 
     def _handle_fills_message(self, message: Dict) -> None:
         self._fills.append(message['data'])
+        for listener in self._fill_listeners:
+            listener(message['data'])
 
     def _handle_orders_message(self, message: Dict) -> None:
         data = message['data']
@@ -892,3 +1191,91 @@ class FtxWebsocketClient(WebsocketManager, metaclass=SingletonMetaclass):
             self._handle_fills_message(message)
         elif channel == 'orders':
             self._handle_orders_message(message)
+
+
+class FtxAccountWebsocketClient(WebsocketManager):
+    """
+    Private `fills` and `orders` channels of an account.
+    `FtxWebsocketClient` is shared by all accounts for market data and logs in as one of them only.
+    """
+    _ENDPOINT = 'wss://ftx.com/ws/'
+
+    def __init__(self, api_key: str, api_secret: str, subaccount_name: str = None) -> None:
+        super().__init__()
+        self._api_key = api_key
+        self._api_secret = api_secret
+        self._subaccount_name = subaccount_name
+        self._channels: List[str] = []
+        self._fill_listeners: List[Callable[[Dict], None]] = []
+        self._order_listeners: List[Callable[[Dict], None]] = []
+        self._reconnect_listeners: List[Callable[[], None]] = []
+
+    def _get_url(self) -> str:
+        return self._ENDPOINT
+
+    def _login(self) -> None:
+        ts = int(time.time() * 1000)
+        args = {
+            'key': self._api_key,
+            'sign': hmac.new(
+                self._api_secret.encode(), f'{ts}websocket_login'.encode(), 'sha256').hexdigest(),
+            'time': ts,
+        }
+        if self._subaccount_name:
+            args['subaccount'] = self._subaccount_name
+        self.send_json({'op': 'login', 'args': args})
+
+    def subscribe(self, channel: str) -> None:
+        if channel in self._channels:
+            return
+        if not self._channels:
+            self._login()
+        self.send_json({'op': 'subscribe', 'channel': channel})
+        self._channels.append(channel)
+
+    # messages in between are lost, listeners are told to fetch the account again
+    def _reconnect(self, ws):
+        is_current_ws = ws is self.ws
+        super()._reconnect(ws)
+        if not is_current_ws or not self._channels:
+            return
+        self._login()
+        for channel in self._channels:
+            self.send_json({'op': 'subscribe', 'channel': channel})
+        for listener in self._reconnect_listeners:
+            listener()
+
+    def add_fill_listener(self, listener: Callable[[Dict], None]) -> None:
+        if listener not in self._fill_listeners:
+            self._fill_listeners.append(listener)
+
+    def remove_fill_listener(self, listener: Callable[[Dict], None]) -> None:
+        if listener in self._fill_listeners:
+            self._fill_listeners.remove(listener)
+
+    def add_order_listener(self, listener: Callable[[Dict], None]) -> None:
+        if listener not in self._order_listeners:
+            self._order_listeners.append(listener)
+
+    def add_reconnect_listener(self, listener: Callable[[], None]) -> None:
+        if listener not in self._reconnect_listeners:
+            self._reconnect_listeners.append(listener)
+
+    def _on_message(self, ws, raw_message: str) -> None:
+        message = json.loads(raw_message)
+        message_type = message['type']
+        if message_type in {'subscribed', 'unsubscribed'}:
+            return
+        elif message_type == 'info':
+            if message['code'] == 20001:
+                return self.reconnect()
+        elif message_type == 'error':
+            raise Exception(message)
+        channel = message['channel']
+
+        if channel == 'fills':
+            for listener in self._fill_listeners:
+                listener(message['data'])
+        elif channel == 'orders':
+            for listener in self._order_listeners:
+                listener(message['data'])
@@ -1,3 +1,6 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 
 from lation.modules.base.models.job import CoroutineScheduler
@@ -12,6 +15,8 @@ from lation.modules.spot_perp_bot.schemas import FtxArbitrageStrategyConfig
 
 
 ftx_spot_futures_arbitrage_strategies = []
+# threads running `FTXSpotFuturesArbitrageStrategy.run_event_loop` keyed by strategy
+ftx_spot_futures_arbitrage_strategy_event_loop_thread_map = {}
 
 default_strategy_config = FtxArbitrageStrategyConfig(
     alarm=FtxArbitrageStrategyConfig.AlarmConfig(),
@@ -30,61 +35,70 @@ default_strategy_config = FtxArbitrageStrategyConfig(
     ),
     always_decrease_pair=FtxArbitrageStrategyConfig.AlwaysDecreasePairConfig(),
     close_pair=FtxArbitrageStrategyConfig.ClosePairConfig(),
-    garbage_collect=FtxArbitrageStrategyConfig.GarbageCollectConfig()
+    garbage_collect=FtxArbitrageStrategyConfig.GarbageCollectConfig(),
+    event_driven=FtxArbitrageStrategyConfig.EventDrivenConfig()
 )
 
-if FTX_API_KEY_ROOT and FTX_API_SECRET_ROOT:
-    ftx_spot_futures_arbitrage_strategies.append(
-        FTXSpotFuturesArbitrageStrategy(
-            FTXRestAPIClient(api_key=FTX_API_KEY_ROOT,
-                             api_secret=FTX_API_SECRET_ROOT,
-                             subaccount_name=None),
-            FtxWebsocketClient(api_key=FTX_API_KEY_ROOT,
-                               api_secret=FTX_API_SECRET_ROOT),
-            default_strategy_config))
+# account name, api key, api secret, subaccount name
+ftx_accounts = [
+    ('root', FTX_API_KEY_ROOT, FTX_API_SECRET_ROOT, None),
+    ('me', FTX_API_KEY_ME, FTX_API_SECRET_ME, '期现套利子帳戶'),
+    ('mom', FTX_API_KEY_MOM, FTX_API_SECRET_MOM, '媽媽'),
+    ('sister', FTX_API_KEY_SISTER, FTX_API_SECRET_SISTER, '姊姊'),
+]
 
-if FTX_API_KEY_ME and FTX_API_SECRET_ME:
-    ftx_spot_futures_arbitrage_strategies.append(
-        FTXSpotFuturesArbitrageStrategy(
-            FTXRestAPIClient(api_key=FTX_API_KEY_ME,
-                             api_secret=FTX_API_SECRET_ME,
-                             subaccount_name='期现套利子帳戶'),
-            FtxWebsocketClient(api_key=FTX_API_KEY_ME,
-                               api_secret=FTX_API_SECRET_ME),
-            default_strategy_config))
+# each account runs `execute` and garbage collection in its own threads
+ftx_spot_futures_arbitrage_strategy_thread_pool = ThreadPoolExecutor(
+    max_workers=2 * len(ftx_accounts), thread_name_prefix='lation-ftx-strategy')
 
-if FTX_API_KEY_MOM and FTX_API_SECRET_MOM:
-    ftx_spot_futures_arbitrage_strategies.append(
-        FTXSpotFuturesArbitrageStrategy(
-            FTXRestAPIClient(api_key=FTX_API_KEY_MOM,
-                             api_secret=FTX_API_SECRET_MOM,
-                             subaccount_name='媽媽'),
-            FtxWebsocketClient(api_key=FTX_API_KEY_MOM,
-                               api_secret=FTX_API_SECRET_MOM),
-            default_strategy_config))
+def register_ftx_spot_futures_arbitrage_strategy_jobs(account_name: str, strategy: FTXSpotFuturesArbitrageStrategy):
+    """
+    Jobs of each account are scheduled on their own, so that slow REST calls of an account skip its own ticks only
+    """
 
-if FTX_API_KEY_SISTER and FTX_API_SECRET_SISTER:
-    ftx_spot_futures_arbitrage_strategies.append(
-        FTXSpotFuturesArbitrageStrategy(
-            FTXRestAPIClient(api_key=FTX_API_KEY_SISTER,
-                             api_secret=FTX_API_SECRET_SISTER,
-                             subaccount_name='姊姊'),
-            FtxWebsocketClient(api_key=FTX_API_KEY_SISTER,
-                               api_secret=FTX_API_SECRET_SISTER),
-            default_strategy_config))
+    async def execute_ftx_spot_futures_arbitrage_strategy(get_session):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(ftx_spot_futures_arbitrage_strategy_thread_pool,
+                                   strategy.run_exclusively, FTXSpotFuturesArbitrageStrategy.execute)
 
+    async def execute_ftx_spot_futures_arbitrage_strategy_garbage_collection(get_session):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(ftx_spot_futures_arbitrage_strategy_thread_pool,
+                                   strategy.run_exclusively, FTXSpotFuturesArbitrageStrategy.decrease_negative_funding_payment_pairs)
 
-@CoroutineScheduler.register_interval_job(15)
-async def execute_ftx_spot_futures_arbitrage_strategies(get_session):
-    for strategy in ftx_spot_futures_arbitrage_strategies:
-        await strategy.execute()
+    for func in (execute_ftx_spot_futures_arbitrage_strategy, execute_ftx_spot_futures_arbitrage_strategy_garbage_collection):
+        func.__name__ = f'{func.__name__}_{account_name}'
+        CoroutineScheduler.register_interval_job(15)(func)
+
+for account_name, api_key, api_secret, subaccount_name in ftx_accounts:
+    if not api_key or not api_secret:
+        continue
+    strategy = FTXSpotFuturesArbitrageStrategy(
+        FTXRestAPIClient(api_key=api_key,
+                         api_secret=api_secret,
+                         subaccount_name=subaccount_name),
+        FtxWebsocketClient(api_key=api_key,
+                           api_secret=api_secret),
+        default_strategy_config)
+    ftx_spot_futures_arbitrage_strategies.append(strategy)
+    register_ftx_spot_futures_arbitrage_strategy_jobs(account_name, strategy)
 
+
+# (re)starts the event loops of event-driven strategies, e.g. after being enabled by config, each loop owns a thread
 @CoroutineScheduler.register_interval_job(15)
-async def execute_ftx_spot_futures_arbitrage_strategy_garbage_collections(get_session):
+async def start_ftx_spot_futures_arbitrage_strategy_event_loops(get_session):
     for strategy in ftx_spot_futures_arbitrage_strategies:
-        await strategy.decrease_negative_funding_payment_pairs()
+        thread = ftx_spot_futures_arbitrage_strategy_event_loop_thread_map.get(strategy)
+        if not strategy.is_event_driven() or (thread and thread.is_alive()):
+            continue
+        thread = threading.Thread(target=asyncio.run,
+                                  args=(strategy.run_event_loop(),),
+                                  name='lation-ftx-event-loop',
+                                  daemon=True)
+        ftx_spot_futures_arbitrage_strategy_event_loop_thread_map[strategy] = thread
+        thread.start()
 
-@CoroutineScheduler.register_interval_job(120)
+@CoroutineScheduler.register_interval_job(120, executor=CoroutineScheduler.EXECUTOR_THREAD)
 async def ftx_spot_futures_arbitrage_strategy_alarms(get_session):
     messages = []
     for strategy in ftx_spot_futures_arbitrage_strategies:
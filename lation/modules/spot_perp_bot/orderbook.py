@@ -0,0 +1,98 @@
+import bisect
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+
+class OrderBookSide():
+    """
+    Price levels of one side kept in a sorted array, so that updates cost a binary search plus an array shift
+    and the best levels are read without sorting. Bids are stored by negated price to share the ascending order.
+    The checksum text of each level is formatted once when the level is updated.
+    """
+
+    def __init__(self, descending: bool = False):
+        self.sign = -1 if descending else 1
+        self.keys: List[float] = []
+        self.size_map: Dict[float, float] = {}
+        self.text_map: Dict[float, str] = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def clear(self):
+        self.keys = []
+        self.size_map = {}
+        self.text_map = {}
+
+    def update(self, price: float, size: float):
+        key = price * self.sign
+        if size:
+            if key not in self.size_map:
+                bisect.insort(self.keys, key)
+            self.size_map[key] = size
+            self.text_map[key] = f'{float(price)}:{float(size)}'
+        elif key in self.size_map:
+            del self.size_map[key]
+            del self.text_map[key]
+            del self.keys[bisect.bisect_left(self.keys, key)]
+
+    def get_levels(self, depth: Optional[int] = None) -> List[Tuple[float, float]]:
+        keys = self.keys[:depth]
+        levels = []
+        for key in keys:
+            # the level may be removed by the websocket thread while reading
+            size = self.size_map.get(key)
+            if size:
+                levels.append((key * self.sign, size))
+        return levels
+
+    def get_texts(self, depth: Optional[int] = None) -> List[str]:
+        texts = [self.text_map.get(key) for key in self.keys[:depth]]
+        return [text for text in texts if text]
+
+    def get_best(self) -> Optional[Tuple[float, float]]:
+        levels = self.get_levels(1)
+        return levels[0] if levels else None
+
+
+class OrderBook():
+    """
+    Incremental order book of a FTX market
+    https://docs.ftx.com/#orderbooks
+    """
+
+    CHECKSUM_DEPTH = 100
+
+    def __init__(self):
+        self.bids = OrderBookSide(descending=True)
+        self.asks = OrderBookSide()
+        self.timestamp: float = 0.0
+
+    def clear(self):
+        self.bids.clear()
+        self.asks.clear()
+        self.timestamp = 0.0
+
+    def apply(self, data: dict):
+        if data['action'] == 'partial':
+            self.clear()
+        for price, size in data['bids']:
+            self.bids.update(price, size)
+        for price, size in data['asks']:
+            self.asks.update(price, size)
+        self.timestamp = data['time']
+
+    def get_levels(self, depth: Optional[int] = None) -> Dict[str, List[Tuple[float, float]]]:
+        return {
+            'bids': self.bids.get_levels(depth),
+            'asks': self.asks.get_levels(depth),
+        }
+
+    # https://docs.ftx.com/#orderbooks, levels are interleaved as `bid_price:bid_size:ask_price:ask_size:...`
+    def get_checksum(self, depth: int = CHECKSUM_DEPTH) -> int:
+        bid_texts = self.bids.get_texts(depth)
+        ask_texts = self.asks.get_texts(depth)
+        common_depth = min(len(bid_texts), len(ask_texts))
+        checksum_texts = [text for pair in zip(bid_texts, ask_texts) for text in pair]
+        checksum_texts.extend(bid_texts[common_depth:] or ask_texts[common_depth:])
+        return int(zlib.crc32(':'.join(checksum_texts).encode()))
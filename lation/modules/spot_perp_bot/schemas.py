@@ -46,6 +46,13 @@ class FtxArbitrageStrategyConfig(BaseModel):
         enabled: bool = False
         lt_spread_rate: float = 0.001
 
+    class EventDrivenConfig(BaseModel):
+        enabled: bool = False
+        # seconds, a pair is evaluated as soon as its spread crosses a threshold, then at most once per `debounce_seconds`
+        debounce_seconds: float = 15.0
+        # seconds, a filled pair is balanced once no more fills of it arrive within `fill_settle_seconds`
+        fill_settle_seconds: float = 2.0
+
     alarm: Optional[FtxArbitrageStrategyConfig.AlarmConfig]
     increase_pair: Optional[FtxArbitrageStrategyConfig.IncreasePairConfig]
     always_increase_pair: Optional[FtxArbitrageStrategyConfig.AlwaysIncreasePairConfig]
@@ -53,6 +60,7 @@ class FtxArbitrageStrategyConfig(BaseModel):
     always_decrease_pair: Optional[FtxArbitrageStrategyConfig.AlwaysDecreasePairConfig]
     close_pair: Optional[FtxArbitrageStrategyConfig.ClosePairConfig]
     garbage_collect: Optional[FtxArbitrageStrategyConfig.GarbageCollectConfig]
+    event_driven: Optional[FtxArbitrageStrategyConfig.EventDrivenConfig]
 
 FtxArbitrageStrategyConfig.IncreasePairConfig.update_forward_refs()
 FtxArbitrageStrategyConfig.DecreasePairConfig.update_forward_refs()
@@ -0,0 +1,104 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class TickerStore():
+    """
+    Bid, ask and receive time of the spot and perp tickers of every pair, kept in arrays indexed by pair
+    so that spread rates of all pairs are computed in one vectorised pass.
+    Missing prices are `nan`, and pairs whose tickers are missing or older than `max_age` are masked out as stale.
+    """
+
+    SPOT = 'spot'
+    PERP = 'perp'
+
+    def __init__(self, pair_keys: List[Tuple[str, str]], spot_market_names: List[str], perp_market_names: List[str]):
+        pair_count = len(pair_keys)
+        self.pair_keys = list(pair_keys)
+        self.pair_index_map = {pair_key: i for i, pair_key in enumerate(self.pair_keys)}
+        self.spot_bid = np.full(pair_count, np.nan)
+        self.spot_ask = np.full(pair_count, np.nan)
+        self.spot_time = np.full(pair_count, np.nan)
+        self.perp_bid = np.full(pair_count, np.nan)
+        self.perp_ask = np.full(pair_count, np.nan)
+        self.perp_time = np.full(pair_count, np.nan)
+        self.funding_rate = np.full(pair_count, np.nan)
+        self.is_valid = np.zeros(pair_count, dtype=bool)
+        # a market may be a leg of several pairs
+        self.market_index_map: Dict[str, List[Tuple[str, int]]] = {}
+        for i, (spot_market_name, perp_market_name) in enumerate(zip(spot_market_names, perp_market_names)):
+            self.market_index_map.setdefault(spot_market_name, []).append((TickerStore.SPOT, i))
+            self.market_index_map.setdefault(perp_market_name, []).append((TickerStore.PERP, i))
+
+    def __len__(self):
+        return len(self.pair_keys)
+
+    def update(self, market_name: str, ticker: dict, receive_time: Optional[float] = None):
+        if not ticker:
+            return
+        receive_time = time.time() if receive_time is None else receive_time
+        bid = ticker.get('bid')
+        ask = ticker.get('ask')
+        bid = np.nan if bid is None else bid
+        ask = np.nan if ask is None else ask
+        for leg, i in self.market_index_map.get(market_name, ()):
+            if leg == TickerStore.SPOT:
+                self.spot_bid[i], self.spot_ask[i], self.spot_time[i] = bid, ask, receive_time
+            else:
+                self.perp_bid[i], self.perp_ask[i], self.perp_time[i] = bid, ask, receive_time
+
+    def get_fresh_mask(self, now: Optional[float] = None, max_age: Optional[float] = None) -> np.ndarray:
+        with np.errstate(invalid='ignore'):
+            is_fresh = (self.spot_bid > 0) & (self.spot_ask > 0) & (self.perp_bid > 0) & (self.perp_ask > 0)
+            if max_age is not None:
+                now = time.time() if now is None else now
+                is_fresh &= (now - np.fmin(self.spot_time, self.perp_time)) <= max_age
+        return is_fresh
+
+    def get_spread_rates(self, now: Optional[float] = None, max_age: Optional[float] = None) -> Dict[str, np.ndarray]:
+        """
+        Increasing a pair buys spot at ask and sells perp at bid, decreasing sells spot at bid and buys perp at ask.
+        Rates of stale pairs are `nan`.
+        """
+        is_fresh = self.get_fresh_mask(now=now, max_age=max_age)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            spot_price = (self.spot_bid + self.spot_ask) / 2
+            perp_price = (self.perp_bid + self.perp_ask) / 2
+            increase_spread_rate = (self.perp_bid - self.spot_ask) / self.spot_ask
+            decrease_spread_rate = (self.perp_ask - self.spot_bid) / self.spot_bid
+        return {
+            'spot_price': np.where(is_fresh, spot_price, np.nan),
+            'perp_price': np.where(is_fresh, perp_price, np.nan),
+            'increase_spread_rate': np.where(is_fresh, increase_spread_rate, np.nan),
+            'decrease_spread_rate': np.where(is_fresh, decrease_spread_rate, np.nan),
+            'is_fresh': is_fresh,
+        }
+
+    def get_spread_rate(self, i: int, now: Optional[float] = None, max_age: Optional[float] = None) -> Optional[Tuple[float, float]]:
+        """
+        Increase and decrease spread rates of a single pair, cheap enough to run on every ticker message.
+        Returns `None` if the pair is stale.
+        """
+        spot_bid, spot_ask = float(self.spot_bid[i]), float(self.spot_ask[i])
+        perp_bid, perp_ask = float(self.perp_bid[i]), float(self.perp_ask[i])
+        # comparisons with `nan` are false
+        if not (spot_bid > 0 and spot_ask > 0 and perp_bid > 0 and perp_ask > 0):
+            return None
+        if max_age is not None:
+            now = time.time() if now is None else now
+            if not now - min(float(self.spot_time[i]), float(self.perp_time[i])) <= max_age:
+                return None
+        return (perp_bid - spot_ask) / spot_ask, (perp_ask - spot_bid) / spot_bid
+
+    # indexes of the masked pairs ordered by the sum of their ranks of spread rate, descending, and absolute funding rate, descending
+    def rank(self, spread_rate: np.ndarray, mask: np.ndarray, reverse: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        indexes = np.flatnonzero(mask)
+        spread_rate_ranks = np.empty(len(indexes), dtype=int)
+        spread_rate_ranks[np.argsort(-spread_rate[indexes], kind='stable')] = np.arange(len(indexes))
+        funding_rate_ranks = np.empty(len(indexes), dtype=int)
+        funding_rate_ranks[np.argsort(-np.abs(self.funding_rate[indexes]), kind='stable')] = np.arange(len(indexes))
+        rank_sums = spread_rate_ranks + funding_rate_ranks
+        order = np.argsort(-rank_sums if reverse else rank_sums, kind='stable')
+        return indexes[order], spread_rate_ranks[order], funding_rate_ranks[order]
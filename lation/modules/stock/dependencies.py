@@ -1,6 +1,6 @@
-from lation.modules.base.cache import CacheRegistry, MemoryCache
+from lation.modules.base.cache import Cache, CacheRegistry
 
 
-async def get_memory_cache() -> MemoryCache:
+async def get_memory_cache() -> Cache:
     from lation.modules.stock.stock import StockFastApp
     return CacheRegistry.get(StockFastApp.CACHE_KEY)
\ No newline at end of file
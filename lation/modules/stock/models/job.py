@@ -12,7 +12,6 @@ from lation.modules.customer.models.oauth_user import LineUser
 from lation.modules.customer.models.product import Order, OrderPlan, Plan
 from lation.modules.customer.models.subscription import Subscription
 from lation.modules.stock.ptt_web_client import PttWebClient
-from lation.modules.stock.routers.ptt import PTT_PUSH_CONTENT_CACHE_KEY
 
 
 jieba.set_dictionary((Path(__file__).parent / '../data/dict.txt.big.txt').resolve())
@@ -74,15 +73,14 @@ def send_ptt_wordcloud_notification(cron_job):
         .all()
     utc_now = datetime.utcnow()
     today_date_str = utc_now.strftime('%Y-%m-%d')
-    for line_user in line_users:
-        JobProducer(line_user).push_message([
-            {
-                'type': 'text',
-                'text': f'{today_date_str} 股市風向雲如附圖，股票精靈感謝您的訂閱！',
-            },
-            {
-                'type': 'image',
-                'originalContentUrl': 'https://stock-api.lation.app:5555/static/latest-push-content-cut-words.png',
-                'previewImageUrl': 'https://stock.lation.app/logo.png',
-            },
-        ])
+    JobProducer.batch(line_users).push_message([
+        {
+            'type': 'text',
+            'text': f'{today_date_str} 股市風向雲如附圖，股票精靈感謝您的訂閱！',
+        },
+        {
+            'type': 'image',
+            'originalContentUrl': 'https://stock-api.lation.app:5555/static/latest-push-content-cut-words.png',
+            'previewImageUrl': 'https://stock.lation.app/logo.png',
+        },
+    ])
@@ -3,13 +3,14 @@ from pathlib import Path
 
 from fastapi.staticfiles import StaticFiles
 
-from lation.modules.base.cache import CacheRegistry, MemoryCache
+from lation.modules.base.cache import CacheRegistry, create_cache
+from lation.modules.base_fastapi.decorators import RESPONSE_CACHE_KEY
 from lation.modules.customer.customer import CustomerApp
 from lation.modules.stock.routers import experiment, ptt
 
 
 class StockFastApp(CustomerApp):
-    CACHE_KEY = 'API_RESPONSE_MEMORY_CACHE'
+    CACHE_KEY = RESPONSE_CACHE_KEY
 
     def __init__(self):
         super().__init__()
@@ -23,7 +24,7 @@ class StockFastApp(CustomerApp):
 
         @self.on_event('startup')
         async def on_startup():
-            CacheRegistry.register(cls.CACHE_KEY, MemoryCache(ttl=timedelta(minutes=15)))
+            CacheRegistry.register(cls.CACHE_KEY, create_cache(cls.CACHE_KEY, ttl=timedelta(minutes=15)))
 
         @self.on_event('shutdown')
         async def on_shutdown():
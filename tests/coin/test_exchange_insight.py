@@ -0,0 +1,189 @@
+import csv
+import io
+import os
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from lation.modules.base.cache import CacheRegistry, MemoryCache
+from lation.modules.coin.routers import experiment
+from lation.modules.coin.routers.experiment import SymbolClient
+
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'exchange_insight')
+
+# request paths of the sources and the recorded responses they are served
+SOURCE_ROUTE_MAP = {
+    '/currencies/volume/monthly/': ('top', 'top.html'),
+    '/gateway-api/v1/public/marketing/symbol/list': ('binance', 'binance.json'),
+    '/-/x/pro/v2/beta/common/currencies': ('huobi', 'huobi.json'),
+    '/api/v2/assets': ('coinbase', 'coinbase.json'),
+    '/v2/support/info/announce/listProject': ('okex', 'okex.json'),
+    '/api/coins': ('ftx', 'ftx.json'),
+}
+
+
+class StubSourceServer(ThreadingHTTPServer):
+    """
+    Serves the recorded responses of every source, `status_map` and `delay_map` override the status and delay of a source
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubSourceHandler)
+        self.status_map = {}
+        self.delay_map = {}
+        self.hit_count_map = {source: 0 for source, _ in SOURCE_ROUTE_MAP.values()}
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_port}'
+
+
+class StubSourceHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        source, file_name = SOURCE_ROUTE_MAP[self.path.split('?')[0]]
+        self.server.hit_count_map[source] += 1
+        time.sleep(self.server.delay_map.get(source, 0))
+        status = self.server.status_map.get(source, 200)
+        with open(os.path.join(FIXTURE_DIR, file_name), 'rb') as f:
+            body = f.read() if status == 200 else b'Internal Server Error'
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html' if file_name.endswith('.html') else 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up on a slow source
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeClock():
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = StubSourceServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(SymbolClient, 'HOST_MAP', {source: server.url for source in SymbolClient.HOST_MAP})
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(CacheRegistry, 'cache_map', {})
+    CacheRegistry.register(experiment.EXCHANGE_INSIGHT_CACHE_KEY,
+                           MemoryCache(ttl=timedelta(seconds=experiment.EXCHANGE_INSIGHT_CACHE_TTL), clock=clock))
+    return clock
+
+@pytest.fixture
+def client(monkeypatch, tmp_path, clock):
+    # exported files are written to the working directory
+    monkeypatch.chdir(tmp_path)
+    app = FastAPI()
+    app.include_router(experiment.router)
+    return TestClient(app)
+
+def download(client) -> tuple:
+    res = client.get('/symbols/exchange-insight/download')
+    rows = list(csv.DictReader(io.StringIO(res.text))) if res.status_code == 200 else None
+    return res, rows
+
+def test_download_lists_symbols_of_every_source(server, client):
+    res, rows = download(client)
+
+    assert res.status_code == 200
+    assert res.headers['X-Unavailable-Sources'] == ''
+    assert [row['symbol'] for row in rows] == ['BTC', 'ETH', 'USDT', 'XRP', 'DOT']
+    assert rows[4] == {'symbol': 'DOT', 'rank_by_30d_volume': '5', 'binance': 'yes', 'huobi': '', 'coinbase': '', 'okex': 'yes', 'ftx': ''}
+    assert server.hit_count_map['coinbase'] == SymbolClient.COINBASE_PAGE_COUNT
+
+def test_failing_source_is_marked_unknown(server, client):
+    server.status_map['okex'] = 500
+
+    res, rows = download(client)
+
+    assert res.status_code == 200
+    assert res.headers['X-Unavailable-Sources'] == 'okex'
+    assert all(row['okex'] == '?' for row in rows)
+    assert rows[0]['binance'] == 'yes'
+    # failed requests are sent once
+    assert server.hit_count_map['okex'] == 1
+
+def test_slow_source_is_given_up_after_source_timeout(monkeypatch, server, client):
+    monkeypatch.setattr(experiment, 'EXCHANGE_INSIGHT_SOURCE_TIMEOUT', 1)
+    monkeypatch.setitem(SymbolClient.REQUEST_OPTIONS, 'timeout', 1)
+    server.delay_map['huobi'] = 3
+
+    start_time = time.time()
+    res, rows = download(client)
+
+    assert time.time() - start_time < 3
+    assert res.status_code == 200
+    assert res.headers['X-Unavailable-Sources'] == 'huobi'
+    assert all(row['huobi'] == '?' for row in rows)
+    assert rows[0]['ftx'] == 'yes'
+
+def test_partial_snapshot_is_cached_for_partial_cache_ttl(server, client, clock):
+    server.status_map['okex'] = 500
+
+    download(client)
+    clock.now += experiment.EXCHANGE_INSIGHT_PARTIAL_CACHE_TTL - 1
+    res, _ = download(client)
+
+    assert res.headers['X-Unavailable-Sources'] == 'okex'
+    assert server.hit_count_map['top'] == 1
+
+    server.status_map.pop('okex')
+    clock.now += 2
+    res, rows = download(client)
+
+    assert res.headers['X-Unavailable-Sources'] == ''
+    assert rows[0]['okex'] == 'yes'
+    assert server.hit_count_map['top'] == 2
+
+def test_complete_snapshot_is_cached_for_cache_ttl(server, client, clock):
+    download(client)
+    clock.now += experiment.EXCHANGE_INSIGHT_CACHE_TTL - 1
+    download(client)
+
+    assert server.hit_count_map['top'] == 1
+
+    clock.now += 2
+    download(client)
+
+    assert server.hit_count_map['top'] == 2
+
+def test_missing_top_symbols_is_bad_gateway_and_not_cached(server, client):
+    server.status_map['top'] = 500
+
+    res, _ = download(client)
+
+    assert res.status_code == 502
+    assert res.json() == {'detail': 'Failed to fetch top volume symbols'}
+
+    server.status_map.pop('top')
+    res, _ = download(client)
+
+    assert res.status_code == 200
+    assert server.hit_count_map['top'] == 2